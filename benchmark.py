@@ -0,0 +1,345 @@
+# benchmark.py
+"""Headless benchmark of the single-threaded and multithreaded recognition
+pipelines on identical input.
+
+Every configuration runs in its own fresh process so CPU seconds and peak
+RSS are measured per configuration, and so the "single" configuration can
+import the single app's own modules (which share names with the multiple
+app's).  Frames are decoded or generated as they are offered, never held
+all at once.  Results are written as JSON:
+
+    python benchmark.py --video clip.mp4 --feeds 4 --workers 1 2 4 --output bench.json
+    python benchmark.py --synthetic 200 --pace max
+"""
+import argparse
+import glob
+import json
+import multiprocessing as mp
+import os
+import platform
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BASE_DIR, "multiple"))
+
+from frame_queue import FrameQueue, POLICIES, DROP_NEW, QUEUE_ALL
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+import psutil
+
+
+def video_frames(cap, max_frames):
+    try:
+        for _ in range(max_frames):
+            ret, frame = cap.read()
+            if not ret:
+                return
+            yield frame
+    finally:
+        cap.release()
+
+
+def synthetic_frames(count, width, height, face_dir, seed=0):
+    """Yield frames with reference face images pasted at random positions,
+    so detection has real faces to find.  Deterministic for a given seed."""
+    rng = np.random.default_rng(seed)
+    faces = []
+    for path in sorted(glob.glob(os.path.join(face_dir, "*.jpg"))):
+        img = cv2.imread(path)
+        if img is not None:
+            scale = min(1.0, (height / 3) / img.shape[0], (width / 3) / img.shape[1])
+            faces.append(cv2.resize(img, None, fx=scale, fy=scale))
+
+    for _ in range(count):
+        frame = np.full((height, width, 3), 90, dtype=np.uint8)
+        chosen = rng.choice(len(faces), size=min(3, len(faces)), replace=False) if faces else []
+        for k in chosen:
+            face = faces[k]
+            h, w = face.shape[:2]
+            y = int(rng.integers(0, height - h + 1))
+            x = int(rng.integers(0, width - w + 1))
+            frame[y:y + h, x:x + w] = face
+        yield frame
+
+
+def open_input(config):
+    """(frames, fps) for the configured input, where frames is an iterator
+    producing each frame as it is needed; every call starts from the
+    first frame"""
+    if config["video"]:
+        cap = cv2.VideoCapture(config["video"])
+        if not cap.isOpened():
+            raise IOError(f"Could not open video file: {config['video']}")
+        return video_frames(cap, config["max_frames"]), cap.get(cv2.CAP_PROP_FPS) or 30
+    return synthetic_frames(config["synthetic"], config["width"], config["height"],
+                            config["face_dir"], config["seed"]), 30.0
+
+
+def load_pipeline(config):
+    """The per-frame recognition call of the benchmarked app, matching
+    against the known faces in config["db"]: single/face_tracking.py's
+    detection, matching and drawing for "single" (which has no detection
+    scale), multiple/recognition.py's recognize_frame otherwise"""
+    if config["mode"] == "single":
+        sys.path.insert(0, os.path.join(BASE_DIR, "single"))
+        from gallery import GalleryStore
+        from face_tracking import detect_faces, draw_detections
+
+        store = GalleryStore(config["db"])
+        store.refresh()
+        matcher = store.matcher()
+        store.close()
+
+        def process(frame):
+            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            draw_detections(rgb, detect_faces(rgb, matcher))
+        return process
+
+    from gallery import GalleryMatcher, load_known_faces
+    from recognition import recognize_frame
+
+    encodings, names = load_known_faces(config["db"])
+    matcher = GalleryMatcher(encodings, names)
+    return lambda frame: recognize_frame(frame, matcher, config["scale"])
+
+
+def timed(process, frame):
+    """Seconds process(frame) took, or None if it raised"""
+    t0 = time.perf_counter()
+    try:
+        process(frame)
+    except Exception:
+        traceback.print_exc()
+        return None
+    return time.perf_counter() - t0
+
+
+def run_single(frames, fps, process, config):
+    """What single/face_tracking.py's update_frame does: every frame of every
+    feed processed in turn on one thread, nothing dropped.  Returns
+    ([(queue wait, processing seconds)], dropped, offered, errors); frames
+    are processed as soon as they are read, so they never wait."""
+    timings = []
+    offered = errors = 0
+    start = time.perf_counter()
+    for i, frame in enumerate(frames):
+        for _ in range(config["feeds"]):
+            seconds = timed(process, frame)
+            if seconds is None:
+                errors += 1
+            else:
+                timings.append((0.0, seconds))
+            offered += 1
+        if config["pace"] == "realtime":
+            delay = start + (i + 1) / fps - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    return timings, 0, offered, errors
+
+
+def run_threads(frames, fps, process, config):
+    """What the multithreaded tab does: feeds submit frames to a bounded
+    FrameQueue drained by a fixed set of worker threads.  Returns the same
+    as run_single, the queue wait being the time from submission until a
+    worker takes the frame."""
+    feeds = config["feeds"]
+    queue = FrameQueue(feeds, config["capacity"])
+    for index in range(feeds):
+        queue.set_policy(index, config["policy"])
+
+    timings = []
+    errors = 0
+    lock = threading.Lock()
+
+    def work():
+        nonlocal errors
+        while True:
+            item = queue.get()
+            if item is None:
+                return
+            _, _, frame, queued_at = item
+            waited = time.time() - queued_at
+            seconds = timed(process, frame)
+            with lock:
+                if seconds is None:
+                    errors += 1
+                else:
+                    timings.append((waited, seconds))
+
+    workers = [threading.Thread(target=work, daemon=True) for _ in range(config["workers"])]
+    for worker in workers:
+        worker.start()
+
+    start = time.perf_counter()
+    submitted = 0
+    for i, frame in enumerate(frames):
+        for index in range(feeds):
+            # A "queue every frame" feed stops reading until there is room
+            while config["policy"] == QUEUE_ALL and queue.is_full(index):
+                time.sleep(0.001)
+            queue.put(index, i + 1, frame)
+            submitted += 1
+        if config["pace"] == "realtime":
+            delay = start + (i + 1) / fps - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    dropped = sum(queue.dropped)
+    while any(worker.is_alive() for worker in workers):
+        with lock:
+            if len(timings) + errors >= submitted - dropped:
+                break
+        time.sleep(0.005)
+    queue.close()
+    for worker in workers:
+        worker.join()
+    return timings, dropped, submitted, errors
+
+
+def cpu_seconds():
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+    times = psutil.Process().cpu_times()
+    return times.user + times.system
+
+
+def peak_rss_mb():
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+        return peak / (1024 ** 2) if sys.platform == "darwin" else peak / 1024
+    info = psutil.Process().memory_info()
+    return getattr(info, "peak_wset", info.rss) / (1024 ** 2)
+
+
+def millisecond_stats(seconds):
+    ms = np.asarray(seconds) * 1000
+    return {
+        "mean": float(ms.mean()) if len(ms) else None,
+        "p50": float(np.percentile(ms, 50)) if len(ms) else None,
+        "p95": float(np.percentile(ms, 95)) if len(ms) else None,
+        "p99": float(np.percentile(ms, 99)) if len(ms) else None,
+    }
+
+
+def run_config(config):
+    """Run one configuration; called in a fresh process"""
+    process = load_pipeline(config)
+
+    # Keep one-off model and allocator warm-up out of the measurement
+    warmup, _ = open_input(config)
+    for _, frame in zip(range(config["warmup"]), warmup):
+        process(frame)
+    warmup.close()
+
+    frames, fps = open_input(config)
+    cpu_start = cpu_seconds()
+    wall_start = time.perf_counter()
+    if config["mode"] == "single":
+        timings, dropped, offered, errors = run_single(frames, fps, process, config)
+    else:
+        timings, dropped, offered, errors = run_threads(frames, fps, process, config)
+    wall = time.perf_counter() - wall_start
+    cpu = cpu_seconds() - cpu_start
+
+    waits, processing = np.asarray(timings, dtype=np.float64).reshape(-1, 2).T
+    return {
+        "config": config,
+        "frames_offered": offered,
+        "frames_processed": len(timings),
+        "dropped_frames": dropped,
+        "errors": errors,
+        "wall_seconds": wall,
+        "throughput_fps": len(timings) / wall if wall > 0 else 0.0,
+        # From the frame being offered to its result; the sum of the two below
+        "latency_ms": millisecond_stats(waits + processing),
+        "queue_wait_ms": millisecond_stats(waits),
+        "processing_ms": millisecond_stats(processing),
+        "cpu_seconds": cpu,
+        "cpu_cores_used": cpu / wall if wall > 0 else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def build_configs(args):
+    base = {
+        "video": args.video, "max_frames": args.max_frames, "synthetic": args.synthetic,
+        "width": args.width, "height": args.height, "seed": args.seed,
+        "face_dir": args.face_dir, "db": args.db, "feeds": args.feeds, "scale": args.scale,
+        "pace": args.pace, "warmup": args.warmup,
+    }
+    configs = [dict(base, name="single", mode="single")]
+    for workers in args.workers:
+        configs.append(dict(base, name=f"multiple-{workers}w", mode="threads", workers=workers,
+                            policy=args.policy, capacity=args.capacity))
+    return configs
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark single vs multithreaded face recognition")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--video", help="recorded video to replay")
+    source.add_argument("--synthetic", type=int, default=100,
+                        help="number of synthetic frames when no --video is given (default 100)")
+    parser.add_argument("--max-frames", type=int, default=300, help="frames read from --video")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--face-dir", default=os.path.join(BASE_DIR, "multiple", "reference_images"),
+                        help="face images pasted into synthetic frames")
+    parser.add_argument("--db", default=os.path.join(BASE_DIR, "multiple", "faces.db"))
+    parser.add_argument("--feeds", type=int, default=1, help="simultaneous copies of the input")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4],
+                        help="worker counts for the multithreaded configurations")
+    parser.add_argument("--policy", choices=POLICIES, default=DROP_NEW)
+    parser.add_argument("--capacity", type=int, default=2, help="queued frames per feed")
+    parser.add_argument("--pace", choices=["realtime", "max"], default="realtime",
+                        help="offer frames at the source frame rate or as fast as possible")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="detection scale of the multithreaded configurations")
+    parser.add_argument("--warmup", type=int, default=2, help="untimed frames before measuring")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = []
+    for config in build_configs(args):
+        print(f"Running {config['name']}...", file=sys.stderr)
+        with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn")) as executor:
+            results.append(executor.submit(run_config, config).result())
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+# batch_extract.py
+"""Batch face extraction: a queue of videos shared by a pool of worker
+processes, each extracting one whole video at a time.
+
+    python -m batch_extract recordings/ --output-dir extracted --concurrency 4
+
+Every video gets its own crop folder under the output directory.  The
+queue is saved there as batch.json whenever a video finishes, so running
+the same batch again (same output directory and settings) picks up where
+an interrupted run left off.  Videos cut short are extracted again from
+the start.
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import queue
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from crop_writer import CROP_FORMATS
+from extraction import extract_video, init_chunk_worker
+
+BATCH_FILE = "batch.json"
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv")
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+
+def list_videos(paths):
+    """Video files among `paths`, with directories expanded (not recursively)"""
+    videos = []
+    for path in paths:
+        if os.path.isdir(path):
+            videos.extend(os.path.join(path, fname) for fname in sorted(os.listdir(path))
+                          if fname.lower().endswith(VIDEO_EXTENSIONS))
+        else:
+            videos.append(path)
+    return [os.path.abspath(video) for video in videos]
+
+
+def frame_count(video_path):
+    cap = cv2.VideoCapture(video_path)
+    frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.isOpened() else 0
+    cap.release()
+    return max(0, frames)
+
+
+def plan_jobs(videos, output_root):
+    """One job per video, each with a crop folder named after the video"""
+    jobs = []
+    used = set()
+    for video in videos:
+        stem = os.path.splitext(os.path.basename(video))[0]
+        folder, n = stem, 2
+        while folder in used:
+            folder, n = f"{stem}_{n}", n + 1
+        used.add(folder)
+        jobs.append({"video": video, "output": os.path.join(output_root, folder),
+                     "status": PENDING, "frames": frame_count(video), "faces": 0, "error": None})
+    return jobs
+
+
+def read_batch(output_root):
+    """(settings, jobs) saved in output_root, or (None, []) without a batch"""
+    try:
+        with open(os.path.join(output_root, BATCH_FILE)) as f:
+            state = json.load(f)
+        return state["settings"], state["jobs"]
+    except (OSError, ValueError, KeyError):
+        return None, []
+
+
+def save_batch(output_root, settings, jobs):
+    os.makedirs(output_root, exist_ok=True)
+    path = os.path.join(output_root, BATCH_FILE)
+    # Written whole and swapped in, so an interrupted save keeps the old state
+    with open(path + ".tmp", "w") as f:
+        json.dump({"settings": settings, "jobs": jobs}, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def load_batch(videos, output_root, settings):
+    """Jobs for `videos`, keeping the results of an earlier run of the same
+    batch.  Videos already done are not extracted again unless the
+    extraction settings changed."""
+    jobs = plan_jobs(videos, output_root)
+    saved_settings, saved_jobs = read_batch(output_root)
+    if saved_settings == settings:
+        saved = {job["video"]: job for job in saved_jobs}
+        for job in jobs:
+            previous = saved.get(job["video"])
+            if previous is not None and previous["status"] == DONE and previous["output"] == job["output"]:
+                job.update(status=DONE, faces=previous["faces"])
+    return jobs
+
+
+class BatchProgress:
+    """Aggregate progress over the videos still to extract"""
+
+    def __init__(self, jobs):
+        self.total_frames = sum(job["frames"] for job in jobs)
+        self.frames = 0  # video frames covered, sampled or not
+        self.faces = 0
+        self.started = time.perf_counter()
+
+    def add(self, frames, faces):
+        self.frames += frames
+        self.faces += faces
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def frames_per_second(self):
+        elapsed = self.elapsed()
+        return self.frames / elapsed if elapsed > 0 else 0.0
+
+    def faces_per_second(self):
+        elapsed = self.elapsed()
+        return self.faces / elapsed if elapsed > 0 else 0.0
+
+    def percent(self):
+        if not self.total_frames:
+            return 0
+        return min(100, int(self.frames / self.total_frames * 100))
+
+    def describe(self):
+        return f"{self.frames_per_second():.1f} frames/s, {self.faces_per_second():.1f} faces/s"
+
+
+def run_batch(jobs, output_root, settings, concurrency=1, on_progress=None, on_job=None,
+              should_stop=None):
+    """Extract every job that is not done yet, `concurrency` videos at a time.
+
+    on_progress(BatchProgress) is called as frames are covered, on_job(job)
+    whenever a video finishes or fails, and the batch stops early (leaving
+    unfinished jobs pending) once should_stop() returns True.  The queue is
+    saved after every finished job.  Returns the BatchProgress.
+    """
+    todo = [job for job in jobs if job["status"] != DONE]
+    progress = BatchProgress(todo)
+    save_batch(output_root, settings, jobs)
+    if not todo:
+        return progress
+
+    ctx = mp.get_context("spawn")
+    updates = ctx.Queue()
+    stop = ctx.Event()
+    pool = ProcessPoolExecutor(max(1, min(concurrency, len(todo))), mp_context=ctx,
+                               initializer=init_chunk_worker, initargs=(updates, stop))
+    try:
+        running = {pool.submit(extract_video, job["video"], job["output"], settings["interval"],
+                               settings["interval_seconds"], settings["margin"],
+                               settings["manifest"], settings["crop_format"],
+                               settings["quality"], settings["dedup_window"],
+                               settings["best_shots"], settings["min_quality"]): job
+                   for job in todo}
+        while running:
+            if should_stop is not None and should_stop():
+                stop.set()
+                break
+            try:
+                _, frames, faces = updates.get(timeout=0.2)
+            except queue.Empty:
+                pass
+            else:
+                progress.add(frames, faces)
+                if on_progress is not None:
+                    on_progress(progress)
+
+            for future in [future for future in running if future.done()]:
+                job = running.pop(future)
+                try:
+                    job["faces"], complete = future.result()
+                    job.update(status=DONE if complete else PENDING, error=None)
+                except Exception as e:
+                    job.update(status=FAILED, error=str(e))
+                save_batch(output_root, settings, jobs)
+                if on_job is not None:
+                    on_job(job)
+        # Updates sent just before the last video finished
+        while True:
+            try:
+                _, frames, faces = updates.get(timeout=0.05)
+            except queue.Empty:
+                break
+            progress.add(frames, faces)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+    return progress
+
+
+def batch_settings(interval=10, interval_seconds=None, margin=0.0, manifest=False,
+                   crop_format="jpg", quality=95, dedup_window=None, best_shots=0, min_quality=None):
+    return {"interval": interval, "interval_seconds": interval_seconds, "margin": margin,
+            "manifest": manifest, "crop_format": crop_format, "quality": quality,
+            "dedup_window": dedup_window, "best_shots": best_shots, "min_quality": min_quality}
+
+
+def quality_thresholds(args):
+    """QualityCheck arguments from the command line, None without any"""
+    thresholds = {}
+    if args.min_size is not None:
+        thresholds["min_size"] = args.min_size
+    if args.min_sharpness is not None:
+        thresholds["min_sharpness"] = args.min_sharpness
+    if args.min_frontal is not None:
+        thresholds["min_frontal"] = args.min_frontal
+    if args.brightness is not None:
+        thresholds["min_brightness"], thresholds["max_brightness"] = args.brightness
+    return thresholds or None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Extract face crops from many videos")
+    parser.add_argument("videos", nargs="+", help="video files or folders of videos")
+    parser.add_argument("--output-dir", default="extracted", help="one crop folder per video is made here")
+    parser.add_argument("--interval", type=int, default=10, help="extract every N frames")
+    parser.add_argument("--seconds", type=float, help="extract every N seconds instead")
+    parser.add_argument("--margin", type=float, default=0.0, help="crop margin as a fraction of the face box")
+    parser.add_argument("--manifest", action="store_true", help="also save landmarks and encodings per crop")
+    parser.add_argument("--format", choices=CROP_FORMATS, default="jpg",
+                        help="crop files, or tar/npz for one archive per video (default: jpg)")
+    parser.add_argument("--quality", type=int, default=95, help="JPEG/WebP quality (default: 95)")
+    parser.add_argument("--dedup-window", type=float, metavar="SECONDS",
+                        help="keep only the best crops of each face track per window")
+    parser.add_argument("--best-shots", type=int, default=0, metavar="K",
+                        help="keep the K highest-quality crops per face track (per window with --dedup-window)")
+    parser.add_argument("--min-size", type=int, help="skip faces smaller than this many pixels")
+    parser.add_argument("--min-sharpness", type=float, help="skip crops below this Laplacian variance")
+    parser.add_argument("--min-frontal", type=float, help="skip faces turned further than this (0-1, 1 = frontal)")
+    parser.add_argument("--brightness", type=float, nargs=2, metavar=("MIN", "MAX"),
+                        help="skip crops whose mean brightness is outside MIN-MAX (0-255)")
+    parser.add_argument("--concurrency", type=int, default=os.cpu_count() or 1,
+                        help="videos extracted at the same time")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    settings = batch_settings(args.interval, args.seconds, args.margin, args.manifest,
+                              args.format, args.quality, args.dedup_window, args.best_shots,
+                              quality_thresholds(args))
+    jobs = load_batch(list_videos(args.videos), args.output_dir, settings)
+    skipped = sum(job["status"] == DONE for job in jobs)
+    if skipped:
+        print(f"Resuming: {skipped} of {len(jobs)} videos already extracted", file=sys.stderr)
+
+    def report(job):
+        detail = f"{job['faces']} faces" if job["status"] == DONE else job["error"] or job["status"]
+        print(f"{job['video']}: {detail}", file=sys.stderr)
+
+    progress = run_batch(jobs, args.output_dir, settings, args.concurrency, on_job=report)
+    failed = sum(job["status"] == FAILED for job in jobs)
+    print(f"{progress.frames} frames, {progress.faces} faces in {progress.elapsed():.1f}s "
+          f"({progress.describe()}), {failed} failed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import threading
+import time
+
+import cv2
+
+from pacing import FramePacer, REALTIME
+
+
+class CaptureThread(threading.Thread):
+    """Decodes one video feed on its own thread into a small ring buffer of
+    preallocated frames, so the GUI thread never calls cap.read().
+
+    By default the consumer only ever gets the newest decoded frame and
+    older unread ones are counted as skipped.  In lossless mode the decoder
+    waits for the consumer instead, and frames are handed out in order.
+
+    Decoding is scheduled by a FramePacer.  In realtime mode frames the
+    decoder itself is too late for are grabbed without decoding, unless the
+    capture is lossless.
+    """
+
+    def __init__(self, source, slots=3, lossless=False, pacing=REALTIME):
+        super().__init__(daemon=True)
+        self.cap = cv2.VideoCapture(source)
+        self.pacer = FramePacer(self.cap.get(cv2.CAP_PROP_FPS), pacing)
+        self.fps = self.pacer.source_fps
+        self.slots = [None] * max(2, slots)
+        self.lossless = lossless
+
+        self.latest_seq = 0    # newest decoded frame
+        self.consumed_seq = 0  # newest frame handed to the consumer
+        self.frames_skipped = 0
+        self.decode_seconds = 0.0
+        self.finished = False
+        self._stopping = False
+        self._cond = threading.Condition()
+
+    def is_opened(self):
+        return self.cap.isOpened()
+
+    def set_lossless(self, lossless):
+        with self._cond:
+            self.lossless = lossless
+            self._cond.notify_all()
+
+    def set_pacing(self, mode):
+        with self._cond:
+            self.pacer.set_mode(mode)
+            self._cond.notify_all()
+
+    def run(self):
+        self.pacer.start()
+        while True:
+            with self._cond:
+                # Never overwrite a frame a lossless consumer has not taken yet
+                while (self.lossless and not self._stopping
+                       and self.latest_seq - self.consumed_seq >= len(self.slots) - 1):
+                    self._cond.wait()
+                if self._stopping:
+                    break
+                # Decode at the source frame rate rather than racing through files
+                delay = self.pacer.wait_seconds()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                skip = 0 if self.lossless else self.pacer.frames_to_skip()
+            seq = self.latest_seq + 1
+            slot = seq % len(self.slots)
+
+            decode_start = time.perf_counter()
+            ret = all(self.cap.grab() for _ in range(skip))
+            if ret:
+                if self.slots[slot] is None:
+                    ret, frame = self.cap.read()
+                else:
+                    ret, frame = self.cap.read(self.slots[slot])
+            decode_time = time.perf_counter() - decode_start
+            if not ret:
+                break
+
+            with self._cond:
+                self.pacer.frame_read(skip)
+                self.slots[slot] = frame
+                self.latest_seq = seq
+                self.frames_skipped += skip
+                self.decode_seconds += decode_time
+                self._cond.notify_all()
+
+        self.cap.release()
+        with self._cond:
+            self.finished = True
+            self._cond.notify_all()
+
+    def next_frame(self):
+        """Return (seq, frame copy) for the next frame to process, or None
+        if nothing new has been decoded"""
+        with self._cond:
+            if self.latest_seq == self.consumed_seq:
+                return None
+            if self.lossless:
+                seq = self.consumed_seq + 1
+            else:
+                seq = self.latest_seq
+                self.frames_skipped += seq - self.consumed_seq - 1
+            frame = self.slots[seq % len(self.slots)].copy()
+            self.consumed_seq = seq
+            self._cond.notify_all()
+            return seq, frame
+
+    def ended(self):
+        """True once the source is exhausted and every frame was handed out"""
+        with self._cond:
+            return self.finished and self.latest_seq == self.consumed_seq
+
+    def average_decode_ms(self):
+        with self._cond:
+            return self.decode_seconds / self.latest_seq * 1000 if self.latest_seq else 0.0
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self.is_alive():
+            self.join()
@@ -0,0 +1,178 @@
+import io
+import os
+import queue
+import tarfile
+import threading
+import time
+import zipfile
+
+import cv2
+import numpy as np
+
+# jpg/png/webp/npy write one file per crop; tar packs JPEG crops and npz
+# packs raw arrays into a single crops.tar / crops.npz per output folder
+IMAGE_FORMATS = ("jpg", "png", "webp", "npy")
+ARCHIVE_FORMATS = ("tar", "npz")
+CROP_FORMATS = IMAGE_FORMATS + ARCHIVE_FORMATS
+ARCHIVE_NAME = "crops"
+WRITE_QUEUE_SIZE = 64  # crops waiting to be written before put() blocks
+
+
+def member_format(crop_format):
+    """How each crop is encoded inside the given format"""
+    return {"tar": "jpg", "npz": "npy"}.get(crop_format, crop_format)
+
+
+def encode_crop(crop, crop_format="jpg", quality=95):
+    """Encoded bytes of one BGR crop"""
+    crop_format = member_format(crop_format)
+    if crop_format == "npy":
+        buffer = io.BytesIO()
+        np.save(buffer, crop)
+        return buffer.getvalue()
+    if crop_format == "jpg":
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+    elif crop_format == "webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, quality]
+    elif crop_format == "png":
+        params = []
+    else:
+        raise ValueError(f"Unknown crop format: {crop_format}")
+    ok, data = cv2.imencode("." + crop_format, crop, params)
+    if not ok:
+        raise IOError(f"Could not encode crop as {crop_format}")
+    return data.tobytes()
+
+
+def unpack_archives(folder):
+    """Write the crops of a crops.tar / crops.npz in folder out as one file
+    each and remove the archive, so registration can read and remove them
+    one by one.  Returns the number of crops unpacked."""
+    count = 0
+    for crop_format in ARCHIVE_FORMATS:
+        path = os.path.join(folder, f"{ARCHIVE_NAME}.{crop_format}")
+        if not os.path.exists(path):
+            continue
+        if crop_format == "tar":
+            with tarfile.open(path) as archive:
+                for member in archive:
+                    if member.isfile():
+                        _unpack_member(folder, member.name, archive.extractfile(member).read())
+                        count += 1
+        else:
+            with zipfile.ZipFile(path) as archive:
+                for name in archive.namelist():
+                    _unpack_member(folder, name, archive.read(name))
+                    count += 1
+        # Only once every crop is out; an interrupted unpack starts over
+        os.remove(path)
+    return count
+
+
+def _unpack_member(folder, name, data):
+    # The base name only, so a member can never land outside the folder
+    with open(os.path.join(folder, os.path.basename(name)), "wb") as f:
+        f.write(data)
+
+
+class CropWriter:
+    """Encodes and writes crops on a background thread.
+
+    put() only queues the crop, so detection does not wait on compression
+    or on slow (e.g. network-mounted) output folders; it blocks once
+    `capacity` crops are waiting.  A write error is raised from the next
+    put() or from close().
+    """
+
+    def __init__(self, output_dir, crop_format="jpg", quality=95, capacity=WRITE_QUEUE_SIZE):
+        if crop_format not in CROP_FORMATS:
+            raise ValueError(f"Unknown crop format: {crop_format}")
+        self.output_dir = output_dir
+        self.crop_format = crop_format
+        self.quality = quality
+        self.written = 0
+        self._queue = queue.Queue(capacity)
+        self._error = None
+        self._archive = None
+        if crop_format == "tar":
+            self._archive = tarfile.open(self.archive_path(), "w")
+        elif crop_format == "npz":
+            # Stored uncompressed, like np.savez, so np.load can map members
+            self._archive = zipfile.ZipFile(self.archive_path(), "w", zipfile.ZIP_STORED, allowZip64=True)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def archive_path(self):
+        return os.path.join(self.output_dir, f"{ARCHIVE_NAME}.{self.crop_format}")
+
+    def crop_name(self, face_id):
+        """File (or archive member) name of a crop"""
+        return f"face_{face_id}.{member_format(self.crop_format)}"
+
+    def put(self, fname, crop):
+        self._check()
+        self._queue.put((fname, crop, None))
+
+    def put_file(self, path, fname):
+        """Move a crop already encoded with member_format() into place"""
+        self._check()
+        self._queue.put((fname, None, path))
+
+    def close(self):
+        """Write everything queued, then close the archive"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+            if self._archive is not None:
+                self._archive.close()
+        self._check()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _check(self):
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is not None:
+                continue  # keep draining so put() never blocks forever
+            fname, crop, path = item
+            try:
+                if path is not None:
+                    self._store_file(path, fname)
+                else:
+                    self._store(fname, encode_crop(crop, self.crop_format, self.quality))
+                self.written += 1
+            except Exception as e:
+                self._error = e
+
+    def _store(self, fname, data):
+        if self.crop_format == "tar":
+            info = tarfile.TarInfo(fname)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            self._archive.addfile(info, io.BytesIO(data))
+        elif self.crop_format == "npz":
+            self._archive.writestr(fname, data)
+        else:
+            with open(os.path.join(self.output_dir, fname), "wb") as f:
+                f.write(data)
+
+    def _store_file(self, path, fname):
+        if self.crop_format == "tar":
+            self._archive.add(path, arcname=fname)
+            os.remove(path)
+        elif self.crop_format == "npz":
+            self._archive.write(path, arcname=fname)
+            os.remove(path)
+        else:
+            os.replace(path, os.path.join(self.output_dir, fname))
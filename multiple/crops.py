@@ -0,0 +1,93 @@
+import json
+import os
+
+# Written next to the crops by ExtractionWorker so registration knows how
+# each crop relates to the detected face box
+CROP_INFO_FILE = "extraction.json"
+# Optional per-crop records: source frame, timestamp, boxes, landmarks and
+# the encoding computed at extraction, one JSON object per line
+MANIFEST_FILE = "manifest.jsonl"
+CROP_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".npy")
+
+
+def expand_box(box, margin, height, width):
+    """Grow a (top, right, bottom, left) box by `margin` of its size on
+    every side, clamped to the frame"""
+    top, right, bottom, left = box
+    pad_y = int(round((bottom - top) * margin))
+    pad_x = int(round((right - left) * margin))
+    return (max(0, top - pad_y), min(width, right + pad_x),
+            min(height, bottom + pad_y), max(0, left - pad_x))
+
+
+def crop_face_box(height, width, margin=0.0):
+    """The face box inside a crop saved with `margin`, as a
+    (top, right, bottom, left) location for face_recognition"""
+    pad_y = int(round(height * margin / (1 + 2 * margin)))
+    pad_x = int(round(width * margin / (1 + 2 * margin)))
+    return (pad_y, width - pad_x, height - pad_y, pad_x)
+
+
+def manifest_face_box(record):
+    """The face box inside the crop of a manifest record, or None when the
+    record lacks the boxes.  Exact even for crops clamped at the frame
+    edge, where the margin around the face is uneven."""
+    try:
+        top, right, bottom, left = record["box"]
+        crop_top, _, _, crop_left = record["crop_box"]
+    except (KeyError, TypeError, ValueError):
+        return None
+    return (top - crop_top, right - crop_left, bottom - crop_top, left - crop_left)
+
+
+def write_crop_info(folder, **info):
+    with open(os.path.join(folder, CROP_INFO_FILE), "w") as f:
+        json.dump(info, f)
+
+
+def read_crop_info(folder):
+    """Settings recorded at extraction, or {} for crops from elsewhere"""
+    try:
+        with open(os.path.join(folder, CROP_INFO_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def manifest_record(fname, face_id, frame_index, timestamp, box, crop_box, landmarks, encoding,
+                    quality=None):
+    record = {
+        "file": fname,
+        "face_id": face_id,
+        "frame": frame_index,
+        "timestamp": timestamp,
+        "box": list(box),
+        "crop_box": list(crop_box),
+        "landmarks": {part: [list(point) for point in points] for part, points in landmarks.items()},
+        "encoding": [float(x) for x in encoding],
+    }
+    if quality is not None:
+        record["quality"] = quality
+    return record
+
+
+def read_manifest(folder):
+    """{crop file name: record} from the folder's manifest, {} without one.
+    A line cut short by an interrupted extraction is skipped."""
+    records = {}
+    try:
+        with open(os.path.join(folder, MANIFEST_FILE)) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                records[record["file"]] = record
+    except OSError:
+        pass
+    return records
+
+
+def list_crops(folder):
+    return [fname for fname in os.listdir(folder)
+            if fname.lower().endswith(CROP_EXTENSIONS)]
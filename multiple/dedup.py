@@ -0,0 +1,155 @@
+import cv2
+import numpy as np
+
+from quality import sharpness
+from recognition import box_iou
+
+DEDUP_WINDOW = 5.0  # seconds; each face track keeps its best crops per window
+
+
+def face_score(face):
+    """Quality score of an extract_frame() face, or its sharpness when
+    quality was not computed"""
+    quality = face[5]
+    return quality["score"] if quality is not None else sharpness(face[2])
+
+
+def crop_hash(face):
+    """Difference hash of an extract_frame() face's crop"""
+    return dhash(face[2])
+
+
+def dhash(crop, size=8):
+    """64-bit difference hash of a crop"""
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def hash_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+def detach_crop(face):
+    """The face with its crop copied out of the frame it was cut from, so a
+    held crop does not keep the whole frame alive"""
+    crop = face[2]
+    if isinstance(crop, np.ndarray) and crop.base is not None:
+        return face[:2] + (crop.copy(),) + face[3:]
+    return face
+
+
+class KeepAll:
+    """Selector that keeps every crop, with the CropDeduplicator interface"""
+
+    def add(self, frame_id, timestamp, faces):
+        return [(frame_id, face) for face in faces]
+
+    def flush(self):
+        return []
+
+
+class CropDeduplicator:
+    """Keeps the `keep` best crops per face track per time window.
+
+    faces are extract_frame() tuples (box, crop_box, crop, landmarks,
+    encoding, quality).  A face continues the track whose last box it
+    overlaps most (greedy IoU, as in TrackCache) if it also looks the
+    same: encodings within max_encoding_distance when both were computed,
+    otherwise difference hashes within max_hash_distance bits.  Each track
+    holds the highest-scoring crops of its current window (the whole track
+    when window is None); they are released in frame order when a face
+    arrives after the window, when the track is lost for more than
+    max_missed samples, or on flush().  score and face_hash compute a
+    face's score and difference hash, for faces that carry them precomputed.
+    """
+
+    def __init__(self, window=DEDUP_WINDOW, keep=1, min_iou=0.3, max_hash_distance=12,
+                 max_encoding_distance=0.4, max_missed=2, score=face_score, face_hash=crop_hash):
+        self.window = window
+        self.keep = keep
+        self.min_iou = min_iou
+        self.max_hash_distance = max_hash_distance
+        self.max_encoding_distance = max_encoding_distance
+        self.max_missed = max_missed
+        self.score = score
+        self.face_hash = face_hash
+        self.tracks = {}
+        self.seen = 0
+        self.kept = 0
+        self._sample = 0
+        self._next_id = 1
+
+    def _same_face(self, track, face, face_hash):
+        encoding = face[4]
+        if encoding is not None and track["encoding"] is not None:
+            distance = np.linalg.norm(np.asarray(encoding) - np.asarray(track["encoding"]))
+            return distance <= self.max_encoding_distance
+        return hash_distance(face_hash, track["hash"]) <= self.max_hash_distance
+
+    def add(self, frame_id, timestamp, faces):
+        """Feed one sampled frame; returns the [(frame_id, face)] released"""
+        self._sample += 1
+        self.seen += len(faces)
+        released = []
+        hashes = [self.face_hash(face) for face in faces]
+
+        pairs = sorted(((box_iou(face[0], track["box"]), i, track_id)
+                        for i, face in enumerate(faces)
+                        for track_id, track in self.tracks.items()), reverse=True)
+        matched = [None] * len(faces)
+        taken = set()
+        for iou, i, track_id in pairs:
+            if iou < self.min_iou:
+                break
+            if matched[i] is None and track_id not in taken \
+                    and self._same_face(self.tracks[track_id], faces[i], hashes[i]):
+                matched[i] = track_id
+                taken.add(track_id)
+
+        for i, face in enumerate(faces):
+            track_id = matched[i]
+            if track_id is None:
+                track_id = self._next_id
+                self._next_id += 1
+                self.tracks[track_id] = {"best": [], "window_start": timestamp}
+            track = self.tracks[track_id]
+            track.update(box=face[0], hash=hashes[i], encoding=face[4], last_sample=self._sample)
+
+            if self.window is not None and timestamp >= track["window_start"] + self.window:
+                released.extend(self._release(track))
+                track["window_start"] = timestamp
+            # (score, order, frame_id, face); the order breaks ties by arrival
+            track["best"].append((self.score(face), -self.seen - i, frame_id, detach_crop(face)))
+            track["best"].sort(key=lambda entry: entry[:2], reverse=True)
+            del track["best"][self.keep:]
+
+        for track_id in [tid for tid, track in self.tracks.items()
+                         if self._sample - track["last_sample"] > self.max_missed]:
+            released.extend(self._release(self.tracks.pop(track_id)))
+        return released
+
+    def flush(self):
+        """Release the crops still held, e.g. at the end of the video"""
+        released = []
+        for track in self.tracks.values():
+            released.extend(self._release(track))
+        self.tracks.clear()
+        return released
+
+    def _release(self, track):
+        best = sorted(((frame_id, face) for _, _, frame_id, face in track["best"]),
+                      key=lambda entry: entry[0])
+        track["best"] = []
+        self.kept += len(best)
+        return best
+
+
+def make_selector(window=None, best_shots=0, score=face_score, face_hash=crop_hash):
+    """CropDeduplicator keeping the best_shots best crops (1 if unset) per
+    window in seconds, or per whole track without a window.  KeepAll
+    when neither is set."""
+    if not window and not best_shots:
+        return KeepAll()
+    return CropDeduplicator(window or None, max(1, best_shots), score=score, face_hash=face_hash)
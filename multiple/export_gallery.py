@@ -0,0 +1,43 @@
+# export_gallery.py
+"""Export faces.db (or its prototypes table) as a binary gallery file.
+
+faces.db stays the source of truth; the file is a snapshot stamped with
+the table's row count, highest id and gallery generation, so readers can
+tell when it is out of date.  The tracking tab memory-maps it with
+--gallery-file; export with --int8 for a tab started with --int8:
+
+    python -m export_gallery --db faces.db --output faces.gallery
+"""
+import argparse
+import sys
+import time
+
+from gallery import GalleryStore, write_gallery_file
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Write a memory-mappable snapshot of the face gallery")
+    parser.add_argument("--db", default="faces.db", help="face database (default: faces.db)")
+    parser.add_argument("--output", default="faces.gallery", help="gallery file to write")
+    parser.add_argument("--prototypes", action="store_true",
+                        help="export the prototypes table built by prototypes.py")
+    parser.add_argument("--int8", action="store_true",
+                        help="store the matrix as int8 rows with one scale per row")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    start = time.time()
+    store = GalleryStore(args.db, table="prototypes" if args.prototypes else "faces",
+                         storage="int8" if args.int8 else "float32")
+    store.refresh()
+    header = write_gallery_file(args.output, store)
+    store.close()
+    print(f"Wrote {header['rows']} encodings of {header['identities']} people to {args.output} "
+          f"in {time.time() - start:.2f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
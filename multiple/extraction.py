@@ -0,0 +1,223 @@
+import json
+import os
+import shutil
+
+import cv2
+import face_recognition
+
+from crops import expand_box, write_crop_info, manifest_record, MANIFEST_FILE
+from crop_writer import CropWriter, member_format
+from dedup import make_selector, face_score, crop_hash
+from quality import face_quality, QualityCheck
+from sampling import sample_step, iter_sampled_frames
+
+# Each process gets a few ranges so one face-dense stretch of the video
+# does not leave the other processes idle at the end
+CHUNKS_PER_PROCESS = 2
+
+# Set in each pool process by init_chunk_worker
+_progress = None
+_stop = None
+
+
+def extract_frame(frame, margin=0.0, features=False, check=None):
+    """[(box, crop_box, crop, landmarks, encoding, quality)] for the faces
+    in a BGR frame.  encoding is None unless features is set.  With a
+    QualityCheck, quality holds the crop's face_quality() and crops that
+    fail the check are left out; otherwise quality is None.  landmarks are
+    found for either."""
+    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    boxes = face_recognition.face_locations(rgb)
+    landmarks = encodings = [None] * len(boxes)
+    if (features or check is not None) and boxes:
+        # Pose is scored from the landmarks
+        landmarks = face_recognition.face_landmarks(rgb, boxes)
+
+    height, width = frame.shape[:2]
+    faces = []
+    for box, points in zip(boxes, landmarks):
+        crop_box = expand_box(box, margin, height, width)
+        top, right, bottom, left = crop_box
+        crop = frame[top:bottom, left:right]
+        scores = None
+        if check is not None:
+            scores = face_quality(crop, box, points)
+            if not check.accepts(scores):
+                continue
+        faces.append([box, crop_box, crop, points, None, scores])
+
+    if features and faces:
+        # Encoded on the full frame, where the face has its full context,
+        # and only for the crops that are kept
+        encodings = face_recognition.face_encodings(rgb, [face[0] for face in faces])
+        for face, encoding in zip(faces, encodings):
+            face[4] = encoding
+    return [tuple(face) for face in faces]
+
+
+def quality_check(min_quality=None, best_shots=0):
+    """QualityCheck for the thresholds in min_quality (a dict of its
+    arguments).  Best-shot selection needs scores even without
+    thresholds, so it gets a check that accepts everything."""
+    if min_quality is not None:
+        return QualityCheck(**min_quality)
+    return QualityCheck() if best_shots else None
+
+
+def prepare_output(output_dir, margin=0.0, write_manifest=False):
+    """Create output_dir for a fresh extraction; returns the open manifest,
+    or None when it is not written"""
+    os.makedirs(output_dir, exist_ok=True)
+    # Registration reads the margin back to locate the face without re-detecting it
+    write_crop_info(output_dir, margin=margin)
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    # Crops are renumbered from 0, so an old manifest would describe the wrong files
+    if not write_manifest:
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        return None
+    return open(manifest_path, "w")
+
+
+def write_record(manifest, fname, face_id, frame_id, fps, box, crop_box, landmarks, encoding,
+                 quality=None):
+    if manifest is not None:
+        record = manifest_record(fname, face_id, frame_id, frame_id / fps, box,
+                                 crop_box, landmarks, encoding, quality)
+        manifest.write(json.dumps(record) + "\n")
+
+
+def _stopped():
+    return _stop is not None and _stop.is_set()
+
+
+def _report(key, frames, faces=0):
+    if _progress is not None and (frames or faces):
+        _progress.put((key, frames, faces))
+
+
+def split_frames(total_frames, step, chunks):
+    """Split [0, total_frames) into up to `chunks` consecutive (start, end)
+    ranges holding about the same number of samples"""
+    samples = int(-(-total_frames // step))  # ceil, step may be fractional
+    chunks = max(1, min(chunks, samples))
+    bounds = [int(round(round(samples * i / chunks) * step)) for i in range(chunks)] + [total_frames]
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if start < end]
+
+
+def init_chunk_worker(progress, stop):
+    global _progress, _stop
+    _progress, _stop = progress, stop
+
+
+def extract_chunk(video_path, chunk_dir, start, end, step, margin=0.0, features=False,
+                  crop_format="jpg", quality=95, fps=30.0, dedup_window=None, best_shots=0,
+                  min_quality=None):
+    """Extract the faces of frames [start, end) with a capture of its own.
+
+    Every crop is written to chunk_dir, encoded as it will be stored in
+    crop_format (see CropWriter.put_file).  Returns [(frame_index, faces)]
+    for every sampled frame, in order, where faces are (box, crop_box,
+    file, landmarks, encoding, scores, hash, score): extract_frame() faces
+    with the crop replaced by its file.  With dedup_window or best_shots,
+    hash and score are the crop's dhash and face_score for a
+    CropDeduplicator (see chunk_hash and chunk_score) that the caller runs
+    over all ranges, so tracks continue across them; otherwise both are
+    None.  min_quality holds QualityCheck thresholds.  (chunk_dir, frames,
+    faces) covered are reported on the pool's progress queue, and the
+    chunk stops early once the stop event is set.
+    """
+    os.makedirs(chunk_dir, exist_ok=True)
+    cap = cv2.VideoCapture(video_path)
+    writer = CropWriter(chunk_dir, member_format(crop_format), quality)
+    select = bool(dedup_window or best_shots)
+    check = quality_check(min_quality, best_shots)
+    frames = []
+    count = 0
+
+    reported = start
+    try:
+        for frame_id, frame in iter_sampled_frames(cap, step, start, end):
+            if _stopped():
+                break
+            faces = []
+            for face in extract_frame(frame, margin, features, check):
+                box, crop_box, crop, landmarks, encoding, scores = face
+                fname = writer.crop_name(count)
+                writer.put(fname, crop)
+                count += 1
+                faces.append((box, crop_box, os.path.join(chunk_dir, fname), landmarks,
+                              None if encoding is None else [float(x) for x in encoding], scores,
+                              crop_hash(face) if select else None, face_score(face) if select else None))
+            frames.append((frame_id, faces))
+            _report(chunk_dir, frame_id + 1 - reported, len(faces))
+            reported = frame_id + 1
+    finally:
+        cap.release()
+        writer.close()
+        # Frames after the last sample (or cut short by the end of the
+        # video) still count towards the total
+        _report(chunk_dir, max(0, end - reported))
+    return frames
+
+
+def chunk_hash(face):
+    return face[6]
+
+
+def chunk_score(face):
+    return face[7]
+
+
+def extract_video(video_path, output_dir, interval=10, interval_seconds=None, margin=0.0,
+                  write_manifest=False, crop_format="jpg", quality=95, dedup_window=None,
+                  best_shots=0, min_quality=None):
+    """Extract one whole video into output_dir, as ExtractionWorker does.
+
+    Meant for pool processes: (video_path, frames, faces) covered are
+    reported on the progress queue.  Returns (faces, complete), where
+    complete is False if the stop event cut the video short.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video file: {video_path}")
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    step = sample_step(interval, interval_seconds, fps)
+    manifest = prepare_output(output_dir, margin, write_manifest)
+    writer = CropWriter(output_dir, crop_format, quality)
+    selector = make_selector(dedup_window, best_shots)
+    check = quality_check(min_quality, best_shots)
+    face_id = 0
+
+    def save(kept):
+        nonlocal face_id
+        for frame_id, (box, crop_box, crop, landmarks, encoding, scores) in kept:
+            fname = writer.crop_name(face_id)
+            writer.put(fname, crop)
+            write_record(manifest, fname, face_id, frame_id, fps, box, crop_box,
+                         landmarks, encoding, scores)
+            face_id += 1
+        return len(kept)
+
+    reported = 0
+    try:
+        for frame_id, frame in iter_sampled_frames(cap, step, end_frame=total_frames or None):
+            if _stopped():
+                return face_id, False
+            found = extract_frame(frame, margin, manifest is not None, check)
+            saved = save(selector.add(frame_id, frame_id / fps, found))
+            _report(video_path, frame_id + 1 - reported, saved)
+            reported = frame_id + 1
+        _report(video_path, max(0, total_frames - reported), save(selector.flush()))
+        return face_id, True
+    finally:
+        cap.release()
+        writer.close()
+        if manifest is not None:
+            manifest.close()
+
+
+def remove_chunks(chunk_dirs):
+    for chunk_dir in chunk_dirs:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
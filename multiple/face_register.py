@@ -1,14 +1,24 @@
 import os
 import shutil
 import sqlite3
+import multiprocessing as mp
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
 import numpy as np
 import face_recognition
+from gallery import encode_encoding, table_storage
+from recognition import encode_image_file
+from crops import list_crops, read_crop_info, read_manifest, manifest_face_box
+from crop_writer import encode_crop, unpack_archives
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QPushButton, QFileDialog, 
                             QLabel, QLineEdit, QMessageBox, QHBoxLayout)
 from PyQt5.QtCore import Qt, QThread, pyqtSignal
 
 DB_PATH = "faces.db"
 REFERENCE_IMAGE_DIR = "reference_images"
+SAVE_BATCH_SIZE = 64  # matched encodings committed per transaction
+ENCODE_WORKERS = None  # processes encoding crops; None uses every core, 1 encodes on the worker thread
+IN_FLIGHT_PER_WORKER = 4  # crops submitted ahead of the one being collected
 
 def init_db():
     conn = sqlite3.connect(DB_PATH)
@@ -20,6 +30,10 @@ def init_db():
             encoding BLOB NOT NULL
         )
     ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_faces_name ON faces (name)")
+    # WAL lets the trackers keep reading while registration writes, and the
+    # setting is stored in the database file
+    cursor.execute("PRAGMA journal_mode=WAL")
     conn.commit()
     conn.close()
 
@@ -28,14 +42,42 @@ class AutoLabelWorker(QThread):
     finished = pyqtSignal(int, str)  # matches, name
     error_occurred = pyqtSignal(str)
 
-    def __init__(self, name, ref_img_paths, faces_folder):
+    def __init__(self, name, ref_img_paths, faces_folder, workers=ENCODE_WORKERS, detect_in_crops=False):
         super().__init__()
         self.name = name
         self.ref_img_paths = ref_img_paths
         self.faces_folder = faces_folder
+        self.workers = workers or os.cpu_count() or 1
+        self.detect_in_crops = detect_in_crops
+        # Extracted crops already are face boxes; only re-detect when asked
+        # to, or for crops from elsewhere (no extraction.json)
+        self.crop_margin = None if detect_in_crops else read_crop_info(faces_folder).get("margin")
+        self.saved_encodings = {}  # crop file name -> encoding from the extraction manifest
+        self.face_boxes = {}  # crop file name -> face box inside the crop, from the manifest
         self._is_running = True
+        self.conn = None
+        self.pending = []  # (name, encoding blob, file to remove once committed)
 
     def run(self):
+        self.conn = sqlite3.connect(DB_PATH)
+        # Durable at every checkpoint rather than every commit
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.storage = table_storage(self.conn)
+        try:
+            self.label_faces()
+        finally:
+            # Whatever matched before a stop or error is still saved
+            try:
+                self.flush_pending()
+            except Exception as e:
+                # Raising here would hide the original error and end the
+                # thread without any signal
+                self.error_occurred.emit(f"Could not save the matched faces: {e}")
+            finally:
+                self.conn.close()
+                self.conn = None
+
+    def label_faces(self):
         try:
             ref_encs = []
             for path in self.ref_img_paths:
@@ -53,20 +95,32 @@ class AutoLabelWorker(QThread):
 
             matches = 0
             kept_reference = False
-            face_files = os.listdir(self.faces_folder)
+            unpacked = unpack_archives(self.faces_folder)
+            if unpacked:
+                self.update_status.emit(f"Unpacked {unpacked} crops from the crop archive", "blue")
+            face_files = list_crops(self.faces_folder)
+            records = read_manifest(self.faces_folder)
+            # Crops with an encoding saved at extraction skip dlib entirely
+            self.saved_encodings = {fname: np.asarray(record["encoding"], dtype=np.float64)
+                                    for fname, record in records.items()
+                                    if record.get("encoding") is not None}
+            if not self.detect_in_crops:
+                boxes = {fname: manifest_face_box(record) for fname, record in records.items()}
+                self.face_boxes = {fname: box for fname, box in boxes.items() if box is not None}
+            if self.saved_encodings:
+                known = sum(1 for fname in face_files if fname in self.saved_encodings)
+                self.update_status.emit(f"Using saved encodings for {known}/{len(face_files)} files", "blue")
             total_files = len(face_files)
 
-            for i, fname in enumerate(face_files):
-                if not self._is_running:
-                    return
-                    
-                fpath = os.path.join(self.faces_folder, fname)
+            face_paths = [os.path.join(self.faces_folder, fname) for fname in face_files]
+            for i, (fpath, encs, error) in enumerate(self.encode_files(face_paths)):
+                fname = os.path.basename(fpath)
                 try:
-                    img = face_recognition.load_image_file(fpath)
-                    encs = face_recognition.face_encodings(img)
+                    if error is not None:
+                        raise error
                     if not encs:
                         continue
-                    
+
                     candidate_enc = encs[0]
 
                     match = False
@@ -80,24 +134,30 @@ class AutoLabelWorker(QThread):
                         match = True if matches < 20 else False
 
                     if match:
-                        self.save_encoding_to_db(self.name, candidate_enc)
-                        matches += 1
-
                         if not kept_reference:
                             dest_path = os.path.join(REFERENCE_IMAGE_DIR, f"{self.name}.jpg")
-                            shutil.copy(fpath, dest_path)
+                            if fpath.lower().endswith(".npy"):
+                                with open(dest_path, "wb") as f:
+                                    f.write(encode_crop(np.load(fpath)))
+                            else:
+                                shutil.copy(fpath, dest_path)
                             kept_reference = True
 
-                        os.remove(fpath)
-
-                    # Update progress every 10 files or for the last file
-                    if i % 10 == 0 or i == total_files - 1:
-                        self.update_status.emit(f"Processed {i+1}/{total_files} files, found {matches} matches", "blue")
+                        self.save_encoding_to_db(self.name, candidate_enc, fpath)
+                        matches += 1
 
                 except Exception as e:
                     self.update_status.emit(f"Error processing {fname}: {str(e)}", "red")
                     continue
-                
+
+                finally:
+                    # Update progress every 10 files or for the last file, counting files without faces
+                    if i % 10 == 0 or i == total_files - 1:
+                        self.update_status.emit(f"Processed {i+1}/{total_files} files, found {matches} matches", "blue")
+
+            if not self._is_running:
+                return
+            self.flush_pending()
             if matches > 0:
                 self.finished.emit(matches, self.name)
             else:
@@ -106,16 +166,95 @@ class AutoLabelWorker(QThread):
         except Exception as e:
             self.error_occurred.emit(str(e))
 
+    def encode_files(self, paths):
+        """Yield (path, encodings, error) for every path, in order.
+
+        Encodings saved in the extraction manifest are used as they are.
+        With more than one worker the other crops are decoded and encoded in
+        a process pool, a few files ahead of the one being yielded.  Stops
+        early once stop() is called.
+        """
+        to_encode = [path for path in paths if self.saved_encoding(path) is None]
+        if self.workers <= 1 or not to_encode:
+            for path in paths:
+                if not self._is_running:
+                    return
+                saved = self.saved_encoding(path)
+                if saved is not None:
+                    yield path, [saved], None
+                    continue
+                try:
+                    yield path, encode_image_file(path, self.crop_margin, self.face_box(path)), None
+                except Exception as e:
+                    yield path, None, e
+            return
+
+        pool = ProcessPoolExecutor(self.workers, mp_context=mp.get_context("spawn"))
+        pending = deque()
+        remaining = iter(paths)
+        try:
+            while True:
+                in_flight = sum(1 for _, future in pending if future is not None)
+                while in_flight < self.workers * IN_FLIGHT_PER_WORKER:
+                    path = next(remaining, None)
+                    if path is None:
+                        break
+                    if self.saved_encoding(path) is not None:
+                        pending.append((path, None))
+                        continue
+                    pending.append((path, pool.submit(encode_image_file, path, self.crop_margin,
+                                                      self.face_box(path))))
+                    in_flight += 1
+                if not pending:
+                    return
+
+                path, future = pending.popleft()
+                if future is None:
+                    yield path, [self.saved_encoding(path)], None
+                    continue
+                while True:
+                    if not self._is_running:
+                        return
+                    try:
+                        result = (path, future.result(timeout=0.2), None)
+                        break
+                    except TimeoutError:
+                        continue
+                    except Exception as e:
+                        result = (path, None, e)
+                        break
+                yield result
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def saved_encoding(self, path):
+        return self.saved_encodings.get(os.path.basename(path))
+
+    def face_box(self, path):
+        return self.face_boxes.get(os.path.basename(path))
+
     def stop(self):
         self._is_running = False
         self.wait()
 
-    def save_encoding_to_db(self, name, encoding):
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO faces (name, encoding) VALUES (?, ?)", (name, encoding.tobytes()))
-        conn.commit()
-        conn.close()
+    def save_encoding_to_db(self, name, encoding, fpath):
+        """Queue a matched encoding; its crop is removed once the row is committed"""
+        # New rows use the same storage as the table (see migrate_encodings.py)
+        self.pending.append((name, encode_encoding(encoding, self.storage), fpath))
+        if len(self.pending) >= SAVE_BATCH_SIZE:
+            self.flush_pending()
+
+    def flush_pending(self):
+        if not self.pending:
+            return
+        with self.conn:
+            self.conn.executemany("INSERT INTO faces (name, encoding) VALUES (?, ?)",
+                                  [(name, blob) for name, blob, _ in self.pending])
+        # Taken out before removing the crops, so a failed removal can never
+        # get the rows inserted twice
+        committed, self.pending = self.pending, []
+        for _, _, fpath in committed:
+            os.remove(fpath)
 
 class FaceRegisterTab(QWidget):
     def __init__(self):
@@ -1,89 +1,142 @@
 import cv2
-import sqlite3
-import numpy as np
-import face_recognition
+import os
 import time
 from PyQt5.QtWidgets import (QWidget, QGridLayout, QPushButton, QFileDialog, 
-                             QLabel, QVBoxLayout)
+                             QLabel, QVBoxLayout, QHBoxLayout, QComboBox,
+                             QCheckBox, QSpinBox)
 from PyQt5.QtCore import QTimer, QThread, pyqtSignal
 from PyQt5.QtGui import QImage, QPixmap
+from gallery import GalleryStore, GalleryMatcher, write_gallery_file, write_matcher_file, ANN_MIN_ROWS
+from recognition_pool import RecognitionPool
+from frame_queue import DROP_NEW, KEEP_LATEST, QUEUE_ALL
+from process_pool import ProcessRecognitionPool
+from recognition import draw_detections, count_matches
+from tracking import FaceTracker
+from capture import CaptureThread
+from pacing import REALTIME, EVERY_FRAME
 
+POLICY_LABELS = [
+    ("Drop new frames while busy", DROP_NEW),
+    ("Keep latest frame", KEEP_LATEST),
+    ("Queue every frame", QUEUE_ALL),
+]
 
-class FaceLoaderThread(QThread):
-    finished = pyqtSignal(list, list)
-    
-    def run(self):
-        conn = sqlite3.connect("faces.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT name, encoding FROM faces")
-        results = cursor.fetchall()
-        conn.close()
-
-        names = []
-        encodings = []
-        for name, blob in results:
-            names.append(name)
-            encodings.append(np.frombuffer(blob, dtype=np.float64))
-        
-        self.finished.emit(encodings, names)
-
-
-class VideoProcessorThread(QThread):
-    frame_processed = pyqtSignal(int, np.ndarray)
-    performance_data = pyqtSignal(int, int, float)  # total_faces, correct_matches, processing_time
-
-    def __init__(self, index, frame, known_encodings, known_names):
+PACING_LABELS = [
+    ("Realtime (skip late frames)", REALTIME),
+    ("Every frame", EVERY_FRAME),
+]
+
+SCALE_LABELS = [
+    ("Detect at 100%", 1.0),
+    ("Detect at 50%", 0.5),
+    ("Detect at 25%", 0.25),
+]
+STATS_SMOOTHING = 0.1  # weight of the newest sample in the detection readout
+CAPTURE_POLL_MS = 10  # how often the GUI checks the capture threads for new frames
+GALLERY_POLL_MS = 1000  # how often faces.db is checked for new or deleted faces
+
+
+class GalleryWatcher(QThread):
+    """Loads the known faces, then keeps polling the database and publishes
+    a fresh matcher whenever faces are registered or deleted.
+
+    With share_dir every matcher is published as a gallery file in that
+    folder (see _shared), so worker processes receive only its path.
+    """
+    gallery_changed = pyqtSignal(object, int, int, int)  # matcher, added, removed, total
+
+    def __init__(self, db_path="faces.db", interval_ms=GALLERY_POLL_MS, ann_probe=None, table="faces",
+                 snapshot_path=None, storage="float32", share_dir=None):
         super().__init__()
-        self.index = index
-        self.frame = frame
-        self.known_encodings = known_encodings
-        self.known_names = known_names
-        self.start_time = time.time()
-    
-    def run(self):
-        rgb = cv2.cvtColor(self.frame, cv2.COLOR_BGR2RGB)
-        boxes = face_recognition.face_locations(rgb)
-        encs = face_recognition.face_encodings(rgb, boxes)
+        self.storage = storage
+        self.db_path = db_path
+        self.table = table
+        self.snapshot_path = snapshot_path
+        self.share_dir = share_dir
+        self.interval_ms = interval_ms
+        self.ann_probe = ann_probe
+        self._stopping = False
+        self._shared_count = 0
+        self._shared_files = []
 
-        correct_matches = 0
-        total_faces = len(boxes)
+    def run(self):
+        store = GalleryStore(self.db_path, table=self.table, storage=self.storage)
+        loaded = False
+        if self.snapshot_path:
+            # Memory-map the gallery file, rewriting it first if the database
+            # moved on or the file is not stored as self.storage
+            if not store.load_snapshot(self.snapshot_path):
+                store.refresh()
+                write_gallery_file(self.snapshot_path, store)
+            matcher = GalleryMatcher.from_file(self.snapshot_path)
+            if self.ann_probe and len(matcher) >= ANN_MIN_ROWS:
+                matcher.build_index(self.ann_probe)
+            self.gallery_changed.emit(matcher, len(store), 0, len(store))
+            loaded = True
+        while not self._stopping:
+            changes = store.refresh()
+            # Always publish the first load, even of an empty database
+            if changes is not None or not loaded:
+                added, removed = changes or (0, 0)
+                self.gallery_changed.emit(self._shared(store.matcher(n_probe=self.ann_probe)),
+                                          added, removed, len(store))
+                loaded = True
+            self.msleep(self.interval_ms)
+        store.close()
 
-        for (box, enc) in zip(boxes, encs):
-            matches = face_recognition.compare_faces(self.known_encodings, enc, tolerance=0.5)
-            name = "Unknown"
-            box_color = (255, 0,0) 
+    def _shared(self, matcher):
+        """The matcher opened from a gallery file in share_dir.
 
-            if True in matches:
-                correct_matches += 1
-                counts = {}
-                for i, matched in enumerate(matches):
-                    if matched:
-                        counts[self.known_names[i]] = counts.get(self.known_names[i], 0) + 1
-                name = max(counts, key=counts.get)
-                box_color = (0, 255,0) 
+        Written here, off the GUI thread, under a new name for every
+        change: a file that workers may still have mapped is never
+        replaced, and is only deleted once two newer ones exist.
+        """
+        if self.share_dir is None or matcher.source_path is not None or not len(matcher):
+            return matcher
+        self._shared_count += 1
+        path = os.path.join(self.share_dir, f"gallery-{self._shared_count}.bin")
+        write_matcher_file(path, matcher)
+        shared = GalleryMatcher.from_file(path, matcher.tolerance)
+        # Same row order as the file, and pickled as its centroids only
+        shared.index = matcher.index
 
-            top, right, bottom, left = box
-            cv2.rectangle(rgb, (left, top), (right, bottom), box_color, 2)
-            cv2.putText(rgb, name, (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, box_color, 2)
+        self._shared_files.append(path)
+        for old in self._shared_files[:-2]:
+            try:
+                os.remove(old)
+                self._shared_files.remove(old)
+            except OSError:
+                pass  # still mapped on Windows; tried again next time
+        return shared
 
-        processing_time = time.time() - self.start_time
-        self.frame_processed.emit(self.index, rgb)
-        self.performance_data.emit(total_faces, correct_matches, processing_time)
+    def stop(self):
+        self._stopping = True
+        self.wait()
 
 
 class FaceTrackingTab(QWidget):
     performance_update = pyqtSignal(int, int, float)  # total_faces, correct_matches, processing_time
 
-    def __init__(self):
+    def __init__(self, num_workers=None, queue_capacity=2, backend="thread", ann_probe=None,
+                 use_prototypes=False, gallery_file=None, matcher_storage="float32"):
         super().__init__()
         self.layout = QGridLayout()
         self.setLayout(self.layout)
         self.video_widgets = []
         self.videos = []
+        self.video_names = [None] * 4
+        self.pacing_modes = [REALTIME] * 4
         self.timers = []
-        self.processing_threads = []
+        self._shut_down = False
+        self.frame_seqs = [0] * 4  # Last frame number submitted per feed
+        self.displayed_seqs = [0] * 4  # Last frame number shown per feed
         self.video_start_times = [None] * 4  # Track start times for each video
         self.video_durations = [0] * 4  # Track durations for each video
+        self.trackers = [FaceTracker() for _ in range(4)]
+        self.keyframe_seqs = [0] * 4  # Frame number of the keyframe in flight, 0 if none
+        self.keyframe_grays = [None] * 4
+        self.last_grays = [None] * 4
+        self.detection_stats = []  # Smoothed detection latency / faces / recall per feed
 
         self.layout.setSpacing(15)
         self.layout.setContentsMargins(15, 15, 15, 15)
@@ -118,32 +171,105 @@ class FaceTrackingTab(QWidget):
             btn.clicked.connect(lambda _, idx=i: self.load_video(idx))
             video_container.addWidget(btn)
 
+            options_layout = QHBoxLayout()
+            policy_box = QComboBox()
+            for text, _ in POLICY_LABELS:
+                policy_box.addItem(text)
+            policy_box.currentIndexChanged.connect(
+                lambda row, idx=i: self.set_policy(idx, POLICY_LABELS[row][1])
+            )
+            options_layout.addWidget(policy_box)
+
+            scale_box = QComboBox()
+            for text, _ in SCALE_LABELS:
+                scale_box.addItem(text)
+            scale_box.currentIndexChanged.connect(
+                lambda row, idx=i: self.set_detection_scale(idx, SCALE_LABELS[row][1])
+            )
+            options_layout.addWidget(scale_box)
+
+            pacing_box = QComboBox()
+            for text, _ in PACING_LABELS:
+                pacing_box.addItem(text)
+            pacing_box.currentIndexChanged.connect(
+                lambda row, idx=i: self.set_pacing(idx, PACING_LABELS[row][1])
+            )
+            options_layout.addWidget(pacing_box)
+            video_container.addLayout(options_layout)
+
             status_label = QLabel("No video loaded")
             status_label.setStyleSheet("color: #7f8c8d; font-style: italic;")
             video_container.addWidget(status_label)
 
+            stats_label = QLabel("")
+            stats_label.setStyleSheet("color: #7f8c8d;")
+            video_container.addWidget(stats_label)
+
             self.layout.addLayout(video_container, i // 2, i % 2)
 
             self.video_widgets.append({
                 'display': label,
-                'status': status_label
+                'status': status_label,
+                'policy': policy_box,
+                'scale': scale_box,
+                'pacing': pacing_box,
+                'stats': stats_label
             })
+            self.detection_stats.append({'ms': None, 'faces': None, 'recall': None})
             self.videos.append(None)
             self.timers.append(QTimer())
             self.timers[i].timeout.connect(lambda idx=i: self.update_frame(idx))
-            self.processing_threads.append(None)
 
-        self.known_encodings = []
-        self.known_names = []
-        self.face_loader_thread = FaceLoaderThread()
-        self.face_loader_thread.finished.connect(self.on_faces_loaded)
-        self.face_loader_thread.start()
+        # Detect-then-track controls
+        tracking_layout = QHBoxLayout()
+        self.tracking_checkbox = QCheckBox("Track faces between detections")
+        tracking_layout.addWidget(self.tracking_checkbox)
+        tracking_layout.addWidget(QLabel("Detect every"))
+        self.keyframe_spin = QSpinBox()
+        self.keyframe_spin.setRange(1, 120)
+        self.keyframe_spin.setValue(self.trackers[0].keyframe_interval)
+        self.keyframe_spin.valueChanged.connect(self.set_keyframe_interval)
+        tracking_layout.addWidget(self.keyframe_spin)
+        tracking_layout.addWidget(QLabel("frames"))
+        self.track_cache_checkbox = QCheckBox("Reuse identities of stable faces")
+        self.track_cache_checkbox.toggled.connect(lambda checked: self.pool.set_track_cache_enabled(checked))
+        tracking_layout.addWidget(self.track_cache_checkbox)
+        tracking_layout.addStretch()
+        self.layout.addLayout(tracking_layout, 2, 0, 1, 2)
+
+        # Recognition workers live for the whole session and are shared by all feeds.
+        # The "process" backend runs them as separate processes to get past the GIL.
+        pool_class = ProcessRecognitionPool if backend == "process" else RecognitionPool
+        self.pool = pool_class(4, num_workers, queue_capacity)
+        self.pool.frame_processed.connect(self.display_processed_frame)
+        self.pool.detections_ready.connect(self.on_keyframe_detections)
+        self.pool.performance_data.connect(self.handle_performance_data)
+        self.pool.detection_stats.connect(self.update_detection_stats)
+
+        self.gallery_loaded = False
+        # ann_probe switches large galleries to approximate matching;
+        # use_prototypes matches against the compact table built by prototypes.py;
+        # gallery_file memory-maps a snapshot written by export_gallery.py;
+        # matcher_storage="int8" quantizes the in-memory matrix
+        self.gallery_watcher = GalleryWatcher(ann_probe=ann_probe,
+                                              table="prototypes" if use_prototypes else "faces",
+                                              snapshot_path=gallery_file, storage=matcher_storage,
+                                              share_dir=self.pool.snapshot_dir if backend == "process" else None)
+        self.gallery_watcher.gallery_changed.connect(self.on_gallery_changed)
+        self.gallery_watcher.start()
         self.video_widgets[0]['status'].setText("Loading known faces...")
 
-    def on_faces_loaded(self, encodings, names):
-        self.known_encodings = encodings
-        self.known_names = names
-        self.video_widgets[0]['status'].setText(f"Loaded {len(names)} known faces")
+    def on_gallery_changed(self, matcher, added, removed, total):
+        # Workers pick up the new matcher on their next frame; tracking never pauses.
+        # Any gallery file was already written by the watcher.
+        self.pool.set_matcher(matcher)
+        if not self.gallery_loaded:
+            self.gallery_loaded = True
+            self.video_widgets[0]['status'].setText(f"Loaded {total} known faces")
+        elif self.videos[0] is None:
+            self.video_widgets[0]['status'].setText(
+                f"Known faces updated: +{added} / -{removed} ({total} total)"
+            )
 
     def load_video(self, index):
         file, _ = QFileDialog.getOpenFileName(
@@ -153,39 +279,149 @@ class FaceTrackingTab(QWidget):
             "Videos (*.mp4 *.avi *.mov)"
         )
         if file:
-            self.videos[index] = cv2.VideoCapture(file)
-            self.video_widgets[index]['status'].setText(f"Loaded: {file.split('/')[-1]}")
+            if self.videos[index] is not None:
+                self.videos[index].stop()
+            self.pool.reset_feed(index)
+            self.trackers[index].clear()
+            self.keyframe_seqs[index] = 0
+            # Decoding happens on the feed's own capture thread
+            self.videos[index] = CaptureThread(
+                file, lossless=self.is_lossless(index), pacing=self.pacing_modes[index]
+            )
+            self.videos[index].start()
+            self.video_names[index] = file.split('/')[-1]
+            self.video_widgets[index]['status'].setText(
+                f"Loaded: {self.video_names[index]} ({self.videos[index].fps:.1f} fps source)"
+            )
             self.video_widgets[index]['status'].setStyleSheet("color: #27ae60;")
             self.video_start_times[index] = time.time()  # Record start time when video loads
-            self.timers[index].start(30)
+            self.timers[index].start(CAPTURE_POLL_MS)
+
+    def is_lossless(self, index):
+        # A feed that must not lose frames also must not skip decoded ones
+        return (self.pool.queue.policies[index] == QUEUE_ALL
+                or self.pacing_modes[index] == EVERY_FRAME)
+
+    def set_policy(self, index, policy):
+        self.pool.set_policy(index, policy)
+        if self.videos[index] is not None:
+            self.videos[index].set_lossless(self.is_lossless(index))
+
+    def set_pacing(self, index, mode):
+        self.pacing_modes[index] = mode
+        if self.videos[index] is not None:
+            self.videos[index].set_pacing(mode)
+            self.videos[index].set_lossless(self.is_lossless(index))
+
+    def set_detection_scale(self, index, scale):
+        self.pool.set_detection_scale(index, scale)
+        self.detection_stats[index] = {'ms': None, 'faces': None, 'recall': None}
+        self.video_widgets[index]['stats'].setText("")
+
+    def update_detection_stats(self, index, detect_seconds, faces, recall):
+        """Show smoothed detection latency, faces per frame and, for scaled
+        feeds, the share of full resolution faces still found"""
+        stats = self.detection_stats[index]
+        samples = [('ms', detect_seconds * 1000), ('faces', faces)]
+        if recall >= 0:
+            samples.append(('recall', recall * 100))
+        for key, value in samples:
+            old = stats[key]
+            stats[key] = value if old is None else old + STATS_SMOOTHING * (value - old)
+
+        scale = self.pool.detection_scales[index]
+        text = f"Detect {scale:.0%}: {stats['ms']:.0f} ms, {stats['faces']:.1f} faces/frame"
+        if self.videos[index] is not None:
+            text = f"Decode {self.videos[index].average_decode_ms():.1f} ms, " + text
+        if scale < 1.0:
+            recall_text = "measuring" if stats['recall'] is None else f"{stats['recall']:.0f}%"
+            text += f", recall vs 100%: {recall_text}"
+        self.video_widgets[index]['stats'].setText(text)
+
+    def set_keyframe_interval(self, value):
+        for tracker in self.trackers:
+            tracker.keyframe_interval = value
 
     def update_frame(self, index):
-        cap = self.videos[index]
-        if cap is None:
+        capture = self.videos[index]
+        if capture is None:
             return
 
-        ret, frame = cap.read()
-        if not ret:
-            self.timers[index].stop()
-            duration = time.time() - self.video_start_times[index]  # Calculate duration
-            self.video_durations[index] = duration
-            self.video_widgets[index]['status'].setText(
-                f"Video ended in {duration:.2f} seconds"
-            )
-            self.video_widgets[index]['status'].setStyleSheet("color: #e74c3c;")
+        tracking = self.tracking_checkbox.isChecked()
+        # A full "queue every frame" or "every frame" feed waits here instead of losing frames
+        if not tracking and self.is_lossless(index) and self.pool.queue.is_full(index):
             return
 
-        if self.processing_threads[index] and self.processing_threads[index].isRunning():
+        item = capture.next_frame()
+        if item is None:
+            if capture.ended():
+                self.timers[index].stop()
+                duration = time.time() - self.video_start_times[index]  # Calculate duration
+                self.video_durations[index] = duration
+                pacer = capture.pacer
+                self.video_widgets[index]['status'].setText(
+                    f"Video ended in {duration:.2f} seconds at "
+                    f"{pacer.describe(pacer.average_fps())} "
+                    f"({self.pool.dropped(index)} frames dropped, "
+                    f"{capture.frames_skipped} skipped)"
+                )
+                self.video_widgets[index]['status'].setStyleSheet("color: #e74c3c;")
             return
+        _, frame = item
 
-        self.processing_threads[index] = VideoProcessorThread(
-            index, frame, self.known_encodings, self.known_names
-        )
-        self.processing_threads[index].frame_processed.connect(self.display_processed_frame)
-        self.processing_threads[index].performance_data.connect(self.handle_performance_data)
-        self.processing_threads[index].start()
+        self.frame_seqs[index] += 1
+        if tracking:
+            self.track_frame(index, self.frame_seqs[index], frame)
+        else:
+            self.pool.submit(index, self.frame_seqs[index], frame)
+
+    def track_frame(self, index, seq, frame):
+        """Move the last known faces along on the GUI thread and only send
+        keyframes to the recognition workers"""
+        start_time = time.time()
+        tracker = self.trackers[index]
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        self.last_grays[index] = gray
+        detections = tracker.update(gray)
+
+        if tracker.needs_detection() and not self.keyframe_seqs[index]:
+            if self.pool.submit(index, seq, frame):
+                self.keyframe_seqs[index] = seq
+                self.keyframe_grays[index] = gray
 
-    def display_processed_frame(self, index, rgb_frame):
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        if detections:
+            draw_detections(rgb, detections)
+            self.handle_performance_data(len(detections), count_matches(detections),
+                                         time.time() - start_time)
+        self.display_processed_frame(index, seq, rgb)
+
+    def on_keyframe_detections(self, index, seq, detections):
+        if seq != self.keyframe_seqs[index]:
+            return
+        self.keyframe_seqs[index] = 0
+        # Later frames were already shown while the keyframe was processed,
+        # so jump the fresh boxes forward to the newest frame
+        tracker = self.trackers[index]
+        tracker.reset(self.keyframe_grays[index], detections)
+        if self.last_grays[index] is not self.keyframe_grays[index]:
+            tracker.update(self.last_grays[index])
+        self.keyframe_grays[index] = None
+
+    def display_processed_frame(self, index, seq, rgb_frame):
+        # Workers can finish out of order; never show an older frame over a newer one
+        if seq <= self.displayed_seqs[index]:
+            return
+        self.displayed_seqs[index] = seq
+        capture = self.videos[index]
+        if capture is not None and not capture.ended():
+            pacer = capture.pacer
+            pacer.frame_done()
+            # Refresh the achieved rate about once a second of source video
+            if pacer.processed % max(1, int(pacer.source_fps)) == 0:
+                self.video_widgets[index]['status'].setText(
+                    f"Playing: {self.video_names[index]} at {pacer.describe()}"
+                )
         h, w, ch = rgb_frame.shape
         bytes_per_line = ch * w
         qimg = QImage(rgb_frame.data, w, h, bytes_per_line, QImage.Format_RGB888)
@@ -200,10 +436,21 @@ class FaceTrackingTab(QWidget):
         if total_faces > 0:
             self.performance_update.emit(total_faces, correct_matches, processing_time)
 
+    def shutdown(self):
+        """Stop every thread and worker process the tab started.  The tab is
+        a child widget, so the main window calls this when it closes."""
+        if self._shut_down:
+            return
+        self._shut_down = True
+        for timer in self.timers:
+            timer.stop()
+        for capture in self.videos:
+            if capture is not None:
+                capture.stop()
+        # The watcher writes into the process pool's folder, so it stops first
+        self.gallery_watcher.stop()
+        self.pool.stop()
+
     def closeEvent(self, event):
-        for thread in self.processing_threads:
-            if thread and thread.isRunning():
-                thread.terminate()
-        if self.face_loader_thread.isRunning():
-            self.face_loader_thread.terminate()
+        self.shutdown()
         event.accept()
\ No newline at end of file
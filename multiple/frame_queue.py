@@ -0,0 +1,86 @@
+import threading
+import time
+from collections import deque
+
+# Per-feed policies for frames arriving while the feed already has
+# `capacity` frames waiting
+DROP_NEW = "drop_new"        # discard the incoming frame
+KEEP_LATEST = "keep_latest"  # discard the oldest waiting frame instead
+QUEUE_ALL = "queue_all"      # refuse the frame so the caller stops reading
+POLICIES = (DROP_NEW, KEEP_LATEST, QUEUE_ALL)
+
+
+class FrameQueue:
+    """Bounded per-feed frame queue shared by all recognition workers.
+
+    Workers take frames round-robin across feeds so one busy feed cannot
+    starve the others.
+    """
+
+    def __init__(self, num_feeds, capacity=2):
+        self.capacity = capacity
+        self.pending = [deque() for _ in range(num_feeds)]
+        self.policies = [DROP_NEW] * num_feeds
+        self.dropped = [0] * num_feeds
+        self._cond = threading.Condition()
+        self._next_feed = 0
+        self._closed = False
+
+    def set_policy(self, index, policy):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown queue policy: {policy}")
+        with self._cond:
+            self.policies[index] = policy
+
+    def is_full(self, index):
+        with self._cond:
+            return len(self.pending[index]) >= self.capacity
+
+    def put(self, index, seq, frame):
+        """Queue a frame, returning False if it was not accepted"""
+        with self._cond:
+            pending = self.pending[index]
+            if len(pending) >= self.capacity:
+                policy = self.policies[index]
+                if policy == KEEP_LATEST:
+                    pending.popleft()
+                    self.dropped[index] += 1
+                else:
+                    if policy == DROP_NEW:
+                        self.dropped[index] += 1
+                    return False
+            pending.append((index, seq, frame, time.time()))
+            # Every waiter checks, since some only take certain feeds
+            self._cond.notify_all()
+            return True
+
+    def get(self, accept=None):
+        """Block until a frame is available; returns None once closed.
+
+        accept(index), if given, limits the caller to the frames of the
+        feeds it returns True for.  It is asked again after wake().
+        """
+        with self._cond:
+            while True:
+                if self._closed:
+                    return None
+                for offset in range(len(self.pending)):
+                    index = (self._next_feed + offset) % len(self.pending)
+                    if self.pending[index] and (accept is None or accept(index)):
+                        self._next_feed = index + 1
+                        return self.pending[index].popleft()
+                self._cond.wait()
+
+    def wake(self):
+        """Make blocked get() calls re-check their accept functions"""
+        with self._cond:
+            self._cond.notify_all()
+
+    def clear(self, index):
+        with self._cond:
+            self.pending[index].clear()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
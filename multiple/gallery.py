@@ -0,0 +1,685 @@
+import os
+import sqlite3
+import struct
+import time
+
+import numpy as np
+
+UNKNOWN_NAME = "Unknown"
+
+# Below this many rows a brute force scan is as fast as probing an index
+ANN_MIN_ROWS = 2048
+
+# Binary gallery snapshot: header, then 64-byte aligned sections holding the
+# matrix (float32, or int8 with one float32 scale per row), squared norms,
+# database position and id of every row, identity offsets and the
+# "\0"-separated identity names
+GALLERY_MAGIC = b"FACEGAL\0"
+GALLERY_FORMAT_VERSION = 3
+_HEADER = struct.Struct("<8sIIIQQQQqqd")  # magic, version, dim, storage, rows, identities,
+                                          # names bytes, source rows, source max id,
+                                          # source generation, created
+_HEADER_FIELDS = ["version", "dim", "storage", "rows", "identities", "names_bytes",
+                  "source_rows", "source_max_id", "source_generation", "created"]
+# Matrix storage codes in the header
+GALLERY_STORAGES = ("float32", "int8")
+_ALIGN = 64
+
+# How encodings may be stored in faces.db.  The format of a row is told
+# apart by its BLOB length, so tables can be migrated row by row.
+ENCODING_STORAGES = ("float64", "float32", "int8")
+
+
+def quantize_int8(vectors):
+    """Symmetric per-vector int8 quantization: returns (int8 rows, float32
+    scales) with vectors ~= rows * scales[:, None]"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=-1) / 127.0
+    scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+    rows = np.clip(np.rint(vectors / scales[..., None]), -127, 127).astype(np.int8)
+    return rows, scales
+
+
+def encode_encoding(encoding, storage="float64"):
+    """Serialise one encoding for the faces table"""
+    if storage == "float64":
+        return np.asarray(encoding, dtype=np.float64).tobytes()
+    if storage == "float32":
+        return np.asarray(encoding, dtype=np.float32).tobytes()
+    if storage == "int8":
+        rows, scale = quantize_int8(encoding)
+        return scale.tobytes() + rows.tobytes()
+    raise ValueError(f"Unknown encoding storage: {storage}")
+
+
+def decode_encoding(blob, dim=128):
+    """Inverse of encode_encoding for any storage, as float64"""
+    if len(blob) == dim * 8:
+        return np.frombuffer(blob, dtype=np.float64)
+    if len(blob) == dim * 4:
+        return np.frombuffer(blob, dtype=np.float32).astype(np.float64)
+    if len(blob) == dim + 4:
+        scale = np.frombuffer(blob[:4], dtype=np.float32)[0]
+        return np.frombuffer(blob[4:], dtype=np.int8) * np.float64(scale)
+    raise ValueError(f"Encoding BLOB of {len(blob)} bytes is not a {dim}-d encoding")
+
+
+def gallery_generation(conn):
+    """Counter bumped whenever rows are rewritten in place (see
+    migrate_encodings.py), which row counts and ids cannot show.  Kept as
+    the database's user_version."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def bump_gallery_generation(conn):
+    conn.execute(f"PRAGMA user_version = {gallery_generation(conn) + 1}")
+
+
+def blob_storage(blob, dim=128):
+    return {dim * 8: "float64", dim * 4: "float32", dim + 4: "int8"}[len(blob)]
+
+
+def table_storage(conn, table="faces"):
+    """Storage of the newest row, so new rows follow a migrated table;
+    float64 for an empty table"""
+    row = conn.execute(f"SELECT encoding FROM {table} ORDER BY id DESC LIMIT 1").fetchone()
+    return blob_storage(row[0]) if row else "float64"
+
+
+def load_known_faces(db_path="faces.db", table="faces"):
+    """Read every stored (name, encoding) row from the faces table, or from
+    the prototypes table built by prototypes.py"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT name, encoding FROM {table}")
+    results = cursor.fetchall()
+    conn.close()
+
+    names = []
+    encodings = []
+    for name, blob in results:
+        names.append(name)
+        encodings.append(decode_encoding(blob))
+    return encodings, names
+
+
+def nearest_centroids(vectors, centroids, chunk=8192):
+    """Index of the nearest centroid for every row of vectors"""
+    norms = np.einsum("ij,ij->i", centroids, centroids)
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk):
+        block = vectors[start:start + chunk]
+        labels[start:start + chunk] = np.argmin(norms[None, :] - 2.0 * (block @ centroids.T), axis=1)
+    return labels
+
+
+def kmeans(data, k, iterations=10, seed=0):
+    """Plain Lloyd's k-means.  Returns (centroids, labels); empty clusters
+    keep their previous centroid."""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    labels = nearest_centroids(data, centroids)
+    for _ in range(iterations):
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, data)
+        counts = np.bincount(labels, minlength=k)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        labels = nearest_centroids(data, centroids)
+    return centroids, labels
+
+
+class GalleryStore:
+    """In-memory copy of the faces (or prototypes) table that follows the
+    database.
+
+    Encodings live in one contiguous matrix in id order (which is database
+    order): float32, or with storage="int8" quantized rows plus one scale
+    per row, so an int8 gallery never holds a float copy.  refresh() is
+    cheap when nothing changed: it checks SQLite's data_version and only
+    then reads the rows added since the last refresh, plus the id list when
+    the row count shows deletions.  A new gallery_generation reloads
+    everything.
+    """
+
+    def __init__(self, db_path="faces.db", dim=128, table="faces", storage="float32"):
+        if storage not in ("float32", "int8"):
+            raise ValueError(f"Unknown matcher storage: {storage}")
+        self.db_path = db_path
+        self.table = table
+        self.storage = storage
+        self.ids = np.empty(0, dtype=np.int64)
+        self.names = []
+        self._buffer = np.empty((0, dim), dtype=np.int8 if storage == "int8" else np.float32)
+        self._scales = np.empty(0, dtype=np.float32)  # int8 only
+        self.version = 0  # bumped every time rows are added or removed
+        self._conn = None
+        self._data_version = None
+        self._generation = None
+        self._centroids = None
+        self._index_rows = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def encodings(self):
+        """float32 rows, dequantized for an int8 store"""
+        rows = self._buffer[:len(self.ids)]
+        if self.storage == "int8":
+            return rows.astype(np.float32) * self._scales[:len(self.ids), None]
+        return rows
+
+    def _connection(self):
+        if self._conn is None:
+            # Owned by whichever thread polls, but not necessarily the one that built it
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        return self._conn
+
+    def refresh(self):
+        """Apply inserts and deletes made since the last call.
+
+        Returns (added, removed) row counts, or None when nothing changed.
+        """
+        conn = self._connection()
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return None
+        self._data_version = data_version
+
+        reloaded = 0
+        generation = gallery_generation(conn)
+        if generation != self._generation:
+            # Rows may have been rewritten under the same ids; start over
+            reloaded = len(self.ids)
+            self.ids = np.empty(0, dtype=np.int64)
+            self.names = []
+            self._generation = generation
+
+        try:
+            count, = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+            last_id = int(self.ids[-1]) if len(self.ids) else 0
+            new_rows = conn.execute(
+                f"SELECT id, name, encoding FROM {self.table} WHERE id > ? ORDER BY id", (last_id,)
+            ).fetchall()
+            current_ids = None
+            if count != len(self.ids) + len(new_rows):
+                current_ids = np.array([row[0] for row in conn.execute(f"SELECT id FROM {self.table}")],
+                                       dtype=np.int64)
+        except sqlite3.OperationalError:
+            # Table not created yet
+            count, new_rows, current_ids = 0, [], np.empty(0, dtype=np.int64)
+
+        removed = reloaded
+        if current_ids is not None:
+            keep = np.isin(self.ids, current_ids)
+            dropped = int(len(keep) - keep.sum())
+            if dropped:
+                kept = int(keep.sum())
+                self._buffer[:kept] = self._buffer[:len(keep)][keep]
+                if self.storage == "int8":
+                    self._scales[:kept] = self._scales[:len(keep)][keep]
+                removed += dropped
+                self.ids = self.ids[keep]
+                self.names = [name for name, k in zip(self.names, keep) if k]
+        if new_rows:
+            self._append(new_rows)
+
+        if not removed and not new_rows:
+            return None
+        self.version += 1
+        return len(new_rows), removed
+
+    def _append(self, rows):
+        n = len(self.ids)
+        needed = n + len(rows)
+        if needed > len(self._buffer):
+            # Grow geometrically so repeated enrolments stay amortised O(1)
+            size = max(needed, 2 * len(self._buffer))
+            grown = np.empty((size, self._buffer.shape[1]), dtype=self._buffer.dtype)
+            grown[:n] = self._buffer[:n]
+            self._buffer = grown
+            if self.storage == "int8":
+                scales = np.empty(size, dtype=np.float32)
+                scales[:n] = self._scales[:n]
+                self._scales = scales
+        for offset, (_, _, blob) in enumerate(rows):
+            if self.storage == "int8":
+                self._buffer[n + offset], self._scales[n + offset] = quantize_int8(decode_encoding(blob))
+            else:
+                self._buffer[n + offset] = decode_encoding(blob)
+        self.ids = np.concatenate((self.ids, np.array([row[0] for row in rows], dtype=np.int64)))
+        self.names.extend(row[1] for row in rows)
+
+    def source_stamp(self):
+        """(row count, highest id, generation) of the table, which changes
+        on every insert or delete because ids are AUTOINCREMENT, and on
+        every in-place rewrite through gallery_generation"""
+        conn = self._connection()
+        try:
+            count, max_id = conn.execute(
+                f"SELECT COUNT(*), COALESCE(MAX(id), 0) FROM {self.table}").fetchone()
+        except sqlite3.OperationalError:
+            count, max_id = 0, 0
+        return count, max_id, gallery_generation(conn)
+
+    def load_snapshot(self, path):
+        """Seed the store from a gallery file written by write_gallery_file.
+
+        Returns False, leaving the store empty, when the file is missing,
+        older than the database or stored differently from the store.
+        """
+        try:
+            header = read_gallery_header(path)
+        except (OSError, ValueError):
+            return False
+        stamp = (header["source_rows"], header["source_max_id"], header["source_generation"])
+        if stamp != self.source_stamp() or header["storage"] != self.storage:
+            return False
+
+        sections = _gallery_sections(header)
+        row_index = _map_section(path, sections, "row_index")
+        order = np.argsort(row_index)  # matrix rows back into database order
+        identities = _map_names(path, sections)
+        counts = np.diff(_map_section(path, sections, "offsets"))
+        row_identity = np.repeat(np.arange(len(identities)), counts)
+
+        self._buffer = np.array(_map_section(path, sections, "matrix")[order])
+        if self.storage == "int8":
+            self._scales = np.array(_map_section(path, sections, "scales")[order])
+        self.ids = np.array(_map_section(path, sections, "row_ids")[order])
+        self.names = [identities[i] for i in row_identity[order]]
+        # Mark the current database state as seen
+        self._data_version = self._connection().execute("PRAGMA data_version").fetchone()[0]
+        self._generation = header["source_generation"]
+        self.version += 1
+        return True
+
+    def matcher(self, tolerance=0.5, n_probe=None, storage=None):
+        """Snapshot the current rows as an immutable GalleryMatcher, stored
+        like the store unless storage says otherwise.
+
+        With n_probe, large galleries get an IVFIndex searching that many
+        partitions per query.  Partition centroids are reused across
+        refreshes until the gallery has halved or doubled in size.
+        """
+        storage = storage or self.storage
+        if storage == "int8" and self.storage == "int8":
+            n = len(self.ids)
+            matcher = GalleryMatcher(self._buffer[:n], self.names, tolerance, scales=self._scales[:n])
+        else:
+            matcher = GalleryMatcher(self.encodings, self.names, tolerance, storage)
+        if n_probe and len(matcher) >= ANN_MIN_ROWS:
+            centroids = None
+            if self._index_rows and 0.5 <= len(matcher) / self._index_rows <= 2:
+                centroids = self._centroids
+            matcher.build_index(n_probe, centroids=centroids)
+            if centroids is None:
+                self._centroids = matcher.index.centroids
+                self._index_rows = len(matcher)
+        return matcher
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def write_gallery_file(path, store):
+    """Write the store's current rows as a binary gallery file that
+    GalleryMatcher.from_file can memory-map"""
+    matcher = store.matcher()
+    return write_matcher_file(path, matcher, store.ids[matcher.row_index], store.source_stamp())
+
+
+def write_matcher_file(path, matcher, row_ids=None, source_stamp=(0, 0, 0)):
+    """Write a GalleryMatcher as a gallery file, int8 matrices with their
+    scales.  row_ids are the database ids of the matrix rows."""
+    names = "\0".join(matcher.identities).encode("utf-8")
+    count, max_id, generation = source_stamp
+    if row_ids is None:
+        row_ids = matcher.row_index
+    header = {
+        "version": GALLERY_FORMAT_VERSION, "dim": matcher.matrix.shape[1],
+        "storage": "float32" if matcher.scales is None else "int8", "rows": len(matcher),
+        "identities": len(matcher.identities), "names_bytes": len(names),
+        "source_rows": count, "source_max_id": max_id, "source_generation": generation,
+        "created": time.time(),
+    }
+    arrays = {
+        "matrix": matcher.matrix,
+        "scales": matcher.scales,
+        "sq_norms": matcher.sq_norms.astype(np.float32),
+        "row_index": matcher.row_index.astype(np.int64),
+        "row_ids": np.asarray(row_ids, dtype=np.int64),
+        "offsets": matcher.offsets,
+    }
+
+    sections = _gallery_sections(header)
+    with open(path + ".tmp", "wb") as f:
+        f.write(_HEADER.pack(GALLERY_MAGIC, *dict(
+            header, storage=GALLERY_STORAGES.index(header["storage"])).values()))
+        for name, (offset, dtype, shape) in sections.items():
+            f.seek(offset)
+            if name == "names":
+                f.write(names)
+            elif shape[0]:
+                f.write(np.ascontiguousarray(arrays[name], dtype=dtype).tobytes())
+    # Readers never see a half-written file
+    os.replace(path + ".tmp", path)
+    return header
+
+
+def read_gallery_header(path):
+    with open(path, "rb") as f:
+        raw = f.read(_HEADER.size)
+    if len(raw) < _HEADER.size:
+        raise ValueError(f"{path} is not a gallery file")
+    magic, *values = _HEADER.unpack(raw)
+    if magic != GALLERY_MAGIC:
+        raise ValueError(f"{path} is not a gallery file")
+    header = dict(zip(_HEADER_FIELDS, values))
+    if header["version"] != GALLERY_FORMAT_VERSION:
+        raise ValueError(f"{path} has gallery format {header['version']}, "
+                         f"expected {GALLERY_FORMAT_VERSION}")
+    if header["storage"] >= len(GALLERY_STORAGES):
+        raise ValueError(f"{path} has unknown matrix storage {header['storage']}")
+    header["storage"] = GALLERY_STORAGES[header["storage"]]
+    return header
+
+
+def _gallery_sections(header):
+    """{name: (byte offset, dtype, shape)} for every section of a gallery file"""
+    rows, dim = header["rows"], header["dim"]
+    int8 = header["storage"] == "int8"
+    layout = [
+        ("matrix", np.int8 if int8 else np.float32, (rows, dim)),
+        ("scales", np.float32, (rows if int8 else 0,)),
+        ("sq_norms", np.float32, (rows,)),
+        ("row_index", np.int64, (rows,)),
+        ("row_ids", np.int64, (rows,)),
+        ("offsets", np.int64, (header["identities"] + 1,)),
+        ("names", np.uint8, (header["names_bytes"],)),
+    ]
+    sections = {}
+    offset = _HEADER.size
+    for name, dtype, shape in layout:
+        offset = -(-offset // _ALIGN) * _ALIGN
+        sections[name] = (offset, dtype, shape)
+        offset += int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return sections
+
+
+def _map_section(path, sections, name):
+    offset, dtype, shape = sections[name]
+    if int(np.prod(shape)) == 0:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
+
+
+def _map_names(path, sections):
+    raw = bytes(_map_section(path, sections, "names"))
+    return raw.decode("utf-8").split("\0") if raw else []
+
+
+class IVFIndex:
+    """Inverted-file index: k-means partitions of the gallery rows.
+
+    A query only looks at the rows of its n_probe nearest partitions, so
+    matching cost grows with about sqrt(N) instead of N.  More probes find
+    more of the true matches at the cost of speed; n_probe equal to the
+    number of partitions is an exact scan.
+    """
+
+    def __init__(self, matrix, n_lists=None, n_probe=8, centroids=None,
+                 iterations=10, sample_per_list=64, seed=0):
+        if centroids is None:
+            n_lists = min(len(matrix), n_lists or max(1, int(np.sqrt(len(matrix)))))
+            centroids = self._train(matrix, n_lists, iterations, sample_per_list, seed)
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.centroid_norms = np.einsum("ij,ij->i", self.centroids, self.centroids)
+        self.n_probe = max(1, min(n_probe, len(self.centroids)))
+
+        assignment = nearest_centroids(matrix, self.centroids)
+        # Matrix rows grouped by partition, each partition in row order
+        self.rows = np.argsort(assignment, kind="stable")
+        counts = np.bincount(assignment, minlength=len(self.centroids))
+        self.list_offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+
+    @staticmethod
+    def _train(matrix, k, iterations, sample_per_list, seed):
+        """k-means on a random sample of the rows"""
+        rng = np.random.default_rng(seed)
+        sample = matrix[rng.choice(len(matrix), min(len(matrix), k * sample_per_list), replace=False)]
+        centroids, _ = kmeans(sample, k, iterations, seed)
+        return centroids
+
+    def candidates(self, query):
+        """Sorted matrix rows in the partitions nearest to one float32 query"""
+        dist = self.centroid_norms - 2.0 * (self.centroids @ query)
+        if self.n_probe < len(dist):
+            probes = np.argpartition(dist, self.n_probe - 1)[:self.n_probe]
+        else:
+            probes = np.arange(len(dist))
+        rows = [self.rows[self.list_offsets[p]:self.list_offsets[p + 1]] for p in probes]
+        return np.sort(np.concatenate(rows))
+
+
+class GalleryMatcher:
+    """Matches a whole frame of face encodings against the known faces at once.
+
+    All known encodings live in one contiguous float32 matrix, grouped so that
+    each identity owns the rows offsets[i]:offsets[i + 1].  Labels follow the
+    old compare_faces + dict vote exactly: a face gets the name with the most
+    rows within tolerance, ties going to the name matched first in database
+    order.
+
+    storage="int8" keeps the matrix quantized with one scale per row, a
+    quarter of the float32 memory.  Matching works on the int8 rows and
+    applies the scales to the dot products; scales passes rows that are
+    already quantized.
+    """
+
+    # Distances this close to the tolerance are recomputed the way
+    # face_recognition.face_distance does, so the float32 matrix product can
+    # never flip a match.
+    EXACT_BAND = 1e-4
+
+    # int8 rows converted to float32 at a time while matching, few enough
+    # to stay in cache for the matrix product
+    INT8_BLOCK = 1024
+
+    def __init__(self, encodings, names, tolerance=0.5, storage="float32", scales=None):
+        self.tolerance = tolerance
+
+        identity_ids = {}
+        row_ids = []
+        for name in names:
+            row_ids.append(identity_ids.setdefault(name, len(identity_ids)))
+        self.identities = list(identity_ids)
+
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        order = np.argsort(row_ids, kind="stable")
+        # Original database position of every matrix row, used for tie-breaks
+        self.row_index = order
+
+        if scales is not None:
+            self.matrix = np.ascontiguousarray(np.asarray(encodings, dtype=np.int8)[order])
+            self.scales = np.asarray(scales, dtype=np.float32)[order]
+        else:
+            if len(order):
+                known = np.asarray(encodings, dtype=np.float64)[order]
+            else:
+                known = np.empty((0, 128))
+            self.matrix = np.ascontiguousarray(known, dtype=np.float32)
+            self.scales = None
+            if storage == "int8":
+                self.matrix, self.scales = quantize_int8(self.matrix)
+            elif storage != "float32":
+                raise ValueError(f"Unknown matcher storage: {storage}")
+        self.sq_norms = np.concatenate(
+            [np.einsum("ij,ij->i", block, block) for block in self._blocks()] or [np.empty(0, np.float32)])
+
+        counts = np.bincount(row_ids, minlength=len(self.identities))
+        self.offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self.row_identity = np.repeat(np.arange(len(self.identities)), counts)
+        self.index = None
+        self.source_path = None
+
+    @classmethod
+    def from_file(cls, path, tolerance=0.5):
+        """Open a gallery file written by write_gallery_file.
+
+        The arrays are read-only memory maps, so every process that opens
+        the same file shares one copy of the pages.  Matchers opened this
+        way pickle as their path and are re-mapped on the other side.
+        """
+        header = read_gallery_header(path)
+        sections = _gallery_sections(header)
+        matcher = cls.__new__(cls)
+        matcher.tolerance = tolerance
+        matcher.identities = _map_names(path, sections)
+        matcher.matrix = _map_section(path, sections, "matrix")
+        matcher.sq_norms = _map_section(path, sections, "sq_norms")
+        matcher.row_index = _map_section(path, sections, "row_index")
+        matcher.offsets = np.array(_map_section(path, sections, "offsets"))
+        matcher.row_identity = np.repeat(np.arange(len(matcher.identities)), np.diff(matcher.offsets))
+        matcher.scales = _map_section(path, sections, "scales") if header["storage"] == "int8" else None
+        matcher.index = None
+        matcher.source_path = path
+        return matcher
+
+    def __reduce_ex__(self, protocol):
+        if self.source_path is None:
+            return super().__reduce_ex__(protocol)
+        if self.index is None:
+            return _reopen_matcher, (self.source_path, self.tolerance, None)
+        # The centroids travel along so the other side skips the k-means
+        return _reopen_matcher, (self.source_path, self.tolerance, self.index.n_probe,
+                                 self.index.centroids)
+
+    def build_index(self, n_probe=8, n_lists=None, centroids=None):
+        """Match through an IVFIndex from now on; see IVFIndex for n_probe"""
+        if len(self):
+            self.index = IVFIndex(self.rows(), n_lists, n_probe, centroids)
+        return self
+
+    def rows(self, rows=None):
+        """float32 matrix rows (all, or the given indices), dequantized if
+        the matrix is int8"""
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        if self.scales is None:
+            return matrix
+        scales = self.scales if rows is None else self.scales[rows]
+        return matrix.astype(np.float32) * scales[:, None]
+
+    def _blocks(self):
+        """The whole matrix as float32 blocks, without dequantizing it all at once"""
+        if self.scales is None:
+            if len(self.matrix):
+                yield self.matrix
+            return
+        for start in range(0, len(self.matrix), self.INT8_BLOCK):
+            yield self.rows(np.arange(start, min(start + self.INT8_BLOCK, len(self.matrix))))
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def distances(self, encodings, rows=None):
+        """Return the (N x M) euclidean distance matrix for N query encodings,
+        against all M known rows or only the given matrix rows"""
+        sq_norms = self.sq_norms if rows is None else self.sq_norms[rows]
+        queries = np.asarray(encodings, dtype=np.float64).reshape(-1, self.matrix.shape[1])
+        q32 = queries.astype(np.float32)
+        if rows is not None:
+            dots = q32 @ self.rows(rows).T
+        elif self.scales is not None:
+            dots = self._int8_dots(q32)
+        else:
+            dots = q32 @ self.matrix.T
+        sq = sq_norms[None, :] + np.einsum("ij,ij->i", q32, q32)[:, None] - 2.0 * dots
+        dist = np.sqrt(np.maximum(sq, 0.0))
+
+        qi, ri = np.nonzero(np.abs(dist - self.tolerance) < self.EXACT_BAND)
+        if len(qi):
+            known_rows = ri if rows is None else np.asarray(rows)[ri]
+            diff = self.rows(known_rows).astype(np.float64) - queries[qi]
+            dist[qi, ri] = np.linalg.norm(diff, axis=1)
+        return dist
+
+    def _int8_dots(self, queries):
+        """queries @ rows.T for an int8 matrix without dequantizing it: each
+        block of rows is only converted to float32, and the row scales are
+        applied to the products"""
+        dots = np.empty((len(queries), len(self.matrix)), dtype=np.float32)
+        converted = np.empty((min(self.INT8_BLOCK, len(self.matrix)), self.matrix.shape[1]),
+                             dtype=np.float32)
+        for start in range(0, len(self.matrix), self.INT8_BLOCK):
+            block = self.matrix[start:start + self.INT8_BLOCK]
+            np.copyto(converted[:len(block)], block)
+            np.matmul(queries, converted[:len(block)].T, out=dots[:, start:start + len(block)])
+        dots *= self.scales
+        return dots
+
+    def match(self, encodings):
+        """Return a (name, distance, votes) tuple for every query encoding.
+
+        distance is the closest distance to the returned identity (or to any
+        known face for "Unknown"), and None when the gallery is empty.
+        """
+        if len(encodings) == 0:
+            return []
+        if len(self) == 0:
+            return [(UNKNOWN_NAME, None, 0)] * len(encodings)
+        if self.index is not None:
+            return [self._match_candidates(query) for query in encodings]
+
+        dist = self.distances(encodings)
+        matches = dist <= self.tolerance
+        starts = self.offsets[:-1]
+
+        votes = np.add.reduceat(matches.astype(np.int32), starts, axis=1)
+        first_hit = np.minimum.reduceat(
+            np.where(matches, self.row_index[None, :], len(self)), starts, axis=1
+        )
+        best_dist = np.minimum.reduceat(dist, starts, axis=1)
+
+        top_votes = votes.max(axis=1)
+        tie_key = np.where(votes == top_votes[:, None], first_hit, len(self) + 1)
+        winners = np.argmin(tie_key, axis=1)
+
+        results = []
+        for q, winner in enumerate(winners):
+            if top_votes[q] == 0:
+                results.append((UNKNOWN_NAME, float(dist[q].min()), 0))
+            else:
+                results.append((self.identities[winner], float(best_dist[q, winner]), int(top_votes[q])))
+        return results
+
+    def _match_candidates(self, query):
+        """The same vote as match(), over the rows the index proposes"""
+        query = np.asarray(query, dtype=np.float64)
+        rows = self.index.candidates(query.astype(np.float32))
+        if len(rows) == 0:
+            return (UNKNOWN_NAME, None, 0)
+        dist = self.distances(query, rows)[0]
+        hits = dist <= self.tolerance
+        if not hits.any():
+            return (UNKNOWN_NAME, float(dist.min()), 0)
+
+        hit_identity = self.row_identity[rows[hits]]
+        hit_order = self.row_index[rows[hits]]
+        identities, votes = np.unique(hit_identity, return_counts=True)
+        tied = identities[votes == votes.max()]
+        # Among equal votes the name matched first in database order wins
+        first_hit = [hit_order[hit_identity == identity].min() for identity in tied]
+        winner = tied[int(np.argmin(first_hit))]
+        best = dist[self.row_identity[rows] == winner].min()
+        return (self.identities[winner], float(best), int(votes.max()))
+
+
+def _reopen_matcher(path, tolerance, n_probe, centroids=None):
+    matcher = GalleryMatcher.from_file(path, tolerance)
+    if n_probe:
+        matcher.build_index(n_probe, centroids=centroids)
+    return matcher
@@ -1,3 +1,4 @@
+import argparse
 import sys
 from PyQt5.QtWidgets import QApplication, QTabWidget, QMainWindow, QVBoxLayout, QWidget
 from face_register import FaceRegisterTab
@@ -9,7 +10,8 @@ import cv2
 import time
 
 class MainApp(QMainWindow):
-    def __init__(self):
+    def __init__(self, backend="thread", ann_probe=None, use_prototypes=False, gallery_file=None,
+                 matcher_storage="float32"):
         super().__init__()
         self.setWindowTitle("Face Recognition System")
         self.setGeometry(100, 100, 1200, 900)
@@ -21,7 +23,10 @@ class MainApp(QMainWindow):
         tabs.addTab(FaceRegisterTab(), "Register Faces")
         
         # Create face tracking tab
-        self.face_tracking_tab = FaceTrackingTab()
+        self.face_tracking_tab = FaceTrackingTab(backend=backend, ann_probe=ann_probe,
+                                                 use_prototypes=use_prototypes,
+                                                 gallery_file=gallery_file,
+                                                 matcher_storage=matcher_storage)
         tabs.addTab(self.face_tracking_tab, "Track Faces")
         
         # Create performance tab
@@ -49,6 +54,13 @@ class MainApp(QMainWindow):
         
         self.setCentralWidget(tabs)
 
+    def closeEvent(self, event):
+        # Child tabs get no closeEvent of their own; running QThreads and
+        # worker processes must be stopped before Qt tears the window down
+        self.graph_timer.stop()
+        self.face_tracking_tab.shutdown()
+        event.accept()
+
     def update_performance_graphs(self, total_faces, correct_matches):
         """Update performance graph with face recognition metrics"""
         self.performance_graph.update_accuracy(total_faces, correct_matches)
@@ -58,9 +70,32 @@ class MainApp(QMainWindow):
 def get_main_app():
     return MainApp()
 
+
+def parse_args(argv=None):
+    """(app options, remaining arguments); the remaining ones, such as
+    -style, are left for QApplication"""
+    parser = argparse.ArgumentParser(description="Multi-threaded face recognition")
+    parser.add_argument("--processes", action="store_true",
+                        help="run recognition in worker processes instead of threads")
+    parser.add_argument("--ann-probe", type=int, metavar="N",
+                        help="match large galleries through an index probing N partitions")
+    parser.add_argument("--prototypes", action="store_true",
+                        help="match against per-person prototypes (see prototypes.py)")
+    parser.add_argument("--gallery-file", metavar="PATH",
+                        help="memory-map a gallery snapshot (see export_gallery.py)")
+    parser.add_argument("--int8", action="store_true", help="keep the known faces quantized in memory")
+    args, qt_args = parser.parse_known_args(argv)
+    if args.ann_probe is not None and args.ann_probe < 1:
+        parser.error("--ann-probe must be at least 1")
+    return args, qt_args
+
+
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    window = MainApp()
+    args, qt_args = parse_args()
+    app = QApplication(sys.argv[:1] + qt_args)
+    window = MainApp(backend="process" if args.processes else "thread", ann_probe=args.ann_probe,
+                     use_prototypes=args.prototypes, gallery_file=args.gallery_file,
+                     matcher_storage="int8" if args.int8 else "float32")
     window.setWindowTitle("Multi-Threaded Face Recognition")
 
     window.show()
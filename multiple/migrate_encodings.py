@@ -0,0 +1,160 @@
+# migrate_encodings.py
+"""Convert the encodings stored in faces.db between float64, float32 and
+int8 (one float32 scale per vector), and report how often matching against
+the converted gallery agrees with matching against the table as it is now:
+
+    python -m migrate_encodings --to float32 --dry-run
+    python -m migrate_encodings --to int8
+
+The report matches perturbed copies of the stored encodings twice.  The
+reference is an exact float64 vote over the encodings currently stored, so
+for a table that is already float32 or int8 it measures the change from
+that storage, not from the original float64 encodings.  The candidate is
+what a tracker would run after the migration: the converted rows loaded
+through GalleryStore and its GalleryMatcher, int8 rows and scales for
+--matcher int8 (the tab's --int8).  A copy of the database is kept as faces.db.bak unless
+--no-backup is given.  New registrations follow the format of the newest
+row, so they keep using the migrated format.  The rows keep their ids, so
+the migration bumps the gallery generation: running trackers reload the
+whole gallery and gallery files made before it count as out of date.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+
+import numpy as np
+
+from gallery import (GalleryStore, ENCODING_STORAGES, UNKNOWN_NAME, encode_encoding, decode_encoding,
+                     blob_storage, bump_gallery_generation)
+
+
+def exact_match(encodings, names, probes, tolerance=0.5):
+    """The compare_faces + dict vote in float64, one (name, distance, votes)
+    tuple per probe: the most rows within tolerance wins, ties going to the
+    name matched first in database order"""
+    encodings = np.asarray(encodings, dtype=np.float64)
+    name_array = np.asarray(names, dtype=object)
+    results = []
+    for probe in probes:
+        dist = np.linalg.norm(encodings - probe, axis=1)
+        counts = {}
+        for i in np.flatnonzero(dist <= tolerance):
+            counts[names[i]] = counts.get(names[i], 0) + 1
+        if not counts:
+            results.append((UNKNOWN_NAME, float(dist.min()), 0))
+            continue
+        name = max(counts, key=counts.get)
+        results.append((name, float(dist[name_array == name].min()), counts[name]))
+    return results
+
+
+def runtime_matcher(names, blobs, storage="float32", tolerance=0.5):
+    """The GalleryMatcher a tracker builds from these rows, through
+    GalleryStore with the given matcher storage"""
+    with tempfile.TemporaryDirectory() as folder:
+        db_path = os.path.join(folder, "faces.db")
+        with sqlite3.connect(db_path) as conn:
+            conn.execute("CREATE TABLE faces (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                         "name TEXT, encoding BLOB)")
+            conn.executemany("INSERT INTO faces (name, encoding) VALUES (?, ?)", zip(names, blobs))
+        conn.close()
+        store = GalleryStore(db_path, storage=storage)
+        store.refresh()
+        store.close()
+    return store.matcher(tolerance)
+
+
+def agreement_report(encodings, names, blobs, matcher_storage="float32", queries=1000, noise=0.03,
+                     tolerance=0.5, seed=0):
+    """Compare an exact float64 vote over the stored encodings with the
+    runtime matcher built from the converted blobs"""
+    encodings = np.asarray(encodings, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(encodings), queries)
+    probes = encodings[picks] + rng.normal(0.0, noise, (queries, encodings.shape[1]))
+
+    reference = exact_match(encodings, names, probes, tolerance)
+    matcher = runtime_matcher(names, blobs, matcher_storage, tolerance)
+    candidate = matcher.match(probes)
+    labels = np.mean([a[0] == b[0] for a, b in zip(reference, candidate)])
+    votes = np.mean([a[2] == b[2] for a, b in zip(reference, candidate)])
+    dist = np.array([abs(a[1] - b[1]) for a, b in zip(reference, candidate)])
+    return {
+        "queries": queries,
+        "label_agreement": float(labels),
+        "vote_agreement": float(votes),
+        "mean_distance_error": float(dist.mean()),
+        "max_distance_error": float(dist.max()),
+        # Row error of what the matcher holds, in its own (id) order
+        "max_encoding_error": float(np.abs(matcher.rows()[np.argsort(matcher.row_index)]
+                                           - encodings).max()),
+    }
+
+
+def migrate(db_path, storage, dry_run=False, backup=True, queries=1000, noise=0.03,
+            matcher_storage=None):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT id, name, encoding FROM faces ORDER BY id").fetchall()
+    if not rows:
+        conn.close()
+        return None
+
+    names = [name for _, name, _ in rows]
+    encodings = [decode_encoding(blob) for _, _, blob in rows]
+    blobs = [encode_encoding(encoding, storage) for encoding in encodings]
+    matcher_storage = matcher_storage or ("int8" if storage == "int8" else "float32")
+    report = agreement_report(encodings, names, blobs, matcher_storage, queries, noise)
+    report["from"] = sorted({blob_storage(blob) for _, _, blob in rows})
+    report["to"] = storage
+    report["matcher"] = matcher_storage
+    report["bytes_before"] = sum(len(blob) for _, _, blob in rows)
+    report["bytes_after"] = sum(len(blob) for blob in blobs)
+
+    if not dry_run:
+        if backup:
+            with sqlite3.connect(db_path + ".bak") as copy:
+                conn.backup(copy)
+        with conn:
+            conn.executemany("UPDATE faces SET encoding = ? WHERE id = ?",
+                             [(blob, row_id) for blob, (row_id, _, _) in zip(blobs, rows)])
+            bump_gallery_generation(conn)
+        conn.execute("VACUUM")
+    conn.close()
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Change how face encodings are stored in faces.db")
+    parser.add_argument("--db", default="faces.db", help="face database (default: faces.db)")
+    parser.add_argument("--to", choices=ENCODING_STORAGES, required=True, help="storage to convert to")
+    parser.add_argument("--matcher", choices=("float32", "int8"),
+                        help="matcher storage the report runs, as the tab's --int8 "
+                             "(default: int8 for --to int8, float32 otherwise)")
+    parser.add_argument("--dry-run", action="store_true", help="only print the agreement report")
+    parser.add_argument("--no-backup", action="store_true", help="do not keep a .bak copy")
+    parser.add_argument("--queries", type=int, default=1000, help="perturbed encodings matched for the report")
+    parser.add_argument("--noise", type=float, default=0.03, help="standard deviation of the perturbation")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = migrate(args.db, args.to, args.dry_run, not args.no_backup, args.queries, args.noise,
+                     args.matcher)
+    if report is None:
+        print("No encodings stored", file=sys.stderr)
+        return 0
+    print(f"{'Would convert' if args.dry_run else 'Converted'} {'/'.join(report['from'])} -> {report['to']}: "
+          f"{report['bytes_before']} -> {report['bytes_after']} bytes of encodings", file=sys.stderr)
+    print(f"Match agreement with an exact float64 vote over the stored encodings "
+          f"({report['matcher']} matcher, {report['queries']} queries): "
+          f"labels {report['label_agreement']:.2%}, votes {report['vote_agreement']:.2%}, "
+          f"distance error mean {report['mean_distance_error']:.2e} max {report['max_distance_error']:.2e}",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
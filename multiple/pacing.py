@@ -0,0 +1,78 @@
+import time
+from collections import deque
+
+REALTIME = "realtime"
+EVERY_FRAME = "every_frame"
+PACING_MODES = (REALTIME, EVERY_FRAME)
+
+
+class FramePacer:
+    """Schedules the frames of one video against its source frame rate.
+
+    In REALTIME mode frame n is due n / source_fps seconds after start(), and
+    frames that are already late are skipped so playback stays in sync with
+    the wall clock.  In EVERY_FRAME mode nothing is skipped and nothing waits:
+    frames go as fast as they can be processed.
+    """
+
+    def __init__(self, source_fps, mode=REALTIME, window=30):
+        # CAP_PROP_FPS is 0 (or NaN) for some containers and streams
+        self.source_fps = source_fps if source_fps and source_fps > 0 else 30.0
+        self.mode = mode
+        self.started = None
+        self.next_index = 0  # source index of the next frame to read
+        self.skipped = 0
+        self.processed = 0
+        self._recent = deque(maxlen=window)
+
+    def start(self, now=None):
+        self.started = time.perf_counter() if now is None else now
+
+    def set_mode(self, mode, now=None):
+        now = time.perf_counter() if now is None else now
+        # Re-anchor the clock so switching to realtime does not skip
+        # everything that was processed slower than real time
+        if self.started is not None:
+            self.started = now - self.next_index / self.source_fps
+        self.mode = mode
+
+    def wait_seconds(self, now=None):
+        """Time until the next frame is due, 0 if it is due already"""
+        if self.mode != REALTIME or self.started is None:
+            return 0.0
+        now = time.perf_counter() if now is None else now
+        return max(0.0, self.started + self.next_index / self.source_fps - now)
+
+    def frames_to_skip(self, now=None):
+        """Number of late frames to drop before reading the next one"""
+        if self.mode != REALTIME or self.started is None:
+            return 0
+        now = time.perf_counter() if now is None else now
+        due = int((now - self.started) * self.source_fps)
+        return max(0, due - self.next_index)
+
+    def frame_read(self, skipped=0):
+        self.next_index += skipped + 1
+        self.skipped += skipped
+
+    def frame_done(self, now=None):
+        """Record that a frame finished processing and was shown"""
+        self.processed += 1
+        self._recent.append(time.perf_counter() if now is None else now)
+
+    def achieved_fps(self):
+        """Processed frames per second over the last few frames"""
+        if len(self._recent) < 2 or self._recent[-1] == self._recent[0]:
+            return 0.0
+        return (len(self._recent) - 1) / (self._recent[-1] - self._recent[0])
+
+    def average_fps(self, now=None):
+        """Processed frames per second since start()"""
+        if self.started is None:
+            return 0.0
+        elapsed = (time.perf_counter() if now is None else now) - self.started
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def describe(self, fps=None):
+        fps = self.achieved_fps() if fps is None else fps
+        return f"{fps:.1f} / {self.source_fps:.1f} fps"
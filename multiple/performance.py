@@ -24,10 +24,30 @@ class SystemMonitorGraph(QGraphicsView):
         self.total_system_memory = psutil.virtual_memory().total / (1024 ** 2)  # Convert to MB
         
         # Initialize CPU tracking variables
-        self.last_cpu_times = self.process.cpu_times()
+        self.last_cpu_times = self.process_tree_cpu_time()
         self.last_update_time = time.time()
         
         self.draw_axes()
+
+    def process_tree_cpu_time(self):
+        # Include live worker processes, otherwise a process-pool backend
+        # would look idle; reaped children are already in children_user/system
+        total = sum(self.process.cpu_times())
+        for child in self.process.children(recursive=True):
+            try:
+                total += sum(child.cpu_times()[:2])
+            except psutil.NoSuchProcess:
+                pass
+        return total
+
+    def process_tree_uss(self):
+        total = self.process.memory_full_info().uss
+        for child in self.process.children(recursive=True):
+            try:
+                total += child.memory_full_info().uss
+            except psutil.NoSuchProcess:
+                pass
+        return total
         
     def draw_axes(self):
         self.scene.clear()
@@ -52,12 +72,12 @@ class SystemMonitorGraph(QGraphicsView):
     def update_data(self):
         try:
             # Get current CPU times and calculate usage
-            current_cpu_times = self.process.cpu_times()
+            current_cpu_times = self.process_tree_cpu_time()
             now = time.time()
             time_elapsed = now - self.last_update_time
             
             # Calculate CPU percentage (total across all cores)
-            cpu_time_elapsed = sum(current_cpu_times) - sum(self.last_cpu_times)
+            cpu_time_elapsed = current_cpu_times - self.last_cpu_times
             cpu_percent = (cpu_time_elapsed / time_elapsed) * 100 if time_elapsed > 0 else 0
             
             # Update tracking variables
@@ -65,8 +85,7 @@ class SystemMonitorGraph(QGraphicsView):
             self.last_update_time = now
             
             # Get process memory (USS - Unique Set Size)
-            mem = self.process.memory_full_info()
-            mem_mb = mem.uss / (1024 ** 2)  # Convert to MB for calculation
+            mem_mb = self.process_tree_uss() / (1024 ** 2)  # Convert to MB for calculation
             # Convert to percentage of total system memory
             mem_percent = (mem_mb / self.total_system_memory) * 100
             
@@ -0,0 +1,262 @@
+import multiprocessing as mp
+import pickle
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+from PyQt5.QtCore import QObject, QThread, pyqtSignal
+
+from gallery import GalleryMatcher
+from frame_queue import FrameQueue
+from recognition import PROBE_INTERVAL
+
+
+def _attach(name):
+    shm = shared_memory.SharedMemory(name=name)
+    # The parent owns and unlinks every segment; without this the child's
+    # resource tracker would also try to clean it up on exit
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def _worker_main(worker_id, task_queue, result_queue):
+    """Worker process loop: dlib models are loaded once, on first import"""
+    from recognition import recognize_frame
+    from track_cache import TrackCache
+
+    matcher = GalleryMatcher([], [])
+    # Each process keeps its own track caches; with the cache on, the pool
+    # sends every frame of a feed to the same process (see takes_feed)
+    track_caches = {}
+    shm = None
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        if task[0] == "matcher":
+            try:
+                matcher = pickle.loads(task[1])
+            except Exception:
+                # Keep matching against the previous gallery
+                traceback.print_exc()
+            continue
+        if task[0] == "reset":
+            track_caches.pop(task[1], None)
+            continue
+
+        _, shm_name, shape, index, seq, queued_at, scale, use_track_cache = task
+        frame = None
+        try:
+            if shm is None or shm.name != shm_name:
+                if shm is not None:
+                    shm.close()
+                    shm = None
+                shm = _attach(shm_name)
+
+            # The frame arrives as BGR in the worker's slot and goes back as
+            # annotated RGB in the same slot
+            frame = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+            track_cache = track_caches.setdefault(index, TrackCache()) if use_track_cache else None
+            rgb, detections, detect_seconds, recall = recognize_frame(
+                frame, matcher, scale, probe=seq % PROBE_INTERVAL == 0,
+                track_cache=track_cache, seq=seq
+            )
+            frame[...] = rgb
+            detections = [(tuple(int(v) for v in box), name, distance, votes)
+                          for box, name, distance, votes in detections]
+            error = None
+        except Exception:
+            # A result always goes back, or the worker would never be given
+            # another frame
+            detections, detect_seconds, recall = [], 0.0, None
+            error = traceback.format_exc()
+        finally:
+            del frame  # the slot cannot be closed while a view of it exists
+        result_queue.put((worker_id, index, seq, queued_at, detections, detect_seconds, recall, error))
+
+    if shm is not None:
+        shm.close()
+
+
+class _DispatchThread(QThread):
+    """Hands queued frames to one worker process through shared memory,
+    whenever the worker is idle"""
+
+    def __init__(self, pool, worker_id):
+        super().__init__()
+        self.pool = pool
+        self.worker_id = worker_id
+
+    def run(self):
+        pool = self.pool
+        worker_id = self.worker_id
+        idle = pool.idle[worker_id]
+        while True:
+            idle.wait()
+            idle.clear()
+            item = pool.queue.get(lambda index: pool.takes_feed(worker_id, index))
+            if item is None:
+                return
+            index, seq, frame, queued_at = item
+            shm = pool.slot_for(worker_id, frame.nbytes)
+            np.ndarray(frame.shape, dtype=np.uint8, buffer=shm.buf)[...] = frame
+            pool.shapes[worker_id] = frame.shape
+            pool.task_queues[worker_id].put(("frame", shm.name, frame.shape, index, seq, queued_at,
+                                             pool.detection_scales[index], pool.use_track_cache))
+
+
+class _CollectThread(QThread):
+    frame_processed = pyqtSignal(int, int, np.ndarray)  # index, seq, rgb
+    detections_ready = pyqtSignal(int, int, list)  # index, seq, [(box, name, distance, votes)]
+    performance_data = pyqtSignal(int, int, float)  # total_faces, correct_matches, processing_time
+    detection_stats = pyqtSignal(int, float, int, float)  # index, detect_seconds, faces, recall (-1 if not probed)
+
+    def __init__(self, pool):
+        super().__init__()
+        self.pool = pool
+
+    def run(self):
+        pool = self.pool
+        while True:
+            result = pool.result_queue.get()
+            if result is None:
+                return
+            worker_id, index, seq, queued_at, detections, detect_seconds, recall, error = result
+            if error is not None:
+                pool.idle[worker_id].set()
+                print(f"Recognition failed on feed {index}, frame {seq}:\n{error}", file=sys.stderr)
+                # Releases a keyframe waiting on this frame
+                self.detections_ready.emit(index, seq, [])
+                continue
+            shape = pool.shapes[worker_id]
+            shm = pool.slots[worker_id]
+            rgb = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf).copy()
+            pool.idle[worker_id].set()
+
+            correct_matches = sum(1 for _, _, _, votes in detections if votes > 0)
+            self.frame_processed.emit(index, seq, rgb)
+            self.detections_ready.emit(index, seq, detections)
+            self.performance_data.emit(len(detections), correct_matches, time.time() - queued_at)
+            self.detection_stats.emit(index, detect_seconds, len(detections),
+                                      -1.0 if recall is None else recall)
+
+
+class ProcessRecognitionPool(QObject):
+    """Drop-in alternative to RecognitionPool that runs recognition in
+    separate processes, so detection, colour conversion, matching and
+    drawing all scale past the GIL.
+    """
+    frame_processed = pyqtSignal(int, int, np.ndarray)
+    detections_ready = pyqtSignal(int, int, list)
+    performance_data = pyqtSignal(int, int, float)
+    detection_stats = pyqtSignal(int, float, int, float)
+
+    def __init__(self, num_feeds, num_workers=None, capacity=2):
+        super().__init__()
+        ctx = mp.get_context("spawn")
+        self.num_workers = num_workers or ctx.cpu_count()
+        self.queue = FrameQueue(num_feeds, capacity)
+        self.matcher = GalleryMatcher([], [])
+        self.detection_scales = [1.0] * num_feeds
+        self.use_track_cache = False
+        # Gallery files the workers map; written by the GalleryWatcher
+        self.snapshot_dir = tempfile.mkdtemp(prefix="gallery-")
+
+        self.idle = [threading.Event() for _ in range(self.num_workers)]
+        self.slots = [None] * self.num_workers
+        self.shapes = [None] * self.num_workers
+        self.result_queue = ctx.Queue()
+        self.task_queues = []
+        self.processes = []
+        for worker_id in range(self.num_workers):
+            task_queue = ctx.Queue()
+            process = ctx.Process(target=_worker_main,
+                                  args=(worker_id, task_queue, self.result_queue),
+                                  daemon=True)
+            process.start()
+            self.task_queues.append(task_queue)
+            self.processes.append(process)
+            self.idle[worker_id].set()
+
+        self.collector = _CollectThread(self)
+        self.collector.frame_processed.connect(self.frame_processed)
+        self.collector.detections_ready.connect(self.detections_ready)
+        self.collector.detection_stats.connect(self.detection_stats)
+        self.collector.performance_data.connect(self.performance_data)
+        self.collector.start()
+        self.dispatchers = [_DispatchThread(self, worker_id) for worker_id in range(self.num_workers)]
+        for dispatcher in self.dispatchers:
+            dispatcher.start()
+
+    def slot_for(self, worker_id, nbytes):
+        """Return the worker's shared memory slot, growing it if needed"""
+        shm = self.slots[worker_id]
+        if shm is None or shm.size < nbytes:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            self.slots[worker_id] = shm
+        return shm
+
+    def set_matcher(self, matcher):
+        """Send the gallery to every worker.  A matcher opened from a
+        gallery file, as GalleryWatcher publishes them into snapshot_dir,
+        costs the workers a path instead of a pickled copy of every row."""
+        self.matcher = matcher
+        # Unpickled by the worker itself, where a failure can be caught
+        data = pickle.dumps(matcher)
+        for task_queue in self.task_queues:
+            task_queue.put(("matcher", data))
+
+    def set_detection_scale(self, index, scale):
+        self.detection_scales[index] = scale
+
+    def takes_feed(self, worker_id, index):
+        """Whether the worker may be given the feed's frames.  Each process
+        has its own track caches, so with the track cache on every feed
+        sticks to one worker and its cache sees all of the feed's frames."""
+        return not self.use_track_cache or index % self.num_workers == worker_id
+
+    def set_track_cache_enabled(self, enabled):
+        self.use_track_cache = enabled
+        self.queue.wake()
+
+    def reset_feed(self, index):
+        self.queue.clear(index)
+        for task_queue in self.task_queues:
+            task_queue.put(("reset", index))
+
+    def set_policy(self, index, policy):
+        self.queue.set_policy(index, policy)
+
+    def submit(self, index, seq, frame):
+        return self.queue.put(index, seq, frame)
+
+    def dropped(self, index):
+        return self.queue.dropped[index]
+
+    def stop(self):
+        self.queue.close()
+        for idle in self.idle:
+            idle.set()
+        for dispatcher in self.dispatchers:
+            dispatcher.wait()
+        for task_queue in self.task_queues:
+            task_queue.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.result_queue.put(None)
+        self.collector.wait()
+        for shm in self.slots:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        shutil.rmtree(self.snapshot_dir, ignore_errors=True)
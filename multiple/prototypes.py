@@ -0,0 +1,116 @@
+# prototypes.py
+"""Compact gallery: a few prototype encodings per person instead of every
+registered crop.
+
+Each name's rows in the faces table are reduced to their centroid plus up
+to --medoids medoids (real encodings nearest the k-means cluster centres).
+The result goes into a prototypes table next to faces; the raw rows are
+left untouched so prototypes can be rebuilt at any time:
+
+    python -m prototypes --db faces.db --medoids 3
+    python -m prototypes --names alice bob
+
+Run the tracker with --prototypes to match against them.
+"""
+import argparse
+import sqlite3
+import sys
+
+import numpy as np
+
+from gallery import kmeans, encode_encoding, decode_encoding, table_storage
+
+CENTROID = "centroid"
+MEDOID = "medoid"
+
+
+def create_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS prototypes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            encoding BLOB NOT NULL,
+            kind TEXT NOT NULL,
+            members INTEGER NOT NULL
+        )
+    """)
+
+
+def compute_prototypes(encodings, medoids=3, seed=0):
+    """Return [(kind, encoding, members)] for one person's encodings.
+
+    members is the number of raw rows the prototype stands for.
+    """
+    encodings = np.asarray(encodings, dtype=np.float64)
+    prototypes = [(CENTROID, encodings.mean(axis=0), len(encodings))]
+    k = min(medoids, len(encodings))
+    if k == 0:
+        return prototypes
+
+    centres, labels = kmeans(encodings, k, seed=seed)
+    for cluster, centre in enumerate(centres):
+        members = np.flatnonzero(labels == cluster)
+        if len(members) == 0:
+            continue
+        closest = members[np.argmin(np.linalg.norm(encodings[members] - centre, axis=1))]
+        prototypes.append((MEDOID, encodings[closest], len(members)))
+    return prototypes
+
+
+def rebuild_prototypes(db_path="faces.db", medoids=3, names=None):
+    """Replace the prototypes of the given names (default: everyone) from the
+    raw faces rows.  Returns (people, raw rows, prototypes written)."""
+    conn = sqlite3.connect(db_path)
+    create_table(conn)
+    if names:
+        placeholders = ",".join("?" * len(names))
+        rows = conn.execute(
+            f"SELECT name, encoding FROM faces WHERE name IN ({placeholders}) ORDER BY id", names
+        ).fetchall()
+    else:
+        rows = conn.execute("SELECT name, encoding FROM faces ORDER BY id").fetchall()
+
+    # Keep first-registered order so tie-breaks follow the faces table
+    by_name = {}
+    for name, blob in rows:
+        by_name.setdefault(name, []).append(decode_encoding(blob))
+
+    # Prototypes are stored the same way as the raw rows
+    storage = table_storage(conn)
+    written = 0
+    with conn:
+        if names:
+            conn.execute(f"DELETE FROM prototypes WHERE name IN ({placeholders})", names)
+        else:
+            conn.execute("DELETE FROM prototypes")
+        for name, encodings in by_name.items():
+            for kind, encoding, members in compute_prototypes(encodings, medoids):
+                conn.execute(
+                    "INSERT INTO prototypes (name, encoding, kind, members) VALUES (?, ?, ?, ?)",
+                    (name, encode_encoding(encoding, storage), kind, members)
+                )
+                written += 1
+    conn.close()
+    return len(by_name), len(rows), written
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild per-person prototype encodings from faces.db")
+    parser.add_argument("--db", default="faces.db", help="face database (default: faces.db)")
+    parser.add_argument("--medoids", type=int, default=3,
+                        help="medoids kept per person in addition to the centroid")
+    parser.add_argument("--names", nargs="+", help="only rebuild these people")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    people, raw, written = rebuild_prototypes(args.db, args.medoids, args.names)
+    ratio = raw / written if written else 0.0
+    print(f"{people} people: {raw} raw encodings -> {written} prototypes ({ratio:.1f}x smaller)",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+import cv2
+import numpy as np
+
+# Where the sharpness and size parts of the score reach about 1
+SHARPNESS_REF = 100.0  # variance of the Laplacian of a reasonably sharp crop
+SIZE_REF = 80  # face box side in pixels
+
+
+def sharpness(crop):
+    """Variance of the Laplacian: higher for sharper crops"""
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+def frontalness(landmarks):
+    """1.0 for a frontal face, falling to 0 as it turns to profile, from how
+    far the nose tip sits from the midpoint between the eyes.  None without
+    eye and nose landmarks."""
+    try:
+        left = np.mean(landmarks["left_eye"], axis=0)
+        right = np.mean(landmarks["right_eye"], axis=0)
+        nose = np.mean(landmarks["nose_tip"], axis=0)
+    except (KeyError, TypeError, ValueError):
+        return None
+    axis = right - left
+    half = np.linalg.norm(axis) / 2
+    if half == 0:
+        return 0.0
+    offset = abs(np.dot(nose - (left + right) / 2, axis / (2 * half)))
+    return float(max(0.0, 1.0 - offset / half))
+
+
+def face_quality(crop, box, landmarks=None):
+    """Quality measures of one crop and their combined score in [0, 1]"""
+    top, right, bottom, left = box
+    size = min(bottom - top, right - left)
+    sharp = sharpness(crop)
+    frontal = frontalness(landmarks) if landmarks else None
+    brightness = float(crop.mean())
+    exposure = max(0.0, 1.0 - abs(brightness - 128.0) / 128.0)
+    score = (sharp / (sharp + SHARPNESS_REF) * min(1.0, size / SIZE_REF)
+             * (1.0 if frontal is None else frontal) * exposure)
+    return {"sharpness": sharp, "size": size, "frontal": frontal,
+            "brightness": brightness, "score": score}
+
+
+class QualityCheck:
+    """Thresholds a crop's face_quality() must meet to be kept.  The
+    defaults accept everything; frontal is only checked when landmarks
+    were found."""
+
+    def __init__(self, min_sharpness=0.0, min_size=0, min_frontal=0.0,
+                 min_brightness=0.0, max_brightness=255.0):
+        self.min_sharpness = min_sharpness
+        self.min_size = min_size
+        self.min_frontal = min_frontal
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+
+    def accepts(self, quality):
+        return (quality["sharpness"] >= self.min_sharpness
+                and quality["size"] >= self.min_size
+                and (quality["frontal"] is None or quality["frontal"] >= self.min_frontal)
+                and self.min_brightness <= quality["brightness"] <= self.max_brightness)
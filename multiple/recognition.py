@@ -0,0 +1,135 @@
+import time
+
+import cv2
+import face_recognition
+import numpy as np
+
+from crops import crop_face_box
+
+MATCH_COLOR = (0, 255, 0)
+UNKNOWN_COLOR = (255, 0, 0)
+
+# Scaled feeds re-run full resolution detection on every PROBE_INTERVAL-th
+# frame to measure how many faces the smaller image misses
+PROBE_INTERVAL = 30
+
+
+def _rescale_box(box, scale, height, width):
+    top, right, bottom, left = box
+    return (max(0, int(round(top / scale))), min(width, int(round(right / scale))),
+            min(height, int(round(bottom / scale))), max(0, int(round(left / scale))))
+
+
+def detect_faces(rgb, scale=1.0):
+    """Run HOG detection on a copy resized by `scale` and return boxes in
+    full resolution (top, right, bottom, left) coordinates"""
+    if scale >= 1.0:
+        return face_recognition.face_locations(rgb)
+    small = cv2.resize(rgb, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    height, width = rgb.shape[:2]
+    return [_rescale_box(box, scale, height, width) for box in face_recognition.face_locations(small)]
+
+
+def match_faces(rgb, boxes, matcher):
+    """Encode the given boxes at full resolution and match them.
+
+    Returns a list of (box, name, distance, votes) with box in
+    face_recognition's (top, right, bottom, left) order.
+    """
+    encs = face_recognition.face_encodings(rgb, boxes)
+    return [(box, name, distance, votes)
+            for box, (name, distance, votes) in zip(boxes, matcher.match(encs))]
+
+
+def match_faces_cached(rgb, boxes, matcher, track_cache, seq):
+    """Like match_faces, but only encodes boxes whose track has no reusable
+    identity in track_cache"""
+    track_ids, results = track_cache.assign(seq, boxes)
+    todo = [i for i, result in enumerate(results) if result is None]
+    encs = face_recognition.face_encodings(rgb, [boxes[i] for i in todo])
+    for i, enc, result in zip(todo, encs, matcher.match(encs)):
+        track_cache.store(seq, track_ids[i], boxes[i], enc, result)
+        results[i] = result
+    return [(box, name, distance, votes)
+            for box, (name, distance, votes) in zip(boxes, results)]
+
+
+def encode_image_file(path, crop_margin=None, face_box=None):
+    """Load an image file and encode every face in it.  Top level so that
+    registration can run it in worker processes.
+
+    With face_box (a location inside the image) or crop_margin the file is
+    taken to be a face crop, and the face inside it is encoded without
+    running detection; face_box wins when both are given.
+    """
+    if path.lower().endswith(".npy"):
+        # Raw crops are saved as BGR arrays
+        img = cv2.cvtColor(np.load(path), cv2.COLOR_BGR2RGB)
+    else:
+        img = face_recognition.load_image_file(path)
+    if face_box is None and crop_margin is None:
+        return face_recognition.face_encodings(img)
+    if face_box is None:
+        height, width = img.shape[:2]
+        face_box = crop_face_box(height, width, crop_margin)
+    return face_recognition.face_encodings(img, [tuple(face_box)])
+
+
+def detect_and_match(rgb, matcher, scale=1.0):
+    return match_faces(rgb, detect_faces(rgb, scale), matcher)
+
+
+def box_iou(a, b):
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    inter = max(0, right - left) * max(0, bottom - top)
+    area_a = (a[1] - a[3]) * (a[2] - a[0])
+    area_b = (b[1] - b[3]) * (b[2] - b[0])
+    union = area_a + area_b - inter
+    return inter / union if union > 0 else 0.0
+
+
+def detection_recall(reference_boxes, boxes, threshold=0.5):
+    """Fraction of reference boxes overlapped by some detected box"""
+    if not reference_boxes:
+        return 1.0
+    found = sum(1 for ref in reference_boxes
+                if any(box_iou(ref, box) >= threshold for box in boxes))
+    return found / len(reference_boxes)
+
+
+def draw_detections(rgb, detections):
+    for (top, right, bottom, left), name, distance, votes in detections:
+        box_color = MATCH_COLOR if votes > 0 else UNKNOWN_COLOR
+        cv2.rectangle(rgb, (left, top), (right, bottom), box_color, 2)
+        cv2.putText(rgb, name, (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, box_color, 2)
+
+
+def recognize_frame(frame, matcher, scale=1.0, probe=False, track_cache=None, seq=0, draw=True):
+    """Run the full pipeline on a BGR frame.
+
+    Returns (annotated_rgb, detections, detect_seconds, recall) where recall
+    is measured against full resolution detection when `probe` is set on a
+    scaled frame, and is None otherwise.  With a track_cache, `seq` is the
+    frame's sequence number within its feed.
+    """
+    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    start = time.perf_counter()
+    boxes = detect_faces(rgb, scale)
+    detect_seconds = time.perf_counter() - start
+
+    recall = None
+    if probe and scale < 1.0:
+        recall = detection_recall(face_recognition.face_locations(rgb), boxes)
+
+    if track_cache is None:
+        detections = match_faces(rgb, boxes, matcher)
+    else:
+        detections = match_faces_cached(rgb, boxes, matcher, track_cache, seq)
+    if draw:
+        draw_detections(rgb, detections)
+    return rgb, detections, detect_seconds, recall
+
+
+def count_matches(detections):
+    return sum(1 for _, _, _, votes in detections if votes > 0)
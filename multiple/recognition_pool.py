@@ -0,0 +1,104 @@
+import os
+import sys
+import time
+import traceback
+
+import numpy as np
+from PyQt5.QtCore import QObject, QThread, pyqtSignal
+
+from gallery import GalleryMatcher
+from recognition import recognize_frame, count_matches, PROBE_INTERVAL
+from track_cache import TrackCache
+from frame_queue import FrameQueue
+
+
+class RecognitionWorker(QThread):
+    frame_processed = pyqtSignal(int, int, np.ndarray)  # index, seq, rgb
+    detections_ready = pyqtSignal(int, int, list)  # index, seq, [(box, name, distance, votes)]
+    performance_data = pyqtSignal(int, int, float)  # total_faces, correct_matches, processing_time
+    detection_stats = pyqtSignal(int, float, int, float)  # index, detect_seconds, faces, recall (-1 if not probed)
+
+    def __init__(self, pool):
+        super().__init__()
+        self.pool = pool
+
+    def run(self):
+        while True:
+            item = self.pool.queue.get()
+            if item is None:
+                return
+            index, seq, frame, queued_at = item
+            scale = self.pool.detection_scales[index]
+            track_cache = self.pool.track_caches[index] if self.pool.use_track_cache else None
+            try:
+                rgb, detections, detect_seconds, recall = recognize_frame(
+                    frame, self.pool.matcher, scale, probe=seq % PROBE_INTERVAL == 0,
+                    track_cache=track_cache, seq=seq
+                )
+            except Exception:
+                # One bad frame must not take the worker down with it
+                print(f"Recognition failed on feed {index}, frame {seq}:\n{traceback.format_exc()}",
+                      file=sys.stderr)
+                # Releases a keyframe waiting on this frame
+                self.detections_ready.emit(index, seq, [])
+                continue
+            processing_time = time.time() - queued_at
+            self.frame_processed.emit(index, seq, rgb)
+            self.detections_ready.emit(index, seq, detections)
+            self.performance_data.emit(len(detections), count_matches(detections), processing_time)
+            self.detection_stats.emit(index, detect_seconds, len(detections),
+                                      -1.0 if recall is None else recall)
+
+
+class RecognitionPool(QObject):
+    """Long-lived recognition workers fed by a bounded FrameQueue"""
+    frame_processed = pyqtSignal(int, int, np.ndarray)
+    detections_ready = pyqtSignal(int, int, list)
+    performance_data = pyqtSignal(int, int, float)
+    detection_stats = pyqtSignal(int, float, int, float)
+
+    def __init__(self, num_feeds, num_workers=None, capacity=2):
+        super().__init__()
+        self.num_workers = num_workers or min(num_feeds, os.cpu_count() or 1)
+        self.queue = FrameQueue(num_feeds, capacity)
+        self.matcher = GalleryMatcher([], [])
+        self.detection_scales = [1.0] * num_feeds
+        self.track_caches = [TrackCache() for _ in range(num_feeds)]
+        self.use_track_cache = False
+        self.workers = []
+        for _ in range(self.num_workers):
+            worker = RecognitionWorker(self)
+            worker.frame_processed.connect(self.frame_processed)
+            worker.detections_ready.connect(self.detections_ready)
+            worker.performance_data.connect(self.performance_data)
+            worker.detection_stats.connect(self.detection_stats)
+            worker.start()
+            self.workers.append(worker)
+
+    def set_matcher(self, matcher):
+        self.matcher = matcher
+
+    def set_detection_scale(self, index, scale):
+        self.detection_scales[index] = scale
+
+    def set_track_cache_enabled(self, enabled):
+        self.use_track_cache = enabled
+
+    def reset_feed(self, index):
+        """Forget queued frames and cached tracks when a feed changes video"""
+        self.queue.clear(index)
+        self.track_caches[index].clear()
+
+    def set_policy(self, index, policy):
+        self.queue.set_policy(index, policy)
+
+    def submit(self, index, seq, frame):
+        return self.queue.put(index, seq, frame)
+
+    def dropped(self, index):
+        return self.queue.dropped[index]
+
+    def stop(self):
+        self.queue.close()
+        for worker in self.workers:
+            worker.wait()
@@ -0,0 +1,55 @@
+import cv2
+
+# Gaps at least this long are crossed with a seek instead of grab() calls;
+# a seek restarts decoding at the nearest keyframe, which only pays off
+# when many frames would otherwise be demuxed and decoded for nothing
+SEEK_MIN_GAP = 120
+
+
+def sample_step(interval_frames=1, interval_seconds=None, fps=30.0):
+    """Frames between samples, possibly fractional for time-based sampling"""
+    if interval_seconds is not None:
+        return max(1.0, interval_seconds * (fps or 30.0))
+    return max(1, interval_frames)
+
+
+def first_sample(start_frame, step):
+    """Index k of the first sample k * step at or after start_frame"""
+    k = max(0, int(start_frame // step))
+    while int(round(k * step)) < start_frame:
+        k += 1
+    return k
+
+
+def iter_sampled_frames(cap, step, start_frame=0, end_frame=None, seek_min_gap=SEEK_MIN_GAP):
+    """Yield (frame_index, frame) for frame indices k * step in
+    [start_frame, end_frame) (or until the video ends).
+
+    Samples stay on the same grid whatever start_frame is, so consecutive
+    ranges together sample exactly the frames of the whole video.  Only
+    sampled frames are retrieved: frames in between are skipped with grab(),
+    which never converts them to BGR, and long gaps are seeked over.
+    """
+    position = 0  # index of the frame the next read returns
+    if start_frame:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        position = start_frame
+
+    k = first_sample(start_frame, step)
+    while True:
+        target = int(round(k * step))
+        if end_frame is not None and target >= end_frame:
+            return
+        gap = target - position
+        if gap >= seek_min_gap:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+        else:
+            for _ in range(gap):
+                if not cap.grab():
+                    return
+        ret, frame = cap.read()
+        if not ret:
+            return
+        position = target + 1
+        yield target, frame
+        k += 1
@@ -1,57 +1,81 @@
 import sys
 import os
+import queue
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
 import cv2
-import face_recognition
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                             QLabel, QPushButton, QFileDialog, QProgressBar, QSpinBox,
-                            QMessageBox, QGroupBox, QLineEdit, QFrame)
+                            QMessageBox, QGroupBox, QLineEdit, QFrame, QCheckBox,
+                            QComboBox, QDoubleSpinBox, QListWidget)
 from PyQt5.QtCore import Qt, QThread, pyqtSignal
 from PyQt5.QtGui import QPixmap, QImage, QIcon
 from PyQt5.QtWidgets import QStyleFactory
+from crops import MANIFEST_FILE
+from sampling import sample_step, iter_sampled_frames
+from extraction import (extract_frame, split_frames, extract_chunk, remove_chunks, prepare_output,
+                        write_record, quality_check, init_chunk_worker, chunk_hash, chunk_score,
+                        CHUNKS_PER_PROCESS)
+from crop_writer import CropWriter
+from dedup import make_selector, DEDUP_WINDOW
+from batch_extract import (list_videos, load_batch, read_batch, run_batch, batch_settings,
+                           VIDEO_EXTENSIONS, DONE, FAILED)
+
+CROP_FORMAT_LABELS = [
+    ("JPEG files", "jpg"),
+    ("PNG files", "png"),
+    ("WebP files", "webp"),
+    ("One .tar of JPEGs", "tar"),
+    ("One .npz of raw crops", "npz"),
+]
 
 class ExtractionWorker(QThread):
     update_progress = pyqtSignal(int)
     finished = pyqtSignal(int)
     error_occurred = pyqtSignal(str)
 
-    def __init__(self, video_path, output_dir, interval):
+    def __init__(self, video_path, output_dir, interval, margin=0.0, write_manifest=False,
+                 interval_seconds=None, processes=1, crop_format="jpg", quality=95,
+                 dedup_window=None, best_shots=0, min_quality=None):
         super().__init__()
         self.video_path = video_path
         self.output_dir = output_dir
         self.interval = interval
+        self.interval_seconds = interval_seconds  # sample by time instead of every `interval` frames
+        self.margin = margin  # extra context around each box, as a fraction of its size
+        self.write_manifest = write_manifest  # also save landmarks and encodings per crop
+        self.processes = processes  # worker processes, each extracting its own frame ranges
+        self.crop_format = crop_format  # see crop_writer.CROP_FORMATS
+        self.quality = quality  # JPEG/WebP quality
+        self.dedup_window = dedup_window  # seconds per kept crop of a face track, None keeps all
+        self.best_shots = best_shots  # crops kept per track (per dedup window), 0 for one
+        self.min_quality = min_quality  # QualityCheck thresholds, None skips quality scoring
         self._is_running = True
 
     def run(self):
         try:
-            os.makedirs(self.output_dir, exist_ok=True)
+            manifest = prepare_output(self.output_dir, self.margin, self.write_manifest)
+            writer = CropWriter(self.output_dir, self.crop_format, self.quality)
             cap = cv2.VideoCapture(self.video_path)
             total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            frame_id = 0
-            face_id = 0
-
-            while self._is_running and frame_id < total_frames:
-                ret, frame = cap.read()
-                if not ret:
-                    break
-
-                if frame_id % self.interval == 0:
-                    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    boxes = face_recognition.face_locations(rgb)
-                    
-                    for (top, right, bottom, left) in boxes:
-                        if not self._is_running:
-                            break
-                        face_img = frame[top:bottom, left:right]
-                        face_path = os.path.join(self.output_dir, f"face_{face_id}.jpg")
-                        cv2.imwrite(face_path, face_img)
-                        face_id += 1
-
-                frame_id += 1
-                progress = int((frame_id / total_frames) * 100)
-                self.update_progress.emit(progress)
+            fps = cap.get(cv2.CAP_PROP_FPS) or 30
+            step = sample_step(self.interval, self.interval_seconds, fps)
 
-            cap.release()
+            try:
+                # Ranges need a known frame count; live streams stay sequential
+                if self.processes > 1 and total_frames > 0:
+                    cap.release()
+                    face_id = self.extract_parallel(total_frames, step, fps, manifest, writer)
+                else:
+                    face_id = self.extract_sequential(cap, total_frames, step, fps, manifest, writer)
+            finally:
+                cap.release()
+                # Crops still queued are written before the worker reports back
+                writer.close()
+                if manifest is not None:
+                    manifest.close()
             if self._is_running:
+                self.update_progress.emit(100)
                 self.finished.emit(face_id)
             else:
                 self.finished.emit(0)
@@ -59,6 +83,131 @@ class ExtractionWorker(QThread):
         except Exception as e:
             self.error_occurred.emit(str(e))
 
+    def extract_sequential(self, cap, total_frames, step, fps, manifest, writer):
+        selector = make_selector(self.dedup_window, self.best_shots)
+        check = quality_check(self.min_quality, self.best_shots)
+        face_id = 0
+
+        def save(kept):
+            nonlocal face_id
+            for frame_id, (box, crop_box, crop, landmarks, encoding, scores) in kept:
+                fname = writer.crop_name(face_id)
+                writer.put(fname, crop)
+                write_record(manifest, fname, face_id, frame_id, fps, box, crop_box,
+                             landmarks, encoding, scores)
+                face_id += 1
+
+        # Only sampled frames are decoded into images; the rest are grabbed or seeked over
+        for frame_id, frame in iter_sampled_frames(cap, step, end_frame=total_frames or None):
+            if not self._is_running:
+                return face_id
+            found = extract_frame(frame, self.margin, manifest is not None, check)
+            save(selector.add(frame_id, frame_id / fps, found))
+            if total_frames > 0:
+                self.update_progress.emit(int((frame_id + 1) / total_frames * 100))
+        save(selector.flush())
+        return face_id
+
+    def extract_parallel(self, total_frames, step, fps, manifest, writer):
+        """Extract consecutive frame ranges in worker processes, each with its
+        own capture.  Once every range is done, crops are selected and
+        numbered over all of them in frame order, so the crops kept and
+        their face IDs match a sequential run."""
+        ranges = split_frames(total_frames, step, self.processes * CHUNKS_PER_PROCESS)
+        chunk_dirs = [os.path.join(self.output_dir, f".chunk{i}") for i in range(len(ranges))]
+        ctx = mp.get_context("spawn")
+        progress = ctx.Queue()
+        stop = ctx.Event()
+        pool = ProcessPoolExecutor(min(self.processes, len(ranges)), mp_context=ctx,
+                                   initializer=init_chunk_worker, initargs=(progress, stop))
+        try:
+            futures = [pool.submit(extract_chunk, self.video_path, chunk_dir, start, end, step,
+                                   self.margin, manifest is not None, self.crop_format, self.quality,
+                                   fps, self.dedup_window, self.best_shots, self.min_quality)
+                       for chunk_dir, (start, end) in zip(chunk_dirs, ranges)]
+            done_frames = 0
+            while not all(future.done() for future in futures):
+                if not self._is_running:
+                    stop.set()
+                    return 0
+                try:
+                    done_frames += progress.get(timeout=0.2)[1]
+                except queue.Empty:
+                    continue
+                self.update_progress.emit(int(done_frames / total_frames * 100))
+
+            # Crops that are not selected stay behind in the chunk folders
+            selector = make_selector(self.dedup_window, self.best_shots, chunk_score, chunk_hash)
+            face_id = 0
+
+            def save(kept):
+                nonlocal face_id
+                for frame_id, (box, crop_box, path, landmarks, encoding, scores, _, _) in kept:
+                    fname = writer.crop_name(face_id)
+                    writer.put_file(path, fname)
+                    write_record(manifest, fname, face_id, frame_id, fps, box, crop_box,
+                                 landmarks, encoding, scores)
+                    face_id += 1
+
+            for future in futures:
+                for frame_id, faces in future.result():
+                    save(selector.add(frame_id, frame_id / fps, faces))
+            save(selector.flush())
+            return face_id
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            # Files still queued for the writer are moved before the folders go
+            writer.close()
+            remove_chunks(chunk_dirs)
+
+    def stop(self):
+        self._is_running = False
+        self.wait()
+
+class BatchExtractionWorker(QThread):
+    """Runs a batch_extract queue, several videos at a time"""
+    update_progress = pyqtSignal(int)
+    update_stats = pyqtSignal(str)
+    job_finished = pyqtSignal(str, str)  # video, status text
+    finished = pyqtSignal(int, int, int)  # videos done, videos failed, faces
+    error_occurred = pyqtSignal(str)
+
+    def __init__(self, videos, output_root, settings, concurrency=1):
+        super().__init__()
+        self.videos = videos
+        self.output_root = output_root
+        self.settings = settings
+        self.concurrency = concurrency
+        self._is_running = True
+
+    def run(self):
+        try:
+            jobs = load_batch(self.videos, self.output_root, self.settings)
+            for job in jobs:
+                if job["status"] == DONE:
+                    self.job_finished.emit(job["video"], f"done earlier, {job['faces']} faces")
+            progress = run_batch(jobs, self.output_root, self.settings, self.concurrency,
+                                 on_progress=self.report_progress, on_job=self.report_job,
+                                 should_stop=lambda: not self._is_running)
+            if self._is_running:
+                self.update_stats.emit(f"{progress.frames} frames, {progress.faces} faces in "
+                                       f"{progress.elapsed():.1f}s ({progress.describe()})")
+                self.finished.emit(sum(job["status"] == DONE for job in jobs),
+                                   sum(job["status"] == FAILED for job in jobs),
+                                   sum(job["faces"] for job in jobs))
+        except Exception as e:
+            self.error_occurred.emit(str(e))
+
+    def report_progress(self, progress):
+        self.update_progress.emit(progress.percent())
+        self.update_stats.emit(progress.describe())
+
+    def report_job(self, job):
+        if job["status"] == DONE:
+            self.job_finished.emit(job["video"], f"done, {job['faces']} faces")
+        elif job["status"] == FAILED:
+            self.job_finished.emit(job["video"], f"failed: {job['error']}")
+
     def stop(self):
         self._is_running = False
         self.wait()
@@ -201,16 +350,153 @@ class FaceExtractorApp(QMainWindow):
         interval_layout.addWidget(QLabel("Extract every:"))
         
         self.interval_spin = QSpinBox()
-        self.interval_spin.setRange(1, 60)
+        # Long intervals are seeked over, so they cost little
+        self.interval_spin.setRange(1, 100000)
         self.interval_spin.setValue(10)
         interval_layout.addWidget(self.interval_spin)
-        interval_layout.addWidget(QLabel("frames"))
+        self.seconds_spin = QDoubleSpinBox()
+        self.seconds_spin.setRange(0.1, 600.0)
+        self.seconds_spin.setSingleStep(0.5)
+        self.seconds_spin.setValue(0.5)
+        self.seconds_spin.setVisible(False)
+        interval_layout.addWidget(self.seconds_spin)
+        self.interval_unit = QComboBox()
+        self.interval_unit.addItems(["frames", "seconds"])
+        self.interval_unit.currentTextChanged.connect(self.set_interval_unit)
+        interval_layout.addWidget(self.interval_unit)
+
+        interval_layout.addWidget(QLabel("Crop margin:"))
+        self.margin_spin = QSpinBox()
+        self.margin_spin.setRange(0, 100)
+        self.margin_spin.setValue(0)
+        self.margin_spin.setSuffix(" %")
+        interval_layout.addWidget(self.margin_spin)
+
+        self.manifest_checkbox = QCheckBox("Save encodings for registration")
+        self.manifest_checkbox.setToolTip(
+            f"Writes {MANIFEST_FILE} with the frame, box, landmarks and encoding of every crop"
+        )
+        interval_layout.addWidget(self.manifest_checkbox)
+
+        interval_layout.addWidget(QLabel("Processes:"))
+        self.processes_spin = QSpinBox()
+        self.processes_spin.setRange(1, os.cpu_count() or 1)
+        self.processes_spin.setValue(1)
+        self.processes_spin.setToolTip("Split the video into time ranges extracted in parallel")
+        interval_layout.addWidget(self.processes_spin)
         interval_layout.addStretch()
         output_layout.addLayout(interval_layout)
-        
+
+        # Crop encoding
+        format_layout = QHBoxLayout()
+        format_layout.addWidget(QLabel("Save crops as:"))
+        self.format_combo = QComboBox()
+        for label, crop_format in CROP_FORMAT_LABELS:
+            self.format_combo.addItem(label, crop_format)
+        self.format_combo.currentIndexChanged.connect(self.set_crop_format)
+        format_layout.addWidget(self.format_combo)
+        self.quality_label = QLabel("Quality:")
+        format_layout.addWidget(self.quality_label)
+        self.quality_spin = QSpinBox()
+        self.quality_spin.setRange(1, 100)
+        self.quality_spin.setValue(95)
+        format_layout.addWidget(self.quality_spin)
+
+        self.dedup_checkbox = QCheckBox("Skip near-duplicates, keep the best crops per face every")
+        self.dedup_checkbox.setToolTip(
+            "Follows each face across sampled frames and drops crops that look the same"
+        )
+        format_layout.addWidget(self.dedup_checkbox)
+        self.dedup_spin = QDoubleSpinBox()
+        self.dedup_spin.setRange(0.5, 3600.0)
+        self.dedup_spin.setValue(DEDUP_WINDOW)
+        self.dedup_spin.setSuffix(" s")
+        format_layout.addWidget(self.dedup_spin)
+        format_layout.addStretch()
+        output_layout.addLayout(format_layout)
+
+        # Crop quality
+        quality_layout = QHBoxLayout()
+        self.quality_checkbox = QCheckBox("Skip low-quality crops:")
+        quality_layout.addWidget(self.quality_checkbox)
+        quality_layout.addWidget(QLabel("face at least"))
+        self.min_size_spin = QSpinBox()
+        self.min_size_spin.setRange(0, 1000)
+        self.min_size_spin.setValue(40)
+        self.min_size_spin.setSuffix(" px")
+        quality_layout.addWidget(self.min_size_spin)
+        quality_layout.addWidget(QLabel("sharpness"))
+        self.min_sharpness_spin = QDoubleSpinBox()
+        self.min_sharpness_spin.setRange(0.0, 10000.0)
+        self.min_sharpness_spin.setValue(20.0)
+        self.min_sharpness_spin.setToolTip("Variance of the Laplacian; blurry crops score low")
+        quality_layout.addWidget(self.min_sharpness_spin)
+        quality_layout.addWidget(QLabel("frontal"))
+        self.min_frontal_spin = QSpinBox()
+        self.min_frontal_spin.setRange(0, 100)
+        self.min_frontal_spin.setValue(50)
+        self.min_frontal_spin.setSuffix(" %")
+        self.min_frontal_spin.setToolTip("From the landmarks: 100% is looking straight ahead, 0% is profile")
+        quality_layout.addWidget(self.min_frontal_spin)
+        quality_layout.addWidget(QLabel("brightness"))
+        self.min_brightness_spin = QSpinBox()
+        self.min_brightness_spin.setRange(0, 255)
+        self.min_brightness_spin.setValue(40)
+        quality_layout.addWidget(self.min_brightness_spin)
+        quality_layout.addWidget(QLabel("to"))
+        self.max_brightness_spin = QSpinBox()
+        self.max_brightness_spin.setRange(0, 255)
+        self.max_brightness_spin.setValue(220)
+        quality_layout.addWidget(self.max_brightness_spin)
+
+        quality_layout.addWidget(QLabel("Best shots per face:"))
+        self.best_shots_spin = QSpinBox()
+        self.best_shots_spin.setRange(0, 100)
+        self.best_shots_spin.setValue(0)
+        self.best_shots_spin.setSpecialValueText("all")
+        self.best_shots_spin.setToolTip(
+            "Keep only the highest-scoring crops of each face (per near-duplicate window if enabled)"
+        )
+        quality_layout.addWidget(self.best_shots_spin)
+        quality_layout.addStretch()
+        output_layout.addLayout(quality_layout)
+
         output_group.setLayout(output_layout)
         self.layout.addWidget(output_group)
 
+        # Batch queue: every video gets a folder under the output directory
+        batch_group = QGroupBox("Batch Queue")
+        batch_layout = QVBoxLayout()
+        self.batch_list = QListWidget()
+        self.batch_list.setMaximumHeight(120)
+        batch_layout.addWidget(self.batch_list)
+
+        batch_buttons = QHBoxLayout()
+        add_videos_btn = QPushButton("Add Videos")
+        add_videos_btn.clicked.connect(self.add_batch_videos)
+        batch_buttons.addWidget(add_videos_btn)
+        add_folder_btn = QPushButton("Add Folder")
+        add_folder_btn.clicked.connect(self.add_batch_folder)
+        batch_buttons.addWidget(add_folder_btn)
+        clear_btn = QPushButton("Clear")
+        clear_btn.clicked.connect(self.clear_batch)
+        batch_buttons.addWidget(clear_btn)
+        self.batch_buttons = [add_videos_btn, add_folder_btn, clear_btn]
+
+        batch_buttons.addWidget(QLabel("Videos at once:"))
+        self.concurrency_spin = QSpinBox()
+        self.concurrency_spin.setRange(1, os.cpu_count() or 1)
+        self.concurrency_spin.setValue(max(1, (os.cpu_count() or 1) // 2))
+        batch_buttons.addWidget(self.concurrency_spin)
+        batch_buttons.addStretch()
+        batch_layout.addLayout(batch_buttons)
+
+        self.batch_status = QLabel("")
+        batch_layout.addWidget(self.batch_status)
+        batch_group.setLayout(batch_layout)
+        self.layout.addWidget(batch_group)
+        self.batch_videos = []
+
         # Progress Bar
         self.progress_bar = QProgressBar()
         self.progress_bar.setRange(0, 100)
@@ -225,6 +511,10 @@ class FaceExtractorApp(QMainWindow):
         self.extract_btn = QPushButton("Start Extraction")
         self.extract_btn.clicked.connect(self.start_extraction)
         button_layout.addWidget(self.extract_btn)
+
+        self.batch_btn = QPushButton("Start Batch")
+        self.batch_btn.clicked.connect(self.start_batch)
+        button_layout.addWidget(self.batch_btn)
         
         self.cancel_btn = QPushButton("Cancel")
         self.cancel_btn.setObjectName("cancelButton")
@@ -251,6 +541,51 @@ class FaceExtractorApp(QMainWindow):
         dir_path = QFileDialog.getExistingDirectory(self, "Select Output Directory")
         if dir_path:
             self.output_dir_edit.setText(dir_path)
+            # Offer to resume a batch saved in this directory
+            _, saved_jobs = read_batch(dir_path)
+            if saved_jobs and not self.batch_videos:
+                self.set_batch_videos([job["video"] for job in saved_jobs])
+                remaining = sum(job["status"] != DONE for job in saved_jobs)
+                self.batch_status.setText(f"Saved batch: {remaining} of {len(saved_jobs)} videos left")
+
+    def add_batch_videos(self):
+        patterns = " ".join(f"*{ext}" for ext in VIDEO_EXTENSIONS)
+        file_paths, _ = QFileDialog.getOpenFileNames(
+            self, "Select Video Files", "", f"Video Files ({patterns});;All Files (*)"
+        )
+        self.set_batch_videos(self.batch_videos + list_videos(file_paths))
+
+    def add_batch_folder(self):
+        dir_path = QFileDialog.getExistingDirectory(self, "Select Video Folder")
+        if dir_path:
+            self.set_batch_videos(self.batch_videos + list_videos([dir_path]))
+
+    def clear_batch(self):
+        self.set_batch_videos([])
+        self.batch_status.setText("")
+
+    def set_batch_videos(self, videos):
+        self.batch_videos = list(dict.fromkeys(videos))
+        self.batch_list.clear()
+        self.batch_list.addItems(self.batch_videos)
+
+    def extraction_settings(self):
+        interval_seconds = (self.seconds_spin.value()
+                            if self.interval_unit.currentText() == "seconds" else None)
+        return batch_settings(self.interval_spin.value(), interval_seconds,
+                              self.margin_spin.value() / 100, self.manifest_checkbox.isChecked(),
+                              self.format_combo.currentData(), self.quality_spin.value(),
+                              self.dedup_spin.value() if self.dedup_checkbox.isChecked() else None,
+                              self.best_shots_spin.value(), self.quality_thresholds())
+
+    def quality_thresholds(self):
+        if not self.quality_checkbox.isChecked():
+            return None
+        return {"min_size": self.min_size_spin.value(),
+                "min_sharpness": self.min_sharpness_spin.value(),
+                "min_frontal": self.min_frontal_spin.value() / 100,
+                "min_brightness": self.min_brightness_spin.value(),
+                "max_brightness": self.max_brightness_spin.value()}
 
     def show_video_preview(self, video_path):
         cap = cv2.VideoCapture(video_path)
@@ -269,10 +604,20 @@ class FaceExtractorApp(QMainWindow):
                 ))
             cap.release()
 
+    def set_crop_format(self, index):
+        # Quality only applies to lossy formats
+        lossy = self.format_combo.itemData(index) in ("jpg", "webp", "tar")
+        self.quality_label.setVisible(lossy)
+        self.quality_spin.setVisible(lossy)
+
+    def set_interval_unit(self, unit):
+        self.interval_spin.setVisible(unit == "frames")
+        self.seconds_spin.setVisible(unit == "seconds")
+
     def start_extraction(self):
         video_path = self.video_path_edit.text()
         output_dir = self.output_dir_edit.text()
-        interval = self.interval_spin.value()
+        settings = self.extraction_settings()
 
         if not video_path:
             QMessageBox.warning(self, "Error", "Please select a video file")
@@ -282,21 +627,58 @@ class FaceExtractorApp(QMainWindow):
             QMessageBox.warning(self, "Error", "Please select an output directory")
             return
 
-        # Disable UI elements during extraction
-        self.extract_btn.setEnabled(False)
-        self.cancel_btn.setEnabled(True)
-        self.video_path_edit.setEnabled(False)
-        self.output_dir_edit.setEnabled(False)
-        self.interval_spin.setEnabled(False)
+        self.set_controls_enabled(False)
         self.progress_bar.setValue(0)
 
         # Create and start the worker thread
-        self.extraction_worker = ExtractionWorker(video_path, output_dir, interval)
+        self.extraction_worker = ExtractionWorker(video_path, output_dir, settings["interval"],
+                                                  settings["margin"], settings["manifest"],
+                                                  settings["interval_seconds"],
+                                                  self.processes_spin.value(),
+                                                  settings["crop_format"], settings["quality"],
+                                                  settings["dedup_window"], settings["best_shots"],
+                                                  settings["min_quality"])
         self.extraction_worker.update_progress.connect(self.update_progress)
         self.extraction_worker.finished.connect(self.extraction_finished)
         self.extraction_worker.error_occurred.connect(self.show_error)
         self.extraction_worker.start()
 
+    def start_batch(self):
+        output_dir = self.output_dir_edit.text()
+        if not self.batch_videos:
+            QMessageBox.warning(self, "Error", "Please add videos to the batch")
+            return
+        if not output_dir:
+            QMessageBox.warning(self, "Error", "Please select an output directory")
+            return
+
+        self.set_controls_enabled(False)
+        self.progress_bar.setValue(0)
+        self.batch_list.clear()
+        self.batch_list.addItems(self.batch_videos)
+        self.batch_status.setText("Starting...")
+
+        self.extraction_worker = BatchExtractionWorker(self.batch_videos, output_dir,
+                                                       self.extraction_settings(),
+                                                       self.concurrency_spin.value())
+        self.extraction_worker.update_progress.connect(self.update_progress)
+        self.extraction_worker.update_stats.connect(self.batch_status.setText)
+        self.extraction_worker.job_finished.connect(self.batch_job_finished)
+        self.extraction_worker.finished.connect(self.batch_finished)
+        self.extraction_worker.error_occurred.connect(self.show_error)
+        self.extraction_worker.start()
+
+    def batch_job_finished(self, video, status):
+        row = self.batch_videos.index(video)
+        self.batch_list.item(row).setText(f"{video} - {status}")
+
+    def batch_finished(self, done, failed, face_count):
+        self.reset_ui()
+        QMessageBox.information(
+            self, "Batch Complete",
+            f"{done} videos extracted, {failed} failed.\n{face_count} faces in total."
+        )
+
     def cancel_extraction(self):
         if self.extraction_worker and self.extraction_worker.isRunning():
             self.extraction_worker.stop()
@@ -316,12 +698,23 @@ class FaceExtractorApp(QMainWindow):
         self.reset_ui()
         QMessageBox.critical(self, "Error", f"An error occurred:\n{error_msg}")
 
+    def set_controls_enabled(self, enabled):
+        """Settings are locked while an extraction or batch runs"""
+        self.extract_btn.setEnabled(enabled)
+        self.batch_btn.setEnabled(enabled)
+        self.cancel_btn.setEnabled(not enabled)
+        for widget in [self.video_path_edit, self.output_dir_edit, self.interval_spin,
+                       self.seconds_spin, self.interval_unit, self.margin_spin,
+                       self.manifest_checkbox, self.processes_spin, self.concurrency_spin,
+                       self.format_combo, self.quality_spin, self.dedup_checkbox, self.dedup_spin,
+                       self.quality_checkbox, self.min_size_spin, self.min_sharpness_spin,
+                       self.min_frontal_spin, self.min_brightness_spin, self.max_brightness_spin,
+                       self.best_shots_spin,
+                       *self.batch_buttons]:
+            widget.setEnabled(enabled)
+
     def reset_ui(self):
-        self.extract_btn.setEnabled(True)
-        self.cancel_btn.setEnabled(False)
-        self.video_path_edit.setEnabled(True)
-        self.output_dir_edit.setEnabled(True)
-        self.interval_spin.setEnabled(True)
+        self.set_controls_enabled(True)
         if hasattr(self, 'extraction_worker'):
             self.extraction_worker = None
 
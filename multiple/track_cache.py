@@ -0,0 +1,104 @@
+import threading
+
+from recognition import box_iou
+
+
+class TrackCache:
+    """Per-feed cache of recognised faces keyed by track ID.
+
+    Detected boxes are associated with the previous frame's tracks by greedy
+    IoU matching.  A track recognised with high confidence keeps its cached
+    identity and encoding, so it is only re-encoded and re-matched every
+    `reverify_interval` frames or once its box drifts away from the box it
+    was verified on.  Frames may arrive out of order from several workers,
+    so all bookkeeping is by frame sequence number and guarded by a lock;
+    encoding itself happens outside the lock.
+    """
+
+    def __init__(self, reverify_interval=15, min_iou=0.3, stable_iou=0.6,
+                 max_distance=0.45, max_missed=30):
+        self.reverify_interval = reverify_interval
+        self.min_iou = min_iou            # to continue a track at all
+        self.stable_iou = stable_iou      # to trust the cached identity
+        self.max_distance = max_distance  # "high confidence" match distance
+        self.max_missed = max_missed      # frames before a lost track is dropped
+        self.tracks = {}
+        self.hits = 0
+        self.misses = 0
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self.tracks.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def _reusable(self, track, seq, box):
+        result = track['result']
+        if result is None:
+            return False
+        name, distance, votes = result
+        return (votes > 0 and distance <= self.max_distance
+                and abs(seq - track['verified_seq']) < self.reverify_interval
+                and box_iou(box, track['verified_box']) >= self.stable_iou)
+
+    def assign(self, seq, boxes):
+        """Associate boxes with tracks.
+
+        Returns (track_ids, cached) where cached[i] is the reusable
+        (name, distance, votes) for boxes[i], or None if it must be encoded.
+        """
+        with self._lock:
+            for track_id in [tid for tid, track in self.tracks.items()
+                             if seq - track['last_seq'] > self.max_missed]:
+                del self.tracks[track_id]
+
+            pairs = sorted(((box_iou(box, track['box']), i, track_id)
+                            for i, box in enumerate(boxes)
+                            for track_id, track in self.tracks.items()), reverse=True)
+            track_ids = [None] * len(boxes)
+            taken = set()
+            for iou, i, track_id in pairs:
+                if iou < self.min_iou:
+                    break
+                if track_ids[i] is None and track_id not in taken:
+                    track_ids[i] = track_id
+                    taken.add(track_id)
+
+            cached = []
+            for i, box in enumerate(boxes):
+                if track_ids[i] is None:
+                    track_ids[i] = self._next_id
+                    self._next_id += 1
+                    self.tracks[track_ids[i]] = {'box': box, 'last_seq': seq, 'result': None,
+                                                 'encoding': None, 'verified_box': box,
+                                                 'verified_seq': seq}
+                track = self.tracks[track_ids[i]]
+                if seq >= track['last_seq']:
+                    track['box'] = box
+                    track['last_seq'] = seq
+
+                if self._reusable(track, seq, box):
+                    self.hits += 1
+                    cached.append(track['result'])
+                else:
+                    self.misses += 1
+                    cached.append(None)
+            return track_ids, cached
+
+    def store(self, seq, track_id, box, encoding, result):
+        """Record a freshly computed encoding and match for a track"""
+        with self._lock:
+            track = self.tracks.get(track_id)
+            if track is None:
+                return
+            if track['result'] is None or seq >= track['verified_seq']:
+                track['result'] = result
+                track['encoding'] = encoding
+                track['verified_box'] = box
+                track['verified_seq'] = seq
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
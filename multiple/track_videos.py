@@ -0,0 +1,159 @@
+# track_videos.py
+"""Headless batch tracking: runs the Track Faces pipeline over video files
+without creating a QApplication.
+
+    python -m track_videos clip1.mp4 clip2.mp4 --output-dir results --annotate
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from gallery import GalleryMatcher, load_known_faces, ANN_MIN_ROWS
+from recognition import recognize_frame, draw_detections
+from track_cache import TrackCache
+from tracking import FaceTracker
+
+CSV_FIELDS = ["video", "frame", "top", "right", "bottom", "left", "name", "distance", "votes"]
+
+
+def iter_video_detections(video_path, matcher, scale=1.0, use_track_cache=False,
+                          keyframe_interval=0, draw=False):
+    """Yield (frame_index, detections, rgb) for every frame of a video.
+
+    keyframe_interval > 0 runs full recognition only on keyframes and moves
+    the boxes along with FaceTracker in between.  rgb is annotated when
+    `draw` is set.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video file: {video_path}")
+
+    track_cache = TrackCache() if use_track_cache else None
+    tracker = FaceTracker(keyframe_interval) if keyframe_interval > 0 else None
+    frame_index = 0
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if tracker else None
+            if tracker and not tracker.needs_detection():
+                detections = tracker.update(gray)
+                rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                if draw:
+                    draw_detections(rgb, detections)
+            else:
+                rgb, detections, _, _ = recognize_frame(frame, matcher, scale, track_cache=track_cache,
+                                                        seq=frame_index + 1, draw=draw)
+                if tracker:
+                    tracker.reset(gray, detections)
+
+            yield frame_index, detections, rgb
+            frame_index += 1
+    finally:
+        cap.release()
+
+
+def detection_rows(video_name, frame_index, detections):
+    for (top, right, bottom, left), name, distance, votes in detections:
+        yield {"video": video_name, "frame": frame_index, "top": top, "right": right,
+               "bottom": bottom, "left": left, "name": name, "distance": distance, "votes": votes}
+
+
+def track_video(video_path, args):
+    """Track one video, writing detections (and optionally an annotated copy)
+    into args.output_dir.  Returns (video_path, frames, detections, seconds)."""
+    encodings, names = load_known_faces(args.db, "prototypes" if args.prototypes else "faces")
+    matcher = GalleryMatcher(encodings, names, tolerance=args.tolerance)
+    if args.ann_probe and len(matcher) >= ANN_MIN_ROWS:
+        matcher.build_index(args.ann_probe)
+
+    video_name = os.path.basename(video_path)
+    stem = os.path.splitext(video_name)[0]
+    os.makedirs(args.output_dir, exist_ok=True)
+    out_path = os.path.join(args.output_dir, f"{stem}.{args.format}")
+
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    cap.release()
+
+    writer = None
+    frames = 0
+    total_detections = 0
+    start = time.time()
+    with open(out_path, "w", newline="") as out:
+        if args.format == "csv":
+            rows = csv.DictWriter(out, fieldnames=CSV_FIELDS)
+            rows.writeheader()
+            write_row = rows.writerow
+        else:
+            write_row = lambda row: out.write(json.dumps(row) + "\n")
+
+        for frame_index, detections, rgb in iter_video_detections(
+                video_path, matcher, args.scale, args.track_cache,
+                args.keyframe_interval, draw=args.annotate):
+            for row in detection_rows(video_name, frame_index, detections):
+                write_row(row)
+
+            if args.annotate:
+                if writer is None:
+                    h, w = rgb.shape[:2]
+                    writer = cv2.VideoWriter(os.path.join(args.output_dir, f"{stem}_annotated.mp4"),
+                                             cv2.VideoWriter_fourcc(*"mp4v"), fps, (w, h))
+                writer.write(cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR))
+
+            frames += 1
+            total_detections += len(detections)
+
+    if writer is not None:
+        writer.release()
+    return video_path, frames, total_detections, time.time() - start
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Track known faces in video files without the GUI")
+    parser.add_argument("videos", nargs="+", help="video files to process")
+    parser.add_argument("--db", default="faces.db", help="face database (default: faces.db)")
+    parser.add_argument("--output-dir", default="tracking_output", help="where results are written")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default="jsonl", help="detection output format")
+    parser.add_argument("--annotate", action="store_true", help="also write an annotated copy of each video")
+    parser.add_argument("--scale", type=float, default=1.0, help="detection scale, e.g. 0.5 or 0.25")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="face match tolerance")
+    parser.add_argument("--ann-probe", type=int, default=0,
+                        help="match large galleries through an index searching N partitions "
+                             "per face; more is slower but closer to exact (0 = exact scan)")
+    parser.add_argument("--prototypes", action="store_true",
+                        help="match against per-person prototypes built by prototypes.py")
+    parser.add_argument("--track-cache", action="store_true", help="reuse identities of stable faces")
+    parser.add_argument("--keyframe-interval", type=int, default=0,
+                        help="detect every N frames and track in between (0 = detect every frame)")
+    parser.add_argument("--jobs", type=int, default=1, help="videos processed in parallel")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.jobs > 1:
+        executor = ProcessPoolExecutor(max_workers=args.jobs)
+        results = executor.map(track_video, args.videos, [args] * len(args.videos))
+    else:
+        executor = None
+        results = (track_video(path, args) for path in args.videos)
+
+    for video_path, frames, detections, seconds in results:
+        print(f"{video_path}: {frames} frames, {detections} detections in {seconds:.2f}s "
+              f"({frames / seconds if seconds else 0:.1f} fps)", file=sys.stderr)
+    if executor is not None:
+        executor.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
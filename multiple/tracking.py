@@ -0,0 +1,126 @@
+import cv2
+import numpy as np
+
+LK_PARAMS = dict(winSize=(15, 15), maxLevel=3,
+                 criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+MAX_FB_ERROR = 1.0  # pixels, forward-backward optical flow consistency
+MIN_POINTS = 4
+
+
+def _box_points(gray, box):
+    """Pick trackable points inside a (top, right, bottom, left) box"""
+    top, right, bottom, left = box
+    h, w = gray.shape[:2]
+    top, bottom = max(0, top), min(h, bottom)
+    left, right = max(0, left), min(w, right)
+    if bottom - top < 2 or right - left < 2:
+        return np.empty((0, 1, 2), dtype=np.float32)
+
+    mask = np.zeros(gray.shape[:2], dtype=np.uint8)
+    mask[top:bottom, left:right] = 255
+    points = cv2.goodFeaturesToTrack(gray, maxCorners=30, qualityLevel=0.01,
+                                     minDistance=3, mask=mask)
+    if points is None or len(points) < MIN_POINTS:
+        # Flat faces have few corners; a coarse grid still follows the motion
+        xs = np.linspace(left, right - 1, 5)
+        ys = np.linspace(top, bottom - 1, 5)
+        grid = np.array([(x, y) for y in ys for x in xs], dtype=np.float32)
+        points = grid.reshape(-1, 1, 2)
+    return points.astype(np.float32)
+
+
+class FaceTracker:
+    """Carries detected faces and their labels across frames with optical flow.
+
+    Full detection only needs to run when needs_detection() says so: every
+    keyframe_interval frames, or as soon as a track loses more than
+    min_confidence of its points.
+    """
+
+    def __init__(self, keyframe_interval=10, min_confidence=0.5):
+        self.keyframe_interval = keyframe_interval
+        self.min_confidence = min_confidence
+        self.prev_gray = None
+        self.tracks = []  # [box, name, distance, votes, points]
+        self.frames_since_detection = 0
+        self.lost = True
+
+    def needs_detection(self):
+        return self.lost or self.frames_since_detection >= self.keyframe_interval
+
+    def reset(self, gray, detections):
+        """Start tracking a fresh set of (box, name, distance, votes) detections"""
+        self.prev_gray = gray
+        self.tracks = [[box, name, distance, votes, _box_points(gray, box)]
+                       for box, name, distance, votes in detections]
+        self.frames_since_detection = 0
+        self.lost = False
+
+    def clear(self):
+        self.prev_gray = None
+        self.tracks = []
+        self.lost = True
+
+    def detections(self):
+        return [(tuple(int(round(v)) for v in box), name, distance, votes)
+                for box, name, distance, votes, _ in self.tracks]
+
+    def update(self, gray):
+        """Propagate every track to the new frame.
+
+        Returns the moved detections, or None if there is nothing to track
+        from yet.
+        """
+        if self.prev_gray is None:
+            return None
+        self.frames_since_detection += 1
+
+        counts = [len(track[4]) for track in self.tracks]
+        if sum(counts) == 0:
+            self.prev_gray = gray
+            self.lost = self.lost or bool(self.tracks)
+            return self.detections()
+
+        prev_pts = np.concatenate([track[4] for track in self.tracks if len(track[4])])
+        next_pts, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, prev_pts, None, **LK_PARAMS)
+        back_pts, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, self.prev_gray, next_pts, None, **LK_PARAMS)
+        fb_error = np.linalg.norm((prev_pts - back_pts).reshape(-1, 2), axis=1)
+        good = (status.ravel() == 1) & (back_status.ravel() == 1) & (fb_error < MAX_FB_ERROR)
+
+        h, w = gray.shape[:2]
+        start = 0
+        for track, count in zip(self.tracks, counts):
+            if count == 0:
+                self.lost = True
+                continue
+            keep = good[start:start + count]
+            old = track[4].reshape(-1, 2)[keep]
+            new = next_pts[start:start + count].reshape(-1, 2)[keep]
+            start += count
+
+            if len(new) < MIN_POINTS or keep.mean() < self.min_confidence:
+                self.lost = True
+            if len(new) < 2:
+                track[4] = new.reshape(-1, 1, 2)
+                continue
+
+            # Move the box by the median point motion and scale it by the
+            # change in point spread around the median
+            old_c = np.median(old, axis=0)
+            new_c = np.median(new, axis=0)
+            old_spread = np.median(np.linalg.norm(old - old_c, axis=1))
+            new_spread = np.median(np.linalg.norm(new - new_c, axis=1))
+            scale = new_spread / old_spread if old_spread > 0 else 1.0
+
+            top, right, bottom, left = track[0]
+            cx, cy = (left + right) / 2.0, (top + bottom) / 2.0
+            cx += new_c[0] - old_c[0]
+            cy += new_c[1] - old_c[1]
+            half_w = (right - left) * scale / 2.0
+            half_h = (bottom - top) * scale / 2.0
+            track[0] = (max(0.0, cy - half_h), min(w - 1.0, cx + half_w),
+                        min(h - 1.0, cy + half_h), max(0.0, cx - half_w))
+            track[4] = new.reshape(-1, 1, 2).astype(np.float32)
+
+        self.prev_gray = gray
+        return self.detections()
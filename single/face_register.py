@@ -3,6 +3,7 @@ import shutil
 import sqlite3
 import numpy as np
 import face_recognition
+from gallery import encode_encoding, table_storage
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QPushButton, QFileDialog, 
                             QLabel, QLineEdit, QMessageBox, QHBoxLayout)
 from PyQt5.QtCore import Qt
@@ -20,6 +21,10 @@ def init_db():
             encoding BLOB NOT NULL
         )
     ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_faces_name ON faces (name)")
+    # WAL lets the trackers keep reading while registration writes, and the
+    # setting is stored in the database file
+    cursor.execute("PRAGMA journal_mode=WAL")
     conn.commit()
     conn.close()
 
@@ -202,7 +207,9 @@ class FaceRegisterTab(QWidget):
     def save_encoding_to_db(self, name, encoding):
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
-        cursor.execute("INSERT INTO faces (name, encoding) VALUES (?, ?)", (name, encoding.tobytes()))
+        # New rows use the same storage as the table (see multiple/migrate_encodings.py)
+        blob = encode_encoding(encoding, table_storage(conn))
+        cursor.execute("INSERT INTO faces (name, encoding) VALUES (?, ?)", (name, blob))
         conn.commit()
         conn.close()
 
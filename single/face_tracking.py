@@ -1,14 +1,49 @@
 import cv2
-import sqlite3
-import numpy as np
+import math
 import time
 import face_recognition
 from PyQt5.QtWidgets import (QWidget, QGridLayout, QPushButton, QFileDialog, 
-                            QLabel, QVBoxLayout, QHBoxLayout)
+                            QLabel, QVBoxLayout, QHBoxLayout, QCheckBox, QSpinBox,
+                            QComboBox)
 from PyQt5.QtCore import QTimer
 from PyQt5.QtGui import QImage, QPixmap
+from gallery import GalleryStore
+from tracking import FaceTracker
+from pacing import FramePacer, REALTIME, EVERY_FRAME
 import time
 
+GALLERY_POLL_MS = 1000  # how often faces.db is checked for new or deleted faces
+
+PACING_LABELS = [
+    ("Realtime (skip late frames)", REALTIME),
+    ("Every frame", EVERY_FRAME),
+]
+
+
+def detect_faces(rgb, matcher):
+    """Run full detection, encoding and matching on an RGB frame"""
+    boxes = face_recognition.face_locations(rgb)
+    encs = face_recognition.face_encodings(rgb, boxes)
+    return [(box, name, distance, votes)
+            for box, (name, distance, votes) in zip(boxes, matcher.match(encs))]
+
+
+def draw_detections(rgb, detections):
+    """Draw every box and name onto the frame; returns how many faces matched"""
+    correct_matches = 0
+    for box, name, distance, votes in detections:
+        box_color = (255, 0, 0)
+        if votes > 0:
+            correct_matches += 1
+            box_color = (0, 255, 0)
+
+        # Draw bounding box and name
+        top, right, bottom, left = box
+        cv2.rectangle(rgb, (left, top), (right, bottom), box_color, 2)
+        cv2.putText(rgb, name, (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, box_color, 2)
+    return correct_matches
+
+
 class FaceTrackingTab(QWidget):
     def __init__(self, performance_graph=None, system_monitor=None):
         super().__init__()
@@ -24,6 +59,9 @@ class FaceTrackingTab(QWidget):
 
         self.video_start_times = [None] * 4
         self.video_durations = [0] * 4
+        self.trackers = [FaceTracker() for _ in range(4)]
+        self.pacers = [None] * 4
+        self.video_names = [None] * 4
 
         # Set up UI
         self.layout.setSpacing(15)
@@ -81,28 +119,43 @@ class FaceTrackingTab(QWidget):
             self.timers.append(QTimer())
             self.timers[i].timeout.connect(lambda idx=i: self.update_frame(idx))
 
-        # Load known faces from database
-        self.known_encodings, self.known_names = self.load_known_faces()
+        # Detect-then-track controls
+        tracking_layout = QHBoxLayout()
+        self.tracking_checkbox = QCheckBox("Track faces between detections")
+        tracking_layout.addWidget(self.tracking_checkbox)
+        tracking_layout.addWidget(QLabel("Detect every"))
+        self.keyframe_spin = QSpinBox()
+        self.keyframe_spin.setRange(1, 120)
+        self.keyframe_spin.setValue(self.trackers[0].keyframe_interval)
+        self.keyframe_spin.valueChanged.connect(self.set_keyframe_interval)
+        tracking_layout.addWidget(self.keyframe_spin)
+        tracking_layout.addWidget(QLabel("frames"))
+        self.pacing_box = QComboBox()
+        for text, _ in PACING_LABELS:
+            self.pacing_box.addItem(text)
+        self.pacing_box.currentIndexChanged.connect(
+            lambda row: self.set_pacing(PACING_LABELS[row][1])
+        )
+        tracking_layout.addWidget(self.pacing_box)
+        tracking_layout.addStretch()
+        self.layout.addLayout(tracking_layout, 2, 0, 1, 2)
+
+        # Load known faces from database and keep following it
+        self.gallery = GalleryStore("faces.db")
+        self.gallery.refresh()
+        self.matcher = self.gallery.matcher()
+        self.gallery_timer = QTimer()
+        self.gallery_timer.timeout.connect(self.refresh_gallery)
+        self.gallery_timer.start(GALLERY_POLL_MS)
 
         # Initialize frame timing for FPS calculation
         self.frame_times = []
         self.last_frame_time = 0
 
-    def load_known_faces(self):
-        """Load known face encodings from database"""
-        conn = sqlite3.connect("faces.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT name, encoding FROM faces")
-        results = cursor.fetchall()
-        conn.close()
-
-        names = []
-        encodings = []
-        for name, blob in results:
-            names.append(name)
-            encodings.append(np.frombuffer(blob, dtype=np.float64))
-
-        return encodings, names
+    def refresh_gallery(self):
+        """Pick up faces registered or deleted since the last check"""
+        if self.gallery.refresh() is not None:
+            self.matcher = self.gallery.matcher()
 
     def load_video(self, index):
         """Load a video file into the specified video slot"""
@@ -114,11 +167,18 @@ class FaceTrackingTab(QWidget):
         )
       
         if file:
+            self.trackers[index].clear()
             self.videos[index] = cv2.VideoCapture(file)
-            self.video_widgets[index]['status'].setText(f"Loaded: {file.split('/')[-1]}")
+            mode = PACING_LABELS[self.pacing_box.currentIndex()][1]
+            self.pacers[index] = FramePacer(self.videos[index].get(cv2.CAP_PROP_FPS), mode)
+            self.pacers[index].start()
+            self.video_names[index] = file.split('/')[-1]
+            self.video_widgets[index]['status'].setText(
+                f"Loaded: {self.video_names[index]} ({self.pacers[index].source_fps:.1f} fps source)"
+            )
             self.video_widgets[index]['status'].setStyleSheet("color: #27ae60;")
             self.video_start_times[index] = time.time()
-            self.timers[index].start(30)
+            self.schedule_next_frame(index)
             
             # Reset performance counters
             if self.performance_graph:
@@ -128,22 +188,46 @@ class FaceTrackingTab(QWidget):
                 self.system_monitor.cpu_data.clear()
                 self.system_monitor.memory_data.clear()
 
+    def schedule_next_frame(self, index):
+        """Fire when the next frame is due in realtime mode, otherwise as
+        soon as the event loop is free"""
+        self.timers[index].start(math.ceil(self.pacers[index].wait_seconds() * 1000))
+
+    def set_pacing(self, mode):
+        for index, pacer in enumerate(self.pacers):
+            if pacer is None:
+                continue
+            pacer.set_mode(mode)
+            if self.timers[index].isActive():
+                self.schedule_next_frame(index)
+
+    def set_keyframe_interval(self, value):
+        for tracker in self.trackers:
+            tracker.keyframe_interval = value
+
     def update_frame(self, index):
         """Process and display the next video frame"""
         cap = self.videos[index]
         if cap is None:
             return
 
-        ret, frame = cap.read()
+        # Late frames are skipped without decoding
+        pacer = self.pacers[index]
+        skip = pacer.frames_to_skip()
+        ret = all(cap.grab() for _ in range(skip))
+        if ret:
+            ret, frame = cap.read()
         if not ret:
             self.timers[index].stop()
             duration = time.time() - self.video_start_times[index]
             self.video_durations[index] = duration
             self.video_widgets[index]['status'].setText(
-                f"Video ended in {duration:.2f} seconds"
+                f"Video ended in {duration:.2f} seconds at "
+                f"{pacer.describe(pacer.average_fps())} ({pacer.skipped} frames skipped)"
             )
             self.video_widgets[index]['status'].setStyleSheet("color: #e74c3c;")
             return
+        pacer.frame_read(skip)
 
         # Update system monitor
         if self.system_monitor:
@@ -160,30 +244,21 @@ class FaceTrackingTab(QWidget):
 
         # Process frame
         rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        boxes = face_recognition.face_locations(rgb)
-        encs = face_recognition.face_encodings(rgb, boxes)
+        if self.tracking_checkbox.isChecked():
+            # Only keyframes pay for detection; other frames move the last boxes along
+            tracker = self.trackers[index]
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            if tracker.needs_detection():
+                detections = detect_faces(rgb, self.matcher)
+                tracker.reset(gray, detections)
+            else:
+                detections = tracker.update(gray)
+        else:
+            detections = detect_faces(rgb, self.matcher)
 
         # Face recognition
-        correct_matches = 0
-        total_faces = len(encs)
-        for (box, enc) in zip(boxes, encs):
-            matches = face_recognition.compare_faces(self.known_encodings, enc, tolerance=0.5)
-            name = "Unknown"
-            box_color = (255, 0,0)  
-
-            if True in matches:
-                counts = {}
-                for i, matched in enumerate(matches):
-                    if matched:
-                        counts[self.known_names[i]] = counts.get(self.known_names[i], 0) + 1
-                name = max(counts, key=counts.get)
-                correct_matches += 1
-                box_color = (0, 255, 0)  
-
-            # Draw bounding box and name
-            top, right, bottom, left = box
-            cv2.rectangle(rgb, (left, top), (right, bottom), box_color, 2)
-            cv2.putText(rgb, name, (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, box_color, 2)
+        correct_matches = draw_detections(rgb, detections)
+        total_faces = len(detections)
 
         # Update performance metrics
         if self.performance_graph:
@@ -205,5 +280,13 @@ class FaceTrackingTab(QWidget):
         pixmap = QPixmap.fromImage(qimg).scaled(400, 300, aspectRatioMode=1, transformMode=1)
         self.video_widgets[index]['display'].setPixmap(pixmap)
 
+        pacer.frame_done()
+        # Refresh the achieved rate about once a second of source video
+        if pacer.processed % max(1, int(pacer.source_fps)) == 0:
+            self.video_widgets[index]['status'].setText(
+                f"Playing: {self.video_names[index]} at {pacer.describe()}"
+            )
+
         # Increment frame counter
-        self.frame_count += 1
\ No newline at end of file
+        self.frame_count += 1
+        self.schedule_next_frame(index)
\ No newline at end of file
@@ -1,5 +1,11 @@
 # main.py
+import os
 import sys
+
+# The gallery, tracking and pacing code is shared with the multithreaded app
+# and lives there
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "multiple"))
+
 from PyQt5.QtWidgets import QApplication, QTabWidget, QMainWindow
 from face_register import FaceRegisterTab
 from face_tracking import FaceTrackingTab
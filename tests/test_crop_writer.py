@@ -0,0 +1,79 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from crop_writer import ARCHIVE_FORMATS, CROP_FORMATS, CropWriter, encode_crop, member_format, unpack_archives
+
+
+def crops(count=5, seed=0):
+    rng = np.random.default_rng(seed)
+    # Smooth gradients survive lossy formats well enough to compare
+    base = np.linspace(0, 255, 48 * 40 * 3).reshape(48, 40, 3)
+    return [np.clip(base + rng.integers(-20, 20), 0, 255).astype(np.uint8) for _ in range(count)]
+
+
+def read_crop(path):
+    if path.endswith(".npy"):
+        return np.load(path)
+    return cv2.imread(path)
+
+
+@pytest.mark.parametrize("crop_format", CROP_FORMATS)
+def test_crop_writer_and_unpack(tmp_path, crop_format):
+    images = crops()
+    with CropWriter(str(tmp_path), crop_format) as writer:
+        names = [writer.crop_name(i) for i in range(len(images))]
+        for name, image in zip(names, images):
+            writer.put(name, image)
+    assert writer.written == len(images)
+
+    if crop_format in ARCHIVE_FORMATS:
+        assert sorted(os.listdir(tmp_path)) == [os.path.basename(writer.archive_path())]
+        assert unpack_archives(str(tmp_path)) == len(images)
+    else:
+        assert unpack_archives(str(tmp_path)) == 0
+    assert sorted(os.listdir(tmp_path)) == sorted(names)
+
+    for name, image in zip(names, images):
+        restored = read_crop(str(tmp_path / name))
+        assert restored.shape == image.shape
+        if member_format(crop_format) in ("npy", "png"):
+            assert np.array_equal(restored, image)
+        else:
+            assert np.abs(restored.astype(int) - image).mean() < 10
+
+
+@pytest.mark.parametrize("crop_format", CROP_FORMATS)
+def test_put_file_moves_encoded_crops(tmp_path, crop_format):
+    staging = tmp_path / "staging"
+    output = tmp_path / "output"
+    staging.mkdir()
+    output.mkdir()
+    image = crops(1)[0]
+    source = staging / "face.tmp"
+    source.write_bytes(encode_crop(image, crop_format))
+
+    with CropWriter(str(output), crop_format) as writer:
+        writer.put_file(str(source), writer.crop_name(0))
+
+    assert not source.exists()
+    unpack_archives(str(output))
+    assert os.listdir(output) == [writer.crop_name(0)]
+    assert read_crop(str(output / writer.crop_name(0))).shape == image.shape
+
+
+def test_unpack_keeps_members_inside_the_folder(tmp_path):
+    import zipfile
+
+    with zipfile.ZipFile(tmp_path / "crops.npz", "w") as archive:
+        archive.writestr("../../escaped.npy", encode_crop(crops(1)[0], "npy"))
+
+    assert unpack_archives(str(tmp_path)) == 1
+    assert os.listdir(tmp_path) == ["escaped.npy"]
+
+
+def test_unknown_format_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        CropWriter(str(tmp_path), "bmp")
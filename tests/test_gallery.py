@@ -0,0 +1,208 @@
+import pickle
+import sqlite3
+
+import numpy as np
+import pytest
+
+from gallery import (GalleryMatcher, GalleryStore, UNKNOWN_NAME, bump_gallery_generation,
+                     encode_encoding, read_gallery_header, write_gallery_file)
+
+TOLERANCE = 0.5
+
+
+def clustered_gallery(people=40, per_person=6, seed=0):
+    """Encodings spread around one centre per person, so probes match"""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(0.0, 0.15, (people, 128))
+    encodings, names = [], []
+    for _ in range(per_person):
+        for person in rng.permutation(people):
+            encodings.append(centres[person] + rng.normal(0.0, 0.02, 128))
+            names.append(f"person{person}")
+    return np.array(encodings), names
+
+
+def probes_for(encodings, count=200, noise=0.03, seed=1):
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(encodings), count)
+    return encodings[picks] + rng.normal(0.0, noise, (count, encodings.shape[1]))
+
+
+def brute_force(encodings, names, probes, tolerance=TOLERANCE):
+    """The original per-face compare_faces loop and dict vote"""
+    results = []
+    for probe in probes:
+        dist = [float(np.linalg.norm(known - probe)) for known in encodings]
+        counts = {}
+        for name, d in zip(names, dist):
+            if d <= tolerance:
+                counts[name] = counts.get(name, 0) + 1
+        if not counts:
+            results.append((UNKNOWN_NAME, min(dist), 0))
+            continue
+        winner = max(counts, key=counts.get)
+        best = min(d for name, d in zip(names, dist) if name == winner)
+        results.append((winner, best, counts[winner]))
+    return results
+
+
+def assert_same_matches(results, expected, distance_tolerance=1e-5):
+    assert [(name, votes) for name, _, votes in results] == [(name, votes) for name, _, votes in expected]
+    assert np.allclose([d for _, d, _ in results], [d for _, d, _ in expected], atol=distance_tolerance)
+
+
+def make_db(path, encodings, names, storage="float64"):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE faces (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                 "name TEXT NOT NULL, encoding BLOB NOT NULL)")
+    add_rows(conn, encodings, names, storage)
+    return conn
+
+
+def add_rows(conn, encodings, names, storage="float64"):
+    with conn:
+        conn.executemany("INSERT INTO faces (name, encoding) VALUES (?, ?)",
+                         [(name, encode_encoding(e, storage)) for e, name in zip(encodings, names)])
+
+
+def db_rows(conn):
+    rows = conn.execute("SELECT id, name, encoding FROM faces ORDER BY id").fetchall()
+    return ([row[0] for row in rows], [row[1] for row in rows],
+            np.array([np.frombuffer(row[2]) for row in rows]))
+
+
+def test_matcher_agrees_with_brute_force():
+    encodings, names = clustered_gallery()
+    probes = np.vstack([probes_for(encodings), np.random.default_rng(2).normal(0.0, 0.15, (20, 128))])
+
+    results = GalleryMatcher(encodings, names, TOLERANCE).match(probes)
+
+    expected = brute_force(encodings, names, probes)
+    assert any(votes == 0 for _, _, votes in expected)
+    assert_same_matches(results, expected)
+
+
+def test_matcher_breaks_ties_by_database_order():
+    encodings = np.zeros((4, 128))
+    encodings[:, 0] = [0.1, 0.2, -0.1, -0.2]
+    names = ["b", "a", "a", "b"]
+
+    results = GalleryMatcher(encodings, names, TOLERANCE).match(np.zeros((1, 128)))
+
+    assert results == [("b", pytest.approx(0.1), 2)]
+
+
+def test_empty_matcher():
+    matcher = GalleryMatcher([], [])
+    assert matcher.match(np.zeros((2, 128))) == [(UNKNOWN_NAME, None, 0)] * 2
+    assert matcher.match([]) == []
+
+
+def test_ivf_index_at_full_probe_is_exact():
+    encodings, names = clustered_gallery(people=60, per_person=10)
+    probes = probes_for(encodings)
+    exact = GalleryMatcher(encodings, names, TOLERANCE).match(probes)
+
+    matcher = GalleryMatcher(encodings, names, TOLERANCE).build_index(n_probe=10 ** 6)
+
+    assert matcher.index.n_probe == len(matcher.index.centroids)
+    assert_same_matches(matcher.match(probes), exact)
+
+
+def test_int8_matcher_agrees_with_float32():
+    encodings, names = clustered_gallery()
+    probes = probes_for(encodings, count=500)
+    exact = GalleryMatcher(encodings, names, TOLERANCE).match(probes)
+
+    matcher = GalleryMatcher(encodings, names, TOLERANCE, storage="int8")
+
+    assert matcher.matrix.dtype == np.int8
+    results = matcher.match(probes)
+    labels = np.mean([a[0] == b[0] for a, b in zip(results, exact)])
+    assert labels >= 0.99
+    assert max(abs(a[1] - b[1]) for a, b in zip(results, exact)) < 0.01
+
+
+@pytest.mark.parametrize("storage", ["float32", "int8"])
+def test_store_refresh_follows_inserts_and_deletes(tmp_path, storage):
+    encodings, names = clustered_gallery(people=10, per_person=3)
+    conn = make_db(tmp_path / "faces.db", encodings[:20], names[:20])
+    store = GalleryStore(str(tmp_path / "faces.db"), storage=storage)
+
+    assert store.refresh() == (20, 0)
+    assert store.refresh() is None
+
+    add_rows(conn, encodings[20:], names[20:])
+    assert store.refresh() == (10, 0)
+
+    with conn:
+        conn.execute("DELETE FROM faces WHERE id IN (2, 5, 29)")
+    assert store.refresh() == (0, 3)
+
+    add_rows(conn, encodings[:1], names[:1])
+    assert store.refresh() == (1, 0)
+
+    ids, db_names, db_encodings = db_rows(conn)
+    assert list(store.ids) == ids
+    assert store.names == db_names
+    probes = probes_for(db_encodings, count=50)
+    expected = brute_force(db_encodings, db_names, probes)
+    if storage == "float32":
+        assert_same_matches(store.matcher(TOLERANCE).match(probes), expected)
+    else:
+        assert np.abs(store.encodings - db_encodings).max() < 0.01
+    store.close()
+    conn.close()
+
+
+def test_store_reloads_rows_rewritten_in_place(tmp_path):
+    encodings, names = clustered_gallery(people=5, per_person=2)
+    conn = make_db(tmp_path / "faces.db", encodings, names)
+    store = GalleryStore(str(tmp_path / "faces.db"))
+    store.refresh()
+
+    with conn:
+        conn.executemany("UPDATE faces SET encoding = ? WHERE id = ?",
+                         [(encode_encoding(np.zeros(128)), row_id) for row_id in range(1, 11)])
+        bump_gallery_generation(conn)
+
+    assert store.refresh() == (10, 10)
+    assert not store.encodings.any()
+    store.close()
+    conn.close()
+
+
+@pytest.mark.parametrize("storage", ["float32", "int8"])
+def test_gallery_file_round_trip(tmp_path, storage):
+    encodings, names = clustered_gallery()
+    conn = make_db(tmp_path / "faces.db", encodings, names)
+    with conn:
+        conn.execute("DELETE FROM faces WHERE id = 7")
+    store = GalleryStore(str(tmp_path / "faces.db"), storage=storage)
+    store.refresh()
+    path = str(tmp_path / "faces.gallery")
+
+    header = write_gallery_file(path, store)
+
+    assert read_gallery_header(path)["storage"] == storage
+    assert (header["source_rows"], header["source_max_id"]) == (len(names) - 1, len(names))
+    probes = probes_for(encodings)
+    expected = store.matcher(TOLERANCE).match(probes)
+    mapped = GalleryMatcher.from_file(path, TOLERANCE)
+    assert mapped.matrix.dtype == (np.int8 if storage == "int8" else np.float32)
+    assert mapped.match(probes) == expected
+    assert pickle.loads(pickle.dumps(mapped)).match(probes) == expected
+
+    loaded = GalleryStore(str(tmp_path / "faces.db"), storage=storage)
+    assert loaded.load_snapshot(path)
+    assert list(loaded.ids) == list(store.ids)
+    assert loaded.names == store.names
+    assert loaded.matcher(TOLERANCE).match(probes) == expected
+    other = GalleryStore(str(tmp_path / "faces.db"), storage="int8" if storage == "float32" else "float32")
+    assert not other.load_snapshot(path)
+
+    add_rows(conn, encodings[:1], names[:1])
+    assert not GalleryStore(str(tmp_path / "faces.db"), storage=storage).load_snapshot(path)
+    for s in (store, loaded, other):
+        s.close()
+    conn.close()
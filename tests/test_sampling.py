@@ -0,0 +1,86 @@
+import cv2
+import numpy as np
+import pytest
+
+from sampling import iter_sampled_frames, sample_step
+
+
+class FakeCapture:
+    """A video of `length` frames, each filled with its own index"""
+
+    def __init__(self, length):
+        self.length = length
+        self.position = 0
+        self.seeks = 0
+
+    def set(self, prop, value):
+        assert prop == cv2.CAP_PROP_POS_FRAMES
+        self.position = int(value)
+        self.seeks += 1
+
+    def grab(self):
+        if self.position >= self.length:
+            return False
+        self.position += 1
+        return True
+
+    def read(self):
+        if self.position >= self.length:
+            return False, None
+        frame = np.full((2, 2, 3), self.position % 256, dtype=np.uint8)
+        self.position += 1
+        return True, frame
+
+
+def sequential_samples(length, step, start=0, end=None):
+    """Every frame read in turn, keeping those on the k * step grid"""
+    grid = set()
+    k = 0
+    while int(round(k * step)) < length:
+        grid.add(int(round(k * step)))
+        k += 1
+    end = length if end is None else min(end, length)
+    return [i for i in range(start, end) if i in grid]
+
+
+@pytest.mark.parametrize("step", [1, 3, 2.5, 7.3, 150])
+@pytest.mark.parametrize("seek_min_gap", [2, 120])
+def test_iter_sampled_frames_matches_sequential_reads(step, seek_min_gap):
+    cap = FakeCapture(500)
+
+    samples = list(iter_sampled_frames(cap, step, seek_min_gap=seek_min_gap))
+
+    assert [index for index, _ in samples] == sequential_samples(500, step)
+    assert all(frame[0, 0, 0] == index % 256 for index, frame in samples)
+
+
+@pytest.mark.parametrize("start, end", [(0, 100), (37, 260), (250, None), (499, 500)])
+def test_iter_sampled_frames_range(start, end):
+    step = 2.5
+    samples = list(iter_sampled_frames(FakeCapture(500), step, start, end))
+
+    assert [index for index, _ in samples] == sequential_samples(500, step, start, end)
+    assert all(frame[0, 0, 0] == index % 256 for index, frame in samples)
+
+
+def test_sample_step():
+    assert sample_step(interval_frames=0) == 1
+    assert sample_step(interval_frames=5) == 5
+    assert sample_step(interval_seconds=0.5, fps=25) == 12.5
+    assert sample_step(interval_seconds=0.001, fps=25) == 1.0
+
+
+@pytest.mark.parametrize("total, step, chunks", [(500, 1, 4), (500, 2.5, 7), (500, 7.3, 3),
+                                                 (10, 3, 8), (1, 1, 4)])
+def test_split_frames_ranges_cover_the_whole_video(total, step, chunks):
+    pytest.importorskip("face_recognition")
+    from extraction import split_frames
+
+    ranges = split_frames(total, step, chunks)
+
+    assert ranges[0][0] == 0 and ranges[-1][1] == total
+    assert all(end == next_start for (_, end), (next_start, _) in zip(ranges, ranges[1:]))
+    assert len(ranges) <= chunks
+    chunked = [index for start, end in ranges
+               for index, _ in iter_sampled_frames(FakeCapture(total), step, start, end)]
+    assert chunked == sequential_samples(total, step)